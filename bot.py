@@ -15,8 +15,12 @@ from config import (
     CHANNEL_ID, PORT
 )
 import config as cfg
-from database.database import create_indexes
+from database.database import (
+    create_indexes, banned_set, user_writes, user_index, stats_aggregator, share_analytics,
+    keyword_index, search_index
+)
 from web.api import set_bot_instance
+from helper_func import auto_delete_scheduler, broadcast_manager, group_reply_queue, discussion_registry
 import pyrogram.utils
 
 pyrogram.utils.MIN_CHAT_ID = -999999999999
@@ -74,6 +78,30 @@ class Bot(Client):
         except Exception as e:
             self.LOGGER(__name__).warning(f"Error creating indexes: {e}")
 
+        try:
+            await user_index.load()
+            self.LOGGER(__name__).info(f"User index loaded: {len(user_index)} users")
+        except Exception as e:
+            self.LOGGER(__name__).warning(f"Error loading user index: {e}")
+
+        try:
+            await keyword_index.load()
+            self.LOGGER(__name__).info(f"Keyword index loaded: {len(keyword_index)} keywords")
+        except Exception as e:
+            self.LOGGER(__name__).warning(f"Error loading keyword index: {e}")
+
+        try:
+            await search_index.load()
+            self.LOGGER(__name__).info(f"Search index loaded: {len(search_index)} shares")
+        except Exception as e:
+            self.LOGGER(__name__).warning(f"Error loading search index: {e}")
+
+        try:
+            await banned_set.load()
+            self.LOGGER(__name__).info(f"Banned user set loaded: {len(banned_set)} users")
+        except Exception as e:
+            self.LOGGER(__name__).warning(f"Error loading banned users: {e}")
+
         # ===== 先从数据库热加载配置，包含强制订阅频道 =====
         from web.api import _apply_runtime_config
         try:
@@ -129,6 +157,17 @@ class Bot(Client):
 
         self.set_parse_mode(ParseMode.HTML)
 
+        # ===== 后台任务 =====
+        auto_delete_scheduler.start(self)
+        group_reply_queue.start()
+        await discussion_registry.start(self)
+        await broadcast_manager.resume_all(self)
+        banned_set.start()
+        user_writes.start()
+        user_index.start()
+        stats_aggregator.start()
+        share_analytics.start()
+
         try:
             await self.set_bot_commands([
                 BotCommand("start", "启动"),
@@ -150,5 +189,14 @@ class Bot(Client):
             self.LOGGER(__name__).warning(f"Failed to load runtime config: {e}")
 
     async def stop(self, *args):
+        await auto_delete_scheduler.stop()
+        await group_reply_queue.stop()
+        await discussion_registry.stop()
+        await broadcast_manager.stop()
+        await banned_set.stop()
+        await user_index.stop()
+        await user_writes.stop()
+        await stats_aggregator.stop()
+        await share_analytics.stop()
         await super().stop()
         self.LOGGER(__name__).info("Bot stopped.")
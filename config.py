@@ -66,6 +66,43 @@ SHARE_CODE_LENGTH = int(os.environ.get("SHARE_CODE_LENGTH", "8"))
 RATE_LIMIT_MAX = int(os.environ.get("RATE_LIMIT_MAX", "10"))
 RATE_LIMIT_WINDOW = int(os.environ.get("RATE_LIMIT_WINDOW", "60"))
 
+# ============ 发送调度 ============
+DELIVERY_GLOBAL_RATE = float(os.environ.get("DELIVERY_GLOBAL_RATE", "25"))
+DELIVERY_CHAT_RATE = float(os.environ.get("DELIVERY_CHAT_RATE", "3"))
+DELIVERY_CHAT_BURST = int(os.environ.get("DELIVERY_CHAT_BURST", "5"))
+
+# ============ 消息缓存 ============
+MESSAGE_CACHE_SIZE = int(os.environ.get("MESSAGE_CACHE_SIZE", "5000"))
+MESSAGE_CACHE_TTL = int(os.environ.get("MESSAGE_CACHE_TTL", "3600"))
+MESSAGE_CACHE_NEGATIVE_TTL = int(os.environ.get("MESSAGE_CACHE_NEGATIVE_TTL", "60"))
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", "50000"))
+USER_CACHE_TTL = int(os.environ.get("USER_CACHE_TTL", "300"))
+USER_WRITE_INTERVAL = float(os.environ.get("USER_WRITE_INTERVAL", "2"))
+USER_WRITE_BATCH = int(os.environ.get("USER_WRITE_BATCH", "500"))
+USER_SYNC_INTERVAL = int(os.environ.get("USER_SYNC_INTERVAL", "60"))
+STATS_FLUSH_INTERVAL = float(os.environ.get("STATS_FLUSH_INTERVAL", "5"))
+
+# ============ 内联搜索 ============
+INLINE_PAGE_SIZE = int(os.environ.get("INLINE_PAGE_SIZE", "20"))
+INLINE_CACHE_SIZE = int(os.environ.get("INLINE_CACHE_SIZE", "2000"))
+INLINE_RENDER_CACHE_SIZE = int(os.environ.get("INLINE_RENDER_CACHE_SIZE", "1000"))
+INLINE_RENDER_TTL = int(os.environ.get("INLINE_RENDER_TTL", "600"))
+
+# ============ 强制订阅缓存 ============
+FORCE_SUB_MEMBER_TTL = int(os.environ.get("FORCE_SUB_MEMBER_TTL", "1800"))
+
+# ============ 封禁同步 ============
+BAN_SYNC_INTERVAL = int(os.environ.get("BAN_SYNC_INTERVAL", "30"))
+BAN_REPLY_INTERVAL = int(os.environ.get("BAN_REPLY_INTERVAL", "300"))
+
+# ============ 广播 ============
+BROADCAST_RATE = float(os.environ.get("BROADCAST_RATE", "20"))
+BROADCAST_CONCURRENCY = int(os.environ.get("BROADCAST_CONCURRENCY", "8"))
+BROADCAST_BATCH_SIZE = int(os.environ.get("BROADCAST_BATCH_SIZE", "100"))
+BROADCAST_PROGRESS_INTERVAL = int(os.environ.get("BROADCAST_PROGRESS_INTERVAL", "15"))
+BROADCAST_MAX_FAILURES = int(os.environ.get("BROADCAST_MAX_FAILURES", "3"))
+BROADCAST_FLUSH_SIZE = int(os.environ.get("BROADCAST_FLUSH_SIZE", "500"))
+
 # ============ 自定义按钮 ============
 CUSTOM_BUTTONS = os.environ.get("CUSTOM_BUTTONS", "")
 
@@ -109,6 +146,15 @@ ADMIN_HELP_TEXT = os.environ.get(
     "💡 <b>分享码：</b>用户发送分享码即可获取文件"
 )
 KEYWORD_BUTTON_TEXT = os.environ.get("KEYWORD_BUTTON_TEXT", "🔗 获取资源")
+# 句中匹配的关键词最短长度；更短的关键词（如自动生成的单字）只在整条消息完全相同时回复
+KEYWORD_MIN_MATCH_LENGTH = int(os.environ.get("KEYWORD_MIN_MATCH_LENGTH", "2"))
+# 同一群同一关键词的回复冷却；群回复独立预算，不占用私聊发送额度
+KEYWORD_REPLY_COOLDOWN = int(os.environ.get("KEYWORD_REPLY_COOLDOWN", "60"))
+KEYWORD_GROUP_RATE = float(os.environ.get("KEYWORD_GROUP_RATE", "0.5"))
+KEYWORD_GROUP_BURST = int(os.environ.get("KEYWORD_GROUP_BURST", "3"))
+KEYWORD_REPLY_RATE = float(os.environ.get("KEYWORD_REPLY_RATE", "5"))
+# 讨论组定期重新解析的间隔；未登记的群发来消息时按此间隔最多检查一次其关联频道
+DISCUSSION_REFRESH_INTERVAL = int(os.environ.get("DISCUSSION_REFRESH_INTERVAL", "3600"))
 
 # ============ 管理员 ============
 try:
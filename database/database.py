@@ -1,8 +1,24 @@
+import re
 import time
+import math
+import heapq
+import hashlib
+import asyncio
+import operator
 import logging
+import unicodedata
 import certifi
+from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_left, insort
+from collections import OrderedDict, defaultdict, deque
+from itertools import compress, groupby
 import motor.motor_asyncio
-from config import DB_URI, DB_NAME
+from pymongo import DeleteOne, UpdateMany, UpdateOne
+from config import (
+    DB_URI, DB_NAME, USER_CACHE_SIZE, USER_CACHE_TTL, USER_WRITE_INTERVAL, USER_WRITE_BATCH,
+    BAN_SYNC_INTERVAL, STATS_FLUSH_INTERVAL, USER_SYNC_INTERVAL
+)
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +36,74 @@ dbclient = motor.motor_asyncio.AsyncIOMotorClient(
 
 database = dbclient[DB_NAME]
 
+
+# ============ 后台任务 ============
+class BackgroundTask(ABC):
+    """后台循环的启停：start 创建单个任务，stop 取消并等待结束后执行 on_stop 收尾"""
+
+    def __init__(self):
+        self.task = None
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        await self.on_stop()
+
+    async def on_stop(self):
+        pass
+
+    @abstractmethod
+    async def _run(self):
+        ...
+
+
+_spawned = set()
+
+
+def spawn(coro):
+    """创建不等待结果的任务并保留引用，避免任务执行中途被垃圾回收"""
+    task = asyncio.create_task(coro)
+    _spawned.add(task)
+    task.add_done_callback(_spawned.discard)
+    return task
+
+
+class PeriodicFlusher(BackgroundTask):
+    """写缓冲的定时落库：每 interval 秒执行一次 tick（默认即 flush），停止时再 flush 一次"""
+
+    def __init__(self, interval: float):
+        super().__init__()
+        self.interval = interval
+
+    @abstractmethod
+    async def flush(self):
+        ...
+
+    async def tick(self):
+        await self.flush()
+
+    async def on_stop(self):
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"{type(self).__name__} flush error: {e}")
+
 # ============ 用户集合 ============
 user_data = database['users']
 
@@ -51,57 +135,380 @@ def new_user(id):
             'verified_at': 0,
             'channels': []
         },
-        'joined_at': time.time()
+        'joined_at': time.time(),
+        'inactive': False,
+        'fail_count': 0
     }
 
 
-async def present_user(user_id: int):
-    found = await user_data.find_one({'_id': user_id})
-    return bool(found)
-
+# ============ 用户写缓冲 ============
+class UserWriteBuffer(PeriodicFlusher):
+    """用户文档的写后缓冲：同一用户的多次 $set 合并，定时或积压达到 batch_size 时批量落库"""
+
+    def __init__(self, interval: float = USER_WRITE_INTERVAL, batch_size: int = USER_WRITE_BATCH):
+        super().__init__(interval)
+        self.batch_size = batch_size
+        self.pending = {}       # user_id -> {field: value}
+        self.oldest = None      # 最早一条未落库修改的时间
+        self.lock = asyncio.Lock()
+        self.flushing = False   # 积压触发的 flush 同时只保留一个
+        self.flushed = 0
+        self.last_flush_ms = 0
+        self.last_lag = 0
+
+    def set(self, user_id: int, fields: dict):
+        self.pending.setdefault(user_id, {}).update(fields)
+        if self.oldest is None:
+            self.oldest = time.monotonic()
+        if len(self.pending) >= self.batch_size and not self.flushing:
+            self.flushing = True
+            spawn(self._flush_backlog())
+
+    async def _flush_backlog(self):
+        try:
+            await self.flush()
+        finally:
+            self.flushing = False
+
+    def discard(self, user_id: int):
+        self.pending.pop(user_id, None)
+
+    async def flush(self):
+        # 先落库新注册用户，否则对应的 $set 会落空
+        await user_index.flush()
+        async with self.lock:
+            if not self.pending:
+                return
+            pending, oldest = self.pending, self.oldest
+            self.pending, self.oldest = {}, None
+            ops = [UpdateOne({'_id': user_id}, {'$set': fields}) for user_id, fields in pending.items()]
+            start = time.monotonic()
+            try:
+                await user_data.bulk_write(ops, ordered=False)
+                self.flushed += len(ops)
+            except Exception as e:
+                logger.error(f"User write flush failed ({len(ops)} users): {e}")
+                # 失败的修改放回缓冲，期间产生的新修改优先
+                for user_id, fields in pending.items():
+                    self.pending[user_id] = {**fields, **self.pending.get(user_id, {})}
+                self.oldest = min(oldest, self.oldest or oldest)
+                return
+            now = time.monotonic()
+            self.last_flush_ms = round((now - start) * 1000, 1)
+            self.last_lag = round(now - oldest, 2)
+
+    def stats(self):
+        return {
+            'pending': len(self.pending),
+            'lag_seconds': round(time.monotonic() - self.oldest, 2) if self.oldest else 0,
+            'last_flush_lag_seconds': self.last_lag,
+            'last_flush_ms': self.last_flush_ms,
+            'flushed': self.flushed
+        }
+
+
+user_writes = UserWriteBuffer()
+
+
+# ============ 用户状态缓存 ============
+USER_STATE_FIELDS = {'verify_status': 1, 'force_sub_status': 1}
+
+
+class UserStateCache:
+    """用户状态（是否存在 / 验证状态 / 强制订阅状态）的 LRU + TTL 缓存，不存在的用户短时负缓存"""
+
+    def __init__(self, max_size: int = USER_CACHE_SIZE, ttl: int = USER_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = min(ttl, 30)
+        self.entries = OrderedDict()  # user_id -> (expires_at, doc | None)
+        self.inflight = {}            # user_id -> Future
+        self.hits = 0
+        self.misses = 0
+
+    def _store(self, user_id: int, doc):
+        ttl = self.ttl if doc is not None else self.negative_ttl
+        self.entries[user_id] = (time.monotonic() + ttl, doc)
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    async def get(self, user_id: int):
+        """返回缓存的用户文档，用户不存在返回 None"""
+        item = self.entries.get(user_id)
+        if item is not None and item[0] >= time.monotonic():
+            self.entries.move_to_end(user_id)
+            self.hits += 1
+            return item[1]
+        if user_id in self.inflight:
+            return await self.inflight[user_id]
+
+        self.misses += 1
+        future = asyncio.get_event_loop().create_future()
+        self.inflight[user_id] = future
+        try:
+            doc = await user_data.find_one({'_id': user_id}, USER_STATE_FIELDS)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            # 查询失败时合并等待者同样收到异常，而不是被当作「用户不存在」
+            future.set_exception(e)
+            future.exception()  # 没有等待者时不触发 "exception was never retrieved"
+            raise
+        finally:
+            self.inflight.pop(user_id, None)
+        if doc is not None and user_id in user_writes.pending:
+            doc.update(user_writes.pending[user_id])
+        self._store(user_id, doc)
+        future.set_result(doc)
+        return doc
+
+    def set(self, user_id: int, doc: dict):
+        self._store(user_id, {key: doc[key] for key in ('_id', *USER_STATE_FIELDS) if key in doc})
+
+    def update(self, user_id: int, fields: dict):
+        """写穿：已缓存的用户同步修改字段，未缓存的不做处理"""
+        item = self.entries.get(user_id)
+        if item is not None and item[1] is not None:
+            item[1].update(fields)
+
+    def invalidate(self, user_id: int):
+        self.entries.pop(user_id, None)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0
+        }
+
+
+user_state = UserStateCache()
+
+
+# ============ 已注册用户索引 ============
+class UserIndex(PeriodicFlusher):
+    """已注册用户 id 的紧凑索引：有序 array('q') + 新增 / 删除集合，新用户批量 upsert，按版本号跨实例同步"""
+
+    def __init__(self, interval: float = USER_WRITE_INTERVAL, batch_size: int = USER_WRITE_BATCH,
+                 merge_size: int = 10000, sync_interval: int = USER_SYNC_INTERVAL):
+        super().__init__(interval)
+        self.batch_size = batch_size
+        self.merge_size = merge_size
+        self.sync_interval = sync_interval
+        self.version = 0
+        self.last_sync = 0.0
+        self.ids = array('q')
+        self.added = set()
+        self.removed = set()
+        self.queue = []         # 待 upsert 的新用户
+        self.returning = set()  # 再次 /start 的老用户，flush 时恢复为活跃
+        self.loaded = False
+        self.lock = asyncio.Lock()
+
+    def _in_ids(self, user_id: int):
+        i = bisect_left(self.ids, user_id)
+        return i < len(self.ids) and self.ids[i] == user_id
+
+    def __contains__(self, user_id: int):
+        if user_id in self.added:
+            return True
+        if user_id in self.removed:
+            return False
+        return self._in_ids(user_id)
+
+    def __len__(self):
+        return len(self.ids) + len(self.added) - len(self.removed)
+
+    def _merge(self):
+        """把新增 / 删除集合合并进有序数组"""
+        merged = heapq.merge(self.ids, sorted(self.added))
+        removed = self.removed
+        self.ids = array('q', (uid for uid in merged if uid not in removed))
+        self.added = set()
+        self.removed = set()
+
+    async def load(self):
+        version = await get_version('users')
+        ids = array('q')
+        async for user_id in iter_user_ids(batch_size=5000):
+            ids.append(user_id)
+        self.ids = ids
+        self.removed = {uid for uid in self.removed if self._in_ids(uid)}
+        self.added = {uid for uid in self.added if not self._in_ids(uid)}
+        self.version = version
+        self.last_sync = time.monotonic()
+        self.loaded = True
+
+    async def bump(self):
+        """本实例修改了用户集合：递增版本号；中间没有其它实例修改时同步本地版本，避免自己触发重载"""
+        version = await bump_version('users')
+        if version == self.version + 1:
+            self.version = version
+
+    async def sync(self):
+        if not self.loaded or time.monotonic() - self.last_sync < self.sync_interval:
+            return
+        self.last_sync = time.monotonic()
+        if await get_version('users') != self.version:
+            await self.load()
+            logger.info(f"User index reloaded: {len(self)} users")
+
+    async def tick(self):
+        await self.flush()
+        await self.sync()
+
+    def register(self, user_id: int) -> bool:
+        """登记用户，返回是否为新用户；数据库写入由后台批量完成"""
+        if user_id in self:
+            self.returning.add(user_id)
+            if len(self.returning) >= self.batch_size:
+                spawn(self.flush())
+            return False
+        self.removed.discard(user_id)
+        self.added.add(user_id)
+        self.queue.append(user_id)
+        if self.loaded:
+            user_state.set(user_id, new_user(user_id))
+        if len(self.added) >= self.merge_size:
+            self._merge()
+        if len(self.queue) >= self.batch_size:
+            spawn(self.flush())
+        return True
 
-async def add_user(user_id: int):
-    user = new_user(user_id)
-    await user_data.insert_one(user)
+    def discard(self, user_id: int):
+        self.added.discard(user_id)
+        self.removed.add(user_id)
+        if len(self.removed) >= self.merge_size:
+            self._merge()
+
+    async def flush(self):
+        async with self.lock:
+            if not self.queue and not self.returning:
+                return
+            queue, self.queue = self.queue, []
+            returning, self.returning = self.returning, set()
+            ops = [UpdateOne({'_id': uid}, {'$setOnInsert': new_user(uid)}, upsert=True) for uid in queue]
+            if returning:
+                # 只命中曾经失败过的用户，绝大多数 /start 不产生实际写入
+                ops.append(UpdateMany(
+                    {'_id': {'$in': list(returning)}, 'fail_count': {'$gt': 0}},
+                    {'$set': {'fail_count': 0, 'inactive': False}}
+                ))
+            try:
+                result = await user_data.bulk_write(ops, ordered=False)
+            except Exception as e:
+                logger.error(f"User registration flush failed ({len(ops)} ops): {e}")
+                self.queue = queue + self.queue
+                self.returning |= returning
+                return
+        if result.upserted_count:
+            await self.bump()
+
+    def stats(self):
+        return {
+            'size': len(self),
+            'memory_kb': round(self.ids.itemsize * len(self.ids) / 1024, 1),
+            'queued': len(self.queue) + len(self.returning),
+            'loaded': self.loaded
+        }
+
+
+user_index = UserIndex()
+
+
+def register_user(user_id: int) -> bool:
+    return user_index.register(user_id)
 
 
 async def db_verify_status(user_id):
-    user = await user_data.find_one({'_id': user_id})
+    user = await user_state.get(user_id)
     if user:
-        return user.get('verify_status', default_verify)
-    return default_verify
+        return dict(user.get('verify_status', default_verify))
+    return dict(default_verify)
 
 
 async def db_update_verify_status(user_id, verify):
-    await user_data.update_one({'_id': user_id}, {'$set': {'verify_status': verify}})
+    user_writes.set(user_id, {'verify_status': dict(verify)})
+    user_state.update(user_id, {'verify_status': dict(verify)})
 
 
 async def get_force_sub_status(user_id: int):
-    user = await user_data.find_one({'_id': user_id})
+    user = await user_state.get(user_id)
     if user:
-        return user.get('force_sub_status', default_force_sub)
-    return default_force_sub
+        return dict(user.get('force_sub_status', default_force_sub))
+    return dict(default_force_sub)
 
 
 async def update_force_sub_status(user_id: int, status: dict):
-    await user_data.update_one(
-        {'_id': user_id},
-        {'$set': {'force_sub_status': status}}
-    )
+    user_writes.set(user_id, {'force_sub_status': dict(status)})
+    user_state.update(user_id, {'force_sub_status': dict(status)})
 
 
-async def full_userbase():
-    user_docs = user_data.find()
-    user_ids = [doc['_id'] async for doc in user_docs]
-    return user_ids
+async def iter_user_ids(after_id=None, batch_size: int = 1000, active_only: bool = False):
+    """按 _id 升序流式遍历用户 id，只投影 _id，内存占用与用户总数无关"""
+    query = {'_id': {'$gt': after_id}} if after_id is not None else {}
+    if active_only:
+        query['inactive'] = False
+    cursor = user_data.find(query, {'_id': 1}).sort('_id', 1).batch_size(batch_size)
+    async for doc in cursor:
+        yield doc['_id']
 
 
-async def del_user(user_id: int):
-    await user_data.delete_one({'_id': user_id})
+async def get_user_id_batch(after_id=None, limit: int = 100, active_only: bool = False):
+    """键集分页：取 _id 大于 after_id 的下一批用户 id。
+    每批一次独立查询，不持有游标，长时间暂停或 FloodWait 后也不会遇到 CursorNotFound"""
+    query = {'_id': {'$gt': after_id}} if after_id is not None else {}
+    if active_only:
+        query['inactive'] = False
+    cursor = user_data.find(query, {'_id': 1}).sort('_id', 1).limit(limit)
+    return [doc['_id'] async for doc in cursor]
 
 
-async def get_user_count():
-    return await user_data.count_documents({})
+async def get_user_ids_page(page: int = 1, per_page: int = 20):
+    skip = (page - 1) * per_page
+    cursor = user_data.find({}, {'_id': 1}).sort('_id', 1).skip(skip).limit(per_page)
+    return [doc['_id'] async for doc in cursor]
+
+
+async def del_user(user_id: int):
+    await user_data.delete_one({'_id': user_id})
+    user_index.discard(user_id)
+    user_writes.discard(user_id)
+    user_state.invalidate(user_id)
+    await user_index.bump()
+
+
+async def get_user_count(active_only: bool = False):
+    return await user_data.count_documents({'inactive': False} if active_only else {})
+
+
+async def apply_delivery_results(removed: list, failed: list, recovered: list, max_failures: int):
+    """一次 bulk_write 写回一批发送结果：
+    removed 删除用户；failed（仅永久性错误）累加失败次数，达到 max_failures 标记 inactive；
+    recovered 清零失败次数"""
+    ops = [DeleteOne({'_id': user_id}) for user_id in removed]
+    for user_id in removed:
+        user_index.discard(user_id)
+        user_writes.discard(user_id)
+        user_state.invalidate(user_id)
+    for user_id in failed:
+        ops.append(UpdateOne({'_id': user_id}, [
+            {'$set': {'fail_count': {'$add': [{'$ifNull': ['$fail_count', 0]}, 1]}}},
+            {'$set': {'inactive': {'$gte': ['$fail_count', max_failures]}}}
+        ]))
+    if recovered:
+        ops.append(UpdateMany(
+            {'_id': {'$in': recovered}, 'fail_count': {'$gt': 0}},
+            {'$set': {'fail_count': 0, 'inactive': False}}
+        ))
+    if ops:
+        await user_data.bulk_write(ops, ordered=False)
+    if removed:
+        await user_index.bump()
 
 
 async def get_recent_users(days=7):
@@ -114,14 +521,536 @@ async def get_recent_users(days=7):
 shares_collection = database['shares']
 
 
+class KeywordIndex:
+    """关键词 → 分享码倒排索引（按 created_at 倒序），启动时全量构建，增删改同步维护"""
+
+    def __init__(self):
+        self.postings = {}  # keyword -> [(-created_at, code)]
+        self.shares = {}    # code -> (created_at, keywords)
+        self.loaded = False
+        self.loading = False
+        self.version = 0    # 每次变更 +1，供依赖索引的结构判断是否需要更新
+        self.observers = [] # 关键词增删通知：keyword_added / keyword_removed / keywords_reloaded
+
+    def __len__(self):
+        return len(self.postings)
+
+    def __contains__(self, keyword: str):
+        return keyword in self.postings
+
+    def _remove(self, code: str):
+        old = self.shares.pop(code, None)
+        if not old:
+            return
+        created_at, keywords = old
+        for keyword in keywords:
+            entries = self.postings.get(keyword)
+            if not entries:
+                continue
+            try:
+                entries.remove((-created_at, code))
+            except ValueError:
+                pass
+            if not entries:
+                del self.postings[keyword]
+                for observer in self.observers:
+                    observer.keyword_removed(keyword)
+
+    def set(self, code: str, keywords, created_at: float = None):
+        if created_at is None:
+            created_at = self.shares[code][0] if code in self.shares else time.time()
+        self._remove(code)
+        keywords = tuple(dict.fromkeys(k for k in (keywords or []) if k))
+        if keywords:
+            self.shares[code] = (created_at, keywords)
+            for keyword in keywords:
+                if keyword not in self.postings:
+                    self.postings[keyword] = []
+                    if not self.loading:
+                        for observer in self.observers:
+                            observer.keyword_added(keyword)
+                insort(self.postings[keyword], (-created_at, code))
+        self.version += 1
+
+    def remove(self, code: str):
+        if code in self.shares:
+            self._remove(code)
+            self.version += 1
+
+    def lookup(self, keyword: str, limit: int = 6):
+        return [code for _, code in self.postings.get(keyword, ())[:limit]]
+
+    def keywords(self):
+        return self.postings.keys()
+
+    async def load(self):
+        """全量重建；加载期间逐条新增不单独通知，结束后（包括中途失败）统一通知一次，
+        加载失败时观察者也与已有内容保持一致，之后的增删照常逐条通知"""
+        self.loaded = False
+        self.loading = True
+        self.postings = {}
+        self.shares = {}
+        try:
+            cursor = shares_collection.find({'keywords.0': {'$exists': True}}, {'keywords': 1, 'created_at': 1})
+            async for doc in cursor:
+                self.set(doc['_id'], doc.get('keywords', []), doc.get('created_at', 0))
+            self.loaded = True
+        finally:
+            self.loading = False
+            for observer in self.observers:
+                observer.keywords_reloaded(list(self.postings))
+
+
+keyword_index = KeywordIndex()
+
+
+# ============ 分享搜索索引 ============
+_CJK_CHARS = "぀-ヿ㐀-䶿一-鿿豈-﫿가-힯"
+_SEARCH_TOKEN_RE = re.compile(f"([{_CJK_CHARS}]+)|([^\\W_{_CJK_CHARS}]+)")
+_CJK_RE = re.compile(f"[{_CJK_CHARS}]")
+# 单词只展开长度 1~SEARCH_PREFIX_MAX 的前缀；更长的查询词在有序词表里二分查找，展开为至多 SEARCH_WORD_EXPAND 个完整单词
+SEARCH_PREFIX_MAX = 6
+SEARCH_WORD_EXPAND = 64
+# 分享码只作为完整词项建索引（输入完整分享码才命中），不参与前缀匹配
+SEARCH_FIELD_WEIGHTS = (('title', 3), ('keywords', 2), ('group_text', 1))
+SEARCH_CODE_WEIGHT = 4
+# 短词项（1~2 个字母的前缀、中日韩单字）的倒排表按 字段权重、创建时间 倒序只保留前 SEARCH_SHORT_CANDIDATES 个；
+# 查询里同时有更长的词项时，从长词项的倒排表出发，短词项只按各分享自己的词项过滤
+SEARCH_SHORT_TERM = 2
+SEARCH_SHORT_CANDIDATES = 2000
+SEARCH_POPULARITY_WEIGHT = 0.5
+SEARCH_PROJECTION = {
+    'title': 1, 'group_text': 1, 'keywords': 1, 'access_count': 1, 'created_at': 1, 'updated_at': 1
+}
+
+
+def _search_runs(text: str):
+    """归一化（NFKC + 小写）后切分为 (是否中日韩, 片段)"""
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    for cjk, word in _SEARCH_TOKEN_RE.findall(text):
+        yield (True, cjk) if cjk else (False, word)
+
+
+def search_index_terms(text: str):
+    """建索引用的词项：中日韩片段取单字 + 二元组，其它单词取短前缀 + 完整单词（支持边输入边搜）"""
+    terms = set()
+    for cjk, run in _search_runs(text):
+        if cjk:
+            terms.update(run)
+            terms.update(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            terms.update(run[:i] for i in range(1, min(len(run), SEARCH_PREFIX_MAX) + 1))
+            terms.add(run)
+    return terms
+
+
+def search_exact_terms(text: str):
+    """只取完整单词，不展开前缀（用于分享码）"""
+    return {run for _, run in _search_runs(text)}
+
+
+def search_query_terms(query: str):
+    """查询词项：中日韩片段取二元组（单字片段取单字），其它单词按前缀匹配"""
+    terms = []
+    for cjk, run in _search_runs(query):
+        if cjk and len(run) > 1:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            terms.append(run)
+    return list(dict.fromkeys(terms))
+
+
+def search_dependency_terms(query: str):
+    """查询结果依赖的索引词项：长于 SEARCH_PREFIX_MAX 的词项没有建索引，额外记录它展开用的前缀"""
+    return frozenset(key for term in search_query_terms(query) for key in (term, term[:SEARCH_PREFIX_MAX]))
+
+
+def is_short_term(term: str) -> bool:
+    return len(term) == 1 if _CJK_RE.match(term) else len(term) <= SEARCH_SHORT_TERM
+
+
+# 倒排表的每一项编码为 id << 3 | 字段权重；只有一项时直接存 int，否则存按 id 有序的 array('I')
+def _posting_add(table: dict, term: str, value: int):
+    current = table.get(term)
+    if current is None:
+        table[term] = value
+    elif isinstance(current, int):
+        table[term] = array('I', sorted((current, value)))
+    else:
+        insort(current, value)
+
+
+def _posting_remove(table: dict, term: str, doc_id: int):
+    current = table.get(term)
+    if current is None:
+        return
+    if isinstance(current, int):
+        if current >> 3 == doc_id:
+            del table[term]
+        return
+    i = bisect_left(current, doc_id << 3)
+    if i < len(current) and current[i] >> 3 == doc_id:
+        del current[i]
+        if len(current) == 1:
+            table[term] = current[0]
+
+
+def _posting_weight(entries, doc_id: int) -> int:
+    if isinstance(entries, int):
+        return entries & 7 if entries >> 3 == doc_id else 0
+    i = bisect_left(entries, doc_id << 3)
+    if i < len(entries) and entries[i] >> 3 == doc_id:
+        return entries[i] & 7
+    return 0
+
+
+def _posting_items(entries):
+    return (entries,) if isinstance(entries, int) else entries
+
+
+class PartialScores(dict):
+    """只保留了部分候选的匹配结果，不能作为更长查询的候选超集"""
+    __slots__ = ()
+
+
+class ShareSearchIndex:
+    """分享搜索的内存倒排索引：分享码映射为整数 id，倒排表存为紧凑数组，按字段权重 + log(访问量) 排序"""
+
+    def __init__(self):
+        self._reset()
+        self.loaded = False
+        self.loading = False  # 全量加载时短倒排表先不排序，加载完再统一排序截断
+        self.version = 0      # 增删改 +1（访问量变化不计）
+        self.changes = deque(maxlen=1024)  # (version, 受影响的词项)，供查询缓存按词项判断是否失效
+
+    def _reset(self):
+        self.postings = {}      # term -> posting
+        self.short = {}         # 短词项 -> array('I')，按 字段权重、创建时间 倒序，有长度上限
+        self.truncated = set()  # 曾被截断过的短词项，它们的倒排表不再完整
+        self.exact = {}         # 分享码词项 -> posting
+        self.words = []         # 长于 SEARCH_PREFIX_MAX 的完整单词，有序
+        self.new_words = set()  # 尚未合并进 words 的新单词
+        self.ids = {}           # code -> id
+        self.codes = []         # id -> code，已删除为 None
+        self.terms = []         # id -> (长词项, 短词项, 短词项权重, 分享码词项)，用于删除和短词项过滤
+        self.free = []          # 可复用的 id
+        self.popularity = array('q')
+        self.boost = array('d')    # 热度加分，访问量变化时更新，避免查询时逐条计算
+        self.created = array('d')  # 同分时新的在前
+        self.updated = array('d')  # 供渲染结果缓存判断是否过期
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _changed(self, terms):
+        self.version += 1
+        self.changes.append((self.version, frozenset(terms)))
+
+    def changed_since(self, version: int, terms) -> bool:
+        """version 之后的修改是否涉及 terms 中的任一词项；变更记录已不完整时按已变化处理"""
+        if version == self.version:
+            return False
+        if not self.changes or self.changes[0][0] > version + 1:
+            return True
+        for changed_version, changed in reversed(self.changes):
+            if changed_version <= version:
+                break
+            if not changed.isdisjoint(terms):
+                return True
+        return False
+
+    def _allocate(self, code: str) -> int:
+        if self.free:
+            doc_id = self.free.pop()
+            self.codes[doc_id] = code
+        else:
+            doc_id = len(self.codes)
+            self.codes.append(code)
+            self.terms.append(None)
+            for values in (self.popularity, self.boost, self.created, self.updated):
+                values.append(0)
+        self.ids[code] = doc_id
+        return doc_id
+
+    def _short_key(self, value: int):
+        return -(value & 7), -self.created[value >> 3]
+
+    def _short_add(self, term: str, value: int):
+        entries = self.short.get(term)
+        if entries is None:
+            self.short[term] = array('I', (value,))
+            return
+        if self.loading:
+            entries.append(value)
+            return
+        if len(entries) >= SEARCH_SHORT_CANDIDATES and self._short_key(value) >= self._short_key(entries[-1]):
+            self.truncated.add(term)
+            return
+        insort(entries, value, key=self._short_key)
+        if len(entries) > SEARCH_SHORT_CANDIDATES:
+            del entries[-1]
+            self.truncated.add(term)
+
+    def _short_remove(self, term: str, doc_id: int):
+        entries = self.short.get(term)
+        if entries is None:
+            return
+        for i, value in enumerate(entries):
+            if value >> 3 == doc_id:
+                del entries[i]
+                break
+        if not entries:
+            del self.short[term]
+
+    def _unlink(self, doc_id: int):
+        """从倒排表中摘除，返回摘除的词项"""
+        terms, short_terms, _, exact = self.terms[doc_id] or ((), (), b'', ())
+        for term in terms:
+            _posting_remove(self.postings, term, doc_id)
+        for term in short_terms:
+            self._short_remove(term, doc_id)
+        for term in exact:
+            _posting_remove(self.exact, term, doc_id)
+        self.terms[doc_id] = None
+        return (*terms, *short_terms, *exact)
+
+    def set(self, share: dict):
+        code = share['_id']
+        doc_id = self.ids.get(code)
+        old_terms = self._unlink(doc_id) if doc_id is not None else ()
+        if doc_id is None:
+            doc_id = self._allocate(code)
+        weights = {}
+        for field, weight in SEARCH_FIELD_WEIGHTS:
+            value = share.get(field)
+            if isinstance(value, (list, tuple)):
+                value = ' '.join(value)
+            for term in search_index_terms(value):
+                if weights.get(term, 0) < weight:
+                    weights[term] = weight
+        exact = tuple(search_exact_terms(code))
+        self.popularity[doc_id] = share.get('access_count', 0) or 0
+        self.boost[doc_id] = SEARCH_POPULARITY_WEIGHT * math.log1p(self.popularity[doc_id])
+        self.created[doc_id] = share.get('created_at', 0) or 0
+        self.updated[doc_id] = share.get('updated_at', self.created[doc_id]) or 0
+        terms, short_terms = [], []
+        for term, weight in weights.items():
+            value = doc_id << 3 | weight
+            if is_short_term(term):
+                short_terms.append(term)
+                self._short_add(term, value)
+                continue
+            terms.append(term)
+            if len(term) > SEARCH_PREFIX_MAX and term not in self.postings:
+                self.new_words.add(term)
+            _posting_add(self.postings, term, value)
+        for term in exact:
+            _posting_add(self.exact, term, doc_id << 3 | SEARCH_CODE_WEIGHT)
+        short_weights = bytes(weights[term] for term in short_terms)
+        self.terms[doc_id] = (tuple(terms), tuple(short_terms), short_weights, exact)
+        if not self.loading:
+            self._changed((*old_terms, *weights, *exact))
+
+    def touch(self, code: str, updated_at: float):
+        """非检索字段变化（如文件列表）时只更新时间戳"""
+        doc_id = self.ids.get(code)
+        if doc_id is not None:
+            self.updated[doc_id] = updated_at
+
+    def has_exact(self, terms) -> bool:
+        """是否有词项命中分享码（只做完整匹配，不能从前缀查询的结果里筛选）"""
+        return any(term in self.exact for term in terms)
+
+    def updated_at(self, code: str):
+        doc_id = self.ids.get(code)
+        return self.updated[doc_id] if doc_id is not None else None
+
+    def remove(self, code: str):
+        doc_id = self.ids.pop(code, None)
+        if doc_id is None:
+            return
+        terms = self._unlink(doc_id)
+        self.codes[doc_id] = None
+        self.free.append(doc_id)
+        self._changed(terms)
+
+    def bump(self, code: str, count: int = 1):
+        doc_id = self.ids.get(code)
+        if doc_id is not None:
+            self.popularity[doc_id] += count
+            self.boost[doc_id] = SEARCH_POPULARITY_WEIGHT * math.log1p(self.popularity[doc_id])
+
+    def _merge_words(self):
+        merged = heapq.merge(self.words, sorted(self.new_words))
+        postings = self.postings
+        self.words = [word for word, _ in groupby(merged) if word in postings]
+        self.new_words = set()
+
+    def _expand(self, term: str):
+        """长查询词：词表中以它开头的完整单词（至多 SEARCH_WORD_EXPAND 个）的倒排表"""
+        if len(self.new_words) > 1000:
+            self._merge_words()
+        words = self.words
+        found = []
+        i = bisect_left(words, term)
+        while i < len(words) and len(found) < SEARCH_WORD_EXPAND and words[i].startswith(term):
+            found.append(words[i])
+            i += 1
+        found.extend(word for word in self.new_words if word.startswith(term))
+        postings = self.postings
+        return [postings[word] for word in dict.fromkeys(found[:SEARCH_WORD_EXPAND]) if word in postings]
+
+    def _source(self, term: str):
+        """查询词命中的倒排表：长词项返回按 id 有序的倒排表列表，短词项返回 {id: 权重}"""
+        exact = self.exact.get(term)
+        if is_short_term(term):
+            source = {value >> 3: value & 7 for value in self.short.get(term, ())}
+            if exact is not None:
+                for value in _posting_items(exact):
+                    source[value >> 3] = value & 7
+            return source
+        if len(term) > SEARCH_PREFIX_MAX:
+            source = self._expand(term)
+        else:
+            source = [self.postings[term]] if term in self.postings else []
+        if exact is not None:
+            source.append(exact)
+        return source
+
+    @staticmethod
+    def _source_size(source) -> int:
+        if isinstance(source, dict):
+            return len(source)
+        return sum(1 if isinstance(entries, int) else len(entries) for entries in source)
+
+    def _short_weight(self, term: str, doc_id: int) -> int:
+        """短词项在某个分享中的权重（不受短倒排表截断影响）"""
+        _, short_terms, short_weights, _ = self.terms[doc_id]
+        weight = short_weights[short_terms.index(term)] if term in short_terms else 0
+        exact = self.exact.get(term)
+        if exact is not None:
+            weight = max(weight, _posting_weight(exact, doc_id))
+        return weight
+
+    @staticmethod
+    def _source_weight(source, doc_id: int) -> int:
+        if isinstance(source, dict):
+            return source.get(doc_id, 0)
+        return max((_posting_weight(entries, doc_id) for entries in source), default=0)
+
+    def match(self, query: str, within=None) -> dict:
+        """返回 {id: 相关度}；所有（参与筛选的）查询词项都需命中。
+        within 为已知的候选超集（如前缀查询的结果），给出时从它开始过滤而不是从倒排表开始。
+        有长词项时短词项只用来过滤；只有短词项时结果来自截断的倒排表，可能不完整，返回 PartialScores"""
+        terms = search_query_terms(query)
+        if not terms:
+            return {}
+        long_terms = [term for term in terms if not is_short_term(term)]
+        sources = sorted((self._source(term) for term in (long_terms or terms)), key=self._source_size)
+        partial = not long_terms and not self.truncated.isdisjoint(terms)
+        first = sources[0]
+        if within is not None and len(within) < self._source_size(first):
+            scores = dict.fromkeys(within, 0)
+        else:
+            sources = sources[1:]
+            if isinstance(first, dict):
+                scores = dict(first)
+            else:
+                scores = {}
+                for entries in first:
+                    for value in _posting_items(entries):
+                        doc_id, weight = value >> 3, value & 7
+                        if scores.get(doc_id, 0) < weight:
+                            scores[doc_id] = weight
+        for source in sources:
+            if not scores:
+                break
+            matched = {}
+            for doc_id, score in scores.items():
+                weight = self._source_weight(source, doc_id)
+                if weight:
+                    matched[doc_id] = score + weight
+            scores = matched
+        if long_terms:
+            for term in terms:
+                if not scores:
+                    break
+                if is_short_term(term):
+                    matched = {}
+                    for doc_id, score in scores.items():
+                        weight = self._short_weight(term, doc_id)
+                        if weight:
+                            matched[doc_id] = score + weight
+                    scores = matched
+        return PartialScores(scores) if partial else scores
+
+    def rank(self, scores: dict, limit: int):
+        """取前 limit 个分享码；总分和阈值筛选都走 C 层的 map / compress，只对入围的少量分享排序"""
+        if not scores or limit <= 0:
+            return []
+        boost = self.boost
+        created = self.created
+        ids = list(scores)
+        if len(ids) > limit:
+            totals = list(map(operator.add, scores.values(), map(boost.__getitem__, ids)))
+            threshold = heapq.nlargest(limit, totals)[-1]
+            ids = list(compress(ids, map(threshold.__le__, totals)))
+        ids.sort(key=lambda i: (scores[i] + boost[i], created[i]), reverse=True)
+        codes = self.codes
+        return [codes[i] for i in ids[:limit]]
+
+    def search(self, query: str, limit: int = 10):
+        return self.rank(self.match(query), limit)
+
+    def _finish_loading(self):
+        for term, entries in self.short.items():
+            if len(entries) > SEARCH_SHORT_CANDIDATES:
+                self.truncated.add(term)
+            self.short[term] = array('I', sorted(entries, key=self._short_key)[:SEARCH_SHORT_CANDIDATES])
+        self._merge_words()
+        self.loading = False
+        # 全量重建后所有缓存都视为失效
+        self.version += 1
+        self.changes.clear()
+
+    async def load(self):
+        self.loaded = False
+        self._reset()
+        self.loading = True
+        try:
+            cursor = shares_collection.find({}, SEARCH_PROJECTION)
+            async for doc in cursor:
+                self.set(doc)
+        finally:
+            self._finish_loading()
+        self.loaded = True
+
+
+search_index = ShareSearchIndex()
+
+
+# 分享变更监听：listener(code, updates)，修改时 updates 为本次 $set 的字段，删除时为 None
+share_listeners = []
+
+
+def _notify_share_changed(share_code: str, updates=None):
+    for listener in share_listeners:
+        try:
+            listener(share_code, updates)
+        except Exception as e:
+            logger.error(f"Share listener failed for {share_code}: {e}")
+
+
 async def create_share(share_code: str, owner_id: int, message_ids: list,
-                       title: str = "", protect_content: bool = False, group_text: str = "", keywords=None):
+                       title: str = "", protect_content: bool = False, group_text: str = "", keywords=None,
+                       delivery_plan=None):
     if keywords is None:
         keywords = []
     share = {
         '_id': share_code,
         'owner_id': owner_id,
         'message_ids': message_ids,
+        'delivery_plan': delivery_plan or [],
         'title': title,
         'group_text': group_text,
         'keywords': keywords,
@@ -131,6 +1060,8 @@ async def create_share(share_code: str, owner_id: int, message_ids: list,
         'updated_at': time.time()
     }
     await shares_collection.insert_one(share)
+    keyword_index.set(share_code, keywords, share['created_at'])
+    search_index.set(share)
     return share
 
 
@@ -141,6 +1072,25 @@ async def get_share(share_code: str):
 async def find_share_by_message_id(message_id: int):
     return await shares_collection.find_one({'message_ids': message_id})
 
+async def update_plan_item(item: dict):
+    """频道消息被编辑后，替换所有引用它的分享中对应的发送计划项，返回受影响的分享码"""
+    message_id = item['id']
+    cursor = shares_collection.find({'message_ids': message_id, 'delivery_plan.id': message_id}, {'_id': 1})
+    codes = [doc['_id'] async for doc in cursor]
+    if not codes:
+        return codes
+    now = time.time()
+    await shares_collection.update_many(
+        {'_id': {'$in': codes}},
+        {'$set': {'delivery_plan.$[item]': item, 'updated_at': now}},
+        array_filters=[{'item.id': message_id}]
+    )
+    for code in codes:
+        search_index.touch(code, now)
+        # 预取的分页里带着旧的说明文字和按钮，需要丢弃
+        _notify_share_changed(code)
+    return codes
+
 async def find_share_by_group_text(group_text: str, owner_id: int = None):
     query = {'group_text': group_text}
     if owner_id is not None:
@@ -152,16 +1102,175 @@ async def find_share_by_keyword(keyword: str):
     docs = [doc async for doc in cursor]
     return docs[0] if docs else None
 
-async def find_shares_by_keyword(keyword: str, limit: int = 6):
-    cursor = shares_collection.find({'keywords': keyword}).sort('created_at', -1).limit(limit)
-    return [doc async for doc in cursor]
-
 
-async def increment_share_access(share_code: str):
-    await shares_collection.update_one(
-        {'_id': share_code},
-        {'$inc': {'access_count': 1}}
-    )
+# ============ 分享访问统计 ============
+share_stats = database['share_stats']
+
+HLL_P = 10              # 2^10 = 1024 个寄存器，标准误差约 3.2%
+HLL_M = 1 << HLL_P
+HLL_ALPHA = 0.7213 / (1 + 1.079 / HLL_M)
+
+
+def hll_register(value):
+    """HyperLogLog：返回 (寄存器下标, 前导零个数 + 1)"""
+    h = int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), 'big')
+    index = h >> (64 - HLL_P)
+    rest = h & ((1 << (64 - HLL_P)) - 1)
+    return index, (64 - HLL_P) - rest.bit_length() + 1
+
+
+def hll_estimate(registers: dict) -> int:
+    """按寄存器估算基数；registers 为稀疏存储 {下标(str): 值}"""
+    if not registers:
+        return 0
+    zeros = HLL_M - len(registers)
+    total = zeros + sum(2.0 ** -r for r in registers.values())
+    estimate = HLL_ALPHA * HLL_M * HLL_M / total
+    if estimate <= 2.5 * HLL_M and zeros:
+        estimate = HLL_M * math.log(HLL_M / zeros)
+    return int(round(estimate))
+
+
+def _utc_day(ts: float) -> str:
+    return time.strftime('%Y-%m-%d', time.gmtime(ts))
+
+
+class ShareAnalytics(PeriodicFlusher):
+    """分享访问事件缓冲：access_count 与浏览次数 / HLL 寄存器分别累计、分别批量写入，失败的部分放回重试"""
+
+    def __init__(self, interval: float = STATS_FLUSH_INTERVAL, max_pending: int = 50000):
+        super().__init__(interval)
+        self.max_pending = max_pending  # 放回失败写入时键数上限，数据库长时间不可用时不无限增长
+        self.pending = {}  # (share_code, day | None) -> {'views': n, 'hll': {idx: rank}}
+        self.access = defaultdict(int)  # share_code -> 待写入分享文档的 access_count 增量
+        self.dropped = 0
+        self.lock = asyncio.Lock()
+
+    def record(self, share_code: str, user_id: int):
+        index, rank = hll_register(user_id)
+        self.access[share_code] += 1
+        for key in ((share_code, None), (share_code, _utc_day(time.time()))):
+            entry = self.pending.setdefault(key, {'views': 0, 'hll': {}})
+            entry['views'] += 1
+            if entry['hll'].get(index, 0) < rank:
+                entry['hll'][index] = rank
+
+    def discard(self, share_code: str):
+        self.access.pop(share_code, None)
+        for key in [k for k in self.pending if k[0] == share_code]:
+            del self.pending[key]
+
+    def _requeue(self, pending: dict, access: dict):
+        """把写入失败的事件合并回缓冲；超出上限的新键丢弃并计数"""
+        for code, views in access.items():
+            if code in self.access or len(self.access) < self.max_pending:
+                self.access[code] += views
+            else:
+                self.dropped += views
+        for key, entry in pending.items():
+            current = self.pending.get(key)
+            if current is None:
+                if len(self.pending) >= self.max_pending:
+                    self.dropped += entry['views']
+                    continue
+                self.pending[key] = entry
+                continue
+            current['views'] += entry['views']
+            for i, r in entry['hll'].items():
+                if current['hll'].get(i, 0) < r:
+                    current['hll'][i] = r
+
+    def pending_views(self, share_code: str) -> int:
+        entry = self.pending.get((share_code, None))
+        return entry['views'] if entry else 0
+
+    async def flush(self):
+        async with self.lock:
+            if self.access:
+                access, self.access = self.access, defaultdict(int)
+                share_ops = [UpdateOne({'_id': code}, {'$inc': {'access_count': views}})
+                             for code, views in access.items()]
+                try:
+                    await shares_collection.bulk_write(share_ops, ordered=False)
+                except Exception as e:
+                    logger.error(f"Share access count flush failed: {e}")
+                    self._requeue({}, access)
+            if self.pending:
+                pending, self.pending = self.pending, {}
+                now = time.time()
+                stat_ops = []
+                for (code, day), entry in pending.items():
+                    update = {
+                        '$inc': {'views': entry['views']},
+                        '$max': {f"hll.{i}": r for i, r in entry['hll'].items()},
+                        '$set': {'updated_at': now}
+                    }
+                    if day is None:
+                        stat_ops.append(UpdateOne({'_id': code}, update, upsert=True))
+                    else:
+                        update['$setOnInsert'] = {'code': code, 'day': day}
+                        stat_ops.append(UpdateOne({'_id': f"{code}:{day}"}, update, upsert=True))
+                try:
+                    await share_stats.bulk_write(stat_ops, ordered=False)
+                except Exception as e:
+                    logger.error(f"Share analytics flush failed: {e}")
+                    self._requeue(pending, {})
+            if self.dropped:
+                logger.warning(f"Share analytics buffer full, dropped {self.dropped} views")
+                self.dropped = 0
+
+
+share_analytics = ShareAnalytics()
+
+
+def record_share_access(share_code: str, user_id: int):
+    share_analytics.record(share_code, user_id)
+    search_index.bump(share_code)
+
+
+def _merge_pending_hll(registers: dict, share_code: str, day=None):
+    entry = share_analytics.pending.get((share_code, day))
+    if entry:
+        registers = dict(registers)
+        for i, r in entry['hll'].items():
+            if registers.get(str(i), 0) < r:
+                registers[str(i)] = r
+    return registers
+
+
+async def get_unique_viewers(share_codes: list):
+    """批量查询分享的独立访客估计值 {code: n}"""
+    result = {code: 0 for code in share_codes}
+    async for doc in share_stats.find({'_id': {'$in': list(share_codes)}}, {'hll': 1}):
+        result[doc['_id']] = hll_estimate(_merge_pending_hll(doc.get('hll', {}), doc['_id']))
+    for code in share_codes:
+        if not result[code] and share_analytics.pending_views(code):
+            result[code] = hll_estimate(_merge_pending_hll({}, code))
+    return result
+
+
+async def get_share_analytics(share_code: str, days: int = 7):
+    """总浏览 / 独立访客 + 最近 days 天的每日趋势（UTC）"""
+    doc = await share_stats.find_one({'_id': share_code}) or {}
+    now = time.time()
+    day_keys = [_utc_day(now - i * 86400) for i in range(days - 1, -1, -1)]
+    daily_docs = {}
+    async for d in share_stats.find({'_id': {'$in': [f"{share_code}:{day}" for day in day_keys]}}):
+        daily_docs[d['day']] = d
+    daily = []
+    for day in day_keys:
+        d = daily_docs.get(day, {})
+        pending = share_analytics.pending.get((share_code, day))
+        daily.append({
+            'day': day,
+            'views': d.get('views', 0) + (pending['views'] if pending else 0),
+            'unique': hll_estimate(_merge_pending_hll(d.get('hll', {}), share_code, day))
+        })
+    return {
+        'views': doc.get('views', 0) + share_analytics.pending_views(share_code),
+        'unique_viewers': hll_estimate(_merge_pending_hll(doc.get('hll', {}), share_code)),
+        'daily': daily
+    }
 
 
 async def get_user_shares(owner_id: int, page: int = 1, per_page: int = 10):
@@ -178,44 +1287,151 @@ async def update_share(share_code: str, updates: dict):
         {'_id': share_code},
         {'$set': updates}
     )
+    if any(field in updates for field in ('title', 'group_text', 'keywords')):
+        doc = await shares_collection.find_one({'_id': share_code}, SEARCH_PROJECTION)
+        if doc:
+            if 'keywords' in updates:
+                # 原先没有关键词的分享不在关键词索引里，排序用的 created_at 取自文档
+                keyword_index.set(share_code, updates['keywords'], doc.get('created_at', 0))
+            search_index.set(doc)
+    else:
+        search_index.touch(share_code, updates['updated_at'])
+    _notify_share_changed(share_code, updates)
 
 
 async def delete_share(share_code: str):
     await shares_collection.delete_one({'_id': share_code})
+    _notify_share_changed(share_code)
+    keyword_index.remove(share_code)
+    search_index.remove(share_code)
+    share_analytics.discard(share_code)
+    await share_stats.delete_many({'$or': [{'_id': share_code}, {'code': share_code}]})
 
 
 async def get_total_shares():
     return await shares_collection.count_documents({})
 
 
-async def search_shares(query: str, limit: int = 10):
-    cursor = shares_collection.find(
-        {'title': {'$regex': query, '$options': 'i'}}
-    ).limit(limit)
-    return [doc async for doc in cursor]
+async def get_shares_by_codes(codes: list):
+    """按给定顺序批量取分享文档，不存在的跳过"""
+    if not codes:
+        return []
+    docs = {doc['_id']: doc async for doc in shares_collection.find({'_id': {'$in': codes}})}
+    return [docs[code] for code in codes if code in docs]
+
+
+async def search_shares(query: str, limit: int = 10, offset: int = 0):
+    """按相关度 + 热度返回分享文档；索引未加载时退回标题正则"""
+    if not search_index.loaded:
+        cursor = shares_collection.find(
+            {'title': {'$regex': re.escape(query), '$options': 'i'}}
+        ).skip(offset).limit(limit)
+        return [doc async for doc in cursor]
+    codes = search_index.search(query, offset + limit)[offset:]
+    return await get_shares_by_codes(codes)
+
+
+async def search_shares_page(query: str, page: int = 1, per_page: int = 20):
+    """分页搜索，返回 (文档列表, 命中总数)"""
+    offset = (page - 1) * per_page
+    if not search_index.loaded:
+        docs = await search_shares(query, per_page, offset)
+        total = await shares_collection.count_documents({'title': {'$regex': re.escape(query), '$options': 'i'}})
+        return docs, total
+    scores = search_index.match(query)
+    codes = search_index.rank(scores, offset + per_page)[offset:]
+    return await get_shares_by_codes(codes), len(scores)
 
 
 async def get_user_share_count(owner_id: int):
     return await shares_collection.count_documents({'owner_id': owner_id})
 
 
+# ============ 版本号集合（多实例缓存同步） ============
+sync_versions = database['sync_versions']
+
+
+async def bump_version(key: str):
+    doc = await sync_versions.find_one_and_update(
+        {'_id': key}, {'$inc': {'version': 1}}, upsert=True, return_document=True
+    )
+    return doc['version']
+
+
+async def get_version(key: str) -> int:
+    doc = await sync_versions.find_one({'_id': key})
+    return doc['version'] if doc else 0
+
+
 # ============ 封禁集合 ============
 banned_users = database['banned_users']
 
 
+class BannedUserSet(BackgroundTask):
+    """封禁名单的内存副本：本实例的修改直接更新，其它实例的修改通过轮询版本号后重新加载"""
+
+    def __init__(self, sync_interval: int = BAN_SYNC_INTERVAL):
+        super().__init__()
+        self.sync_interval = sync_interval
+        self.reasons = {}  # user_id -> reason
+        self.version = 0
+        self.loaded = False
+
+    def __contains__(self, user_id: int):
+        return user_id in self.reasons
+
+    def __len__(self):
+        return len(self.reasons)
+
+    def get(self, user_id: int):
+        return self.reasons.get(user_id)
+
+    async def load(self):
+        version = await get_version('banned_users')
+        reasons = {}
+        async for doc in banned_users.find({}, {'reason': 1}):
+            reasons[doc['_id']] = doc.get('reason', '')
+        self.reasons = reasons
+        self.version = version
+        self.loaded = True
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                if await get_version('banned_users') != self.version:
+                    await self.load()
+                    logger.info(f"Banned user set reloaded: {len(self.reasons)} users")
+            except Exception as e:
+                logger.error(f"Banned user sync error: {e}")
+
+
+banned_set = BannedUserSet()
+
+
 async def ban_user(user_id: int, reason: str = ""):
     await banned_users.update_one(
         {'_id': user_id},
         {'$set': {'reason': reason, 'banned_at': time.time()}},
         upsert=True
     )
+    banned_set.reasons[user_id] = reason
+    version = await bump_version('banned_users')
+    if version == banned_set.version + 1:
+        banned_set.version = version
 
 
 async def unban_user(user_id: int):
     await banned_users.delete_one({'_id': user_id})
+    banned_set.reasons.pop(user_id, None)
+    version = await bump_version('banned_users')
+    if version == banned_set.version + 1:
+        banned_set.version = version
 
 
 async def is_banned(user_id: int):
+    if banned_set.loaded:
+        return {'_id': user_id, 'reason': banned_set.get(user_id)} if user_id in banned_set else None
     return await banned_users.find_one({'_id': user_id})
 
 
@@ -230,19 +1446,66 @@ async def get_banned_count():
 
 # ============ 统计集合 ============
 bot_stats = database['bot_stats']
+stats_buckets = database['stats_buckets']
+
+STAT_PERIODS = {'hour': 3600, 'day': 86400}
+
+
+class StatsAggregator(PeriodicFlusher):
+    """计数器聚合：总计、小时桶和天桶（UTC）在内存中累加，定期分别以 bulk_write 落库"""
+
+    def __init__(self, interval: float = STATS_FLUSH_INTERVAL):
+        super().__init__(interval)
+        self.pending = defaultdict(int)                      # key -> 总计增量
+        # (period, start) -> key -> 增量；累加时即确定所属时间桶，重试不会漂移
+        self.buckets = defaultdict(lambda: defaultdict(int))
+        self.lock = asyncio.Lock()
+
+    def add(self, key: str, value: int = 1):
+        self.pending[key] += value
+        now = time.time()
+        for period, seconds in STAT_PERIODS.items():
+            self.buckets[(period, int(now // seconds * seconds))][key] += value
+
+    async def flush(self):
+        async with self.lock:
+            if self.pending:
+                pending, self.pending = self.pending, defaultdict(int)
+                stat_ops = [UpdateOne({'_id': key}, {'$inc': {'count': value}}, upsert=True)
+                            for key, value in pending.items()]
+                try:
+                    await bot_stats.bulk_write(stat_ops, ordered=False)
+                except Exception as e:
+                    logger.error(f"Stats totals flush failed: {e}")
+                    for key, value in pending.items():
+                        self.pending[key] += value
+            if self.buckets:
+                buckets, self.buckets = self.buckets, defaultdict(lambda: defaultdict(int))
+                bucket_ops = [UpdateOne(
+                    {'_id': f"{period}:{start}"},
+                    {'$inc': {f"counts.{key}": value for key, value in counts.items()},
+                     '$setOnInsert': {'period': period, 'start': start}},
+                    upsert=True
+                ) for (period, start), counts in buckets.items()]
+                try:
+                    await stats_buckets.bulk_write(bucket_ops, ordered=False)
+                except Exception as e:
+                    logger.error(f"Stats buckets flush failed: {e}")
+                    for bucket, counts in buckets.items():
+                        for key, value in counts.items():
+                            self.buckets[bucket][key] += value
+
+
+stats_aggregator = StatsAggregator()
 
 
 async def increment_stat(key: str, value: int = 1):
-    await bot_stats.update_one(
-        {'_id': key},
-        {'$inc': {'count': value}},
-        upsert=True
-    )
+    stats_aggregator.add(key, value)
 
 
 async def get_stat(key: str) -> int:
     doc = await bot_stats.find_one({'_id': key})
-    return doc['count'] if doc else 0
+    return (doc['count'] if doc else 0) + stats_aggregator.pending.get(key, 0)
 
 
 async def get_all_stats():
@@ -250,9 +1513,88 @@ async def get_all_stats():
     stats = {}
     async for doc in docs:
         stats[doc['_id']] = doc['count']
+    for key, value in stats_aggregator.pending.items():
+        stats[key] = stats.get(key, 0) + value
     return stats
 
 
+async def get_stat_series(period: str = 'hour', count: int = 24):
+    """最近 count 个时间桶（含当前桶），按时间升序，缺失的桶补空"""
+    seconds = STAT_PERIODS[period]
+    current = int(time.time() // seconds * seconds)
+    first = current - (count - 1) * seconds
+    cursor = stats_buckets.find({'period': period, 'start': {'$gte': first}})
+    found = {doc['start']: doc.get('counts', {}) async for doc in cursor}
+    series = [{'start': start, 'counts': dict(found.get(start, {}))}
+              for start in range(first, current + 1, seconds)]
+    for (bucket_period, start), counts in list(stats_aggregator.buckets.items()):
+        if bucket_period != period or start < first or start > current:
+            continue
+        bucket = series[(start - first) // seconds]['counts']
+        for key, value in counts.items():
+            bucket[key] = bucket.get(key, 0) + value
+    return series
+
+
+def sum_stat_series(series: list):
+    totals = defaultdict(int)
+    for bucket in series:
+        for key, value in bucket['counts'].items():
+            totals[key] += value
+    return dict(totals)
+
+
+# ============ 广播任务集合 ============
+broadcast_jobs = database['broadcast_jobs']
+
+
+async def create_broadcast_job(job: dict):
+    await broadcast_jobs.insert_one(job)
+    return job
+
+
+async def get_broadcast_job(job_id: str):
+    return await broadcast_jobs.find_one({'_id': job_id})
+
+
+async def update_broadcast_job(job_id: str, updates: dict):
+    updates['updated_at'] = time.time()
+    await broadcast_jobs.update_one({'_id': job_id}, {'$set': updates})
+
+
+async def get_broadcast_jobs(statuses=None, limit: int = 20):
+    query = {'status': {'$in': list(statuses)}} if statuses else {}
+    cursor = broadcast_jobs.find(query).sort('created_at', -1).limit(limit)
+    return [doc async for doc in cursor]
+
+
+# ============ 自动删除队列 ============
+delete_queue = database['delete_queue']
+
+
+async def schedule_deletion(chat_id: int, message_ids: list, delete_at: float):
+    await delete_queue.insert_one({
+        'chat_id': chat_id,
+        'message_ids': message_ids,
+        'delete_at': delete_at
+    })
+
+
+async def get_due_deletions(now: float, limit: int = 500):
+    cursor = delete_queue.find({'delete_at': {'$lte': now}}).sort('delete_at', 1).limit(limit)
+    return [doc async for doc in cursor]
+
+
+async def get_next_deletion_time():
+    cursor = delete_queue.find({}, {'delete_at': 1}).sort('delete_at', 1).limit(1)
+    docs = [doc async for doc in cursor]
+    return docs[0]['delete_at'] if docs else None
+
+
+async def remove_deletions(doc_ids: list):
+    await delete_queue.delete_many({'_id': {'$in': doc_ids}})
+
+
 # ============ 数据库健康检查 ============
 async def ping_db():
     try:
@@ -266,11 +1608,17 @@ async def ping_db():
 # ============ 索引创建 ============
 async def create_indexes():
     try:
+        await user_data.create_index([('inactive', 1), ('_id', 1)])
+        # 旧文档补齐显式的 inactive: False，活跃用户查询才能走 (inactive, _id) 索引的等值前缀
+        await user_data.update_many({'inactive': {'$exists': False}}, {'$set': {'inactive': False}})
         await shares_collection.create_index('owner_id')
         await shares_collection.create_index('created_at')
         await shares_collection.create_index('message_ids')
         await shares_collection.create_index('keywords')
-        await shares_collection.create_index([('title', 'text')])
+        await delete_queue.create_index('delete_at')
+        await broadcast_jobs.create_index('status')
+        await stats_buckets.create_index([('period', 1), ('start', 1)])
+        await share_stats.create_index('code', sparse=True)
         logger.info("Database indexes created successfully")
     except Exception as e:
         logger.error(f"Error creating indexes: {e}")
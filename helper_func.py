@@ -5,22 +5,31 @@ import logging
 import random
 import string
 import time
-from collections import defaultdict
+import secrets
+import unicodedata
+from collections import defaultdict, deque, OrderedDict
 
 from pyrogram import filters
-from pyrogram.enums import ChatMemberStatus
-from pyrogram.types import MessageOriginChannel
+from pyrogram.enums import ChatMemberStatus, ParseMode
+from pyrogram.types import MessageOriginChannel, InlineKeyboardMarkup, InlineKeyboardButton
 from config import (
     ADMINS,
     SHARE_CODE_LENGTH, RATE_LIMIT_MAX, RATE_LIMIT_WINDOW
 )
 import config as cfg
 from pyrogram.errors.exceptions.bad_request_400 import UserNotParticipant
-from pyrogram.errors import FloodWait
+from pyrogram.errors import (
+    FloodWait, FileReferenceExpired, FileReferenceInvalid, FileIdInvalid, MediaEmpty,
+    UserIsBlocked, InputUserDeactivated, PeerIdInvalid, UserIdInvalid, UserIsBot
+)
 from shortzy import Shortzy
 from database.database import (
     user_data, db_verify_status, db_update_verify_status,
-    is_banned as check_banned, update_force_sub_status
+    is_banned as check_banned, banned_set, get_force_sub_status, update_force_sub_status, keyword_index,
+    schedule_deletion, get_due_deletions, get_next_deletion_time, remove_deletions,
+    get_user_count, get_user_id_batch, apply_delivery_results, increment_stat,
+    create_broadcast_job, get_broadcast_job, update_broadcast_job, get_broadcast_jobs,
+    search_index, search_query_terms, search_dependency_terms, PartialScores, BackgroundTask, spawn
 )
 
 logger = logging.getLogger(__name__)
@@ -35,9 +44,59 @@ ALL_COMMANDS = [
 
 
 # ============ 订阅检查（多频道） ============
+MEMBER_STATUSES = (ChatMemberStatus.OWNER, ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.MEMBER)
+
+
+def get_force_sub_channels():
+    return (getattr(cfg, 'FORCE_SUB_CHANNELS', None) or
+            ([getattr(cfg, 'FORCE_SUB_CHANNEL', 0)] if getattr(cfg, 'FORCE_SUB_CHANNEL', 0) else []))
+
+
+class MembershipCache:
+    """(用户, 频道) 成员关系缓存：只缓存「已加入」，退出频道由 chat_member 更新主动失效"""
+
+    def __init__(self, ttl: int = None, max_size: int = 100000):
+        self.ttl = ttl or cfg.FORCE_SUB_MEMBER_TTL
+        self.max_size = max_size
+        self.entries = OrderedDict()  # (user_id, channel_id) -> expires_at
+
+    def is_member(self, user_id: int, channel_id: int) -> bool:
+        key = (user_id, channel_id)
+        expires_at = self.entries.get(key)
+        if expires_at is None:
+            return False
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return False
+        return True
+
+    def set_member(self, user_id: int, channel_id: int):
+        key = (user_id, channel_id)
+        self.entries[key] = time.monotonic() + self.ttl
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, user_id: int, channel_id: int):
+        self.entries.pop((user_id, channel_id), None)
+
+
+membership_cache = MembershipCache()
+
+
+async def _save_force_sub_status(user_id: int, verified: bool, channels: list):
+    """只在状态真正变化时写库"""
+    channels = [int(c) for c in channels]
+    current = await get_force_sub_status(user_id)
+    if current.get('verified') == verified and current.get('channels') == channels:
+        return
+    await update_force_sub_status(user_id, {
+        'verified': verified, 'verified_at': time.time(), 'channels': channels
+    })
+
+
 async def is_subscribed(filter, client, update):
-    channels = (getattr(cfg, 'FORCE_SUB_CHANNELS', None) or
-                ([getattr(cfg, 'FORCE_SUB_CHANNEL', 0)] if getattr(cfg, 'FORCE_SUB_CHANNEL', 0) else []))
+    channels = get_force_sub_channels()
     if not channels:
         return True
     user_id = update.from_user.id
@@ -45,52 +104,286 @@ async def is_subscribed(filter, client, update):
         return True
 
     for channel_id in channels:
+        if membership_cache.is_member(user_id, channel_id):
+            continue
         try:
             member = await client.get_chat_member(chat_id=channel_id, user_id=user_id)
-            if member.status not in [
-                ChatMemberStatus.OWNER,
-                ChatMemberStatus.ADMINISTRATOR,
-                ChatMemberStatus.MEMBER
-            ]:
-                await update_force_sub_status(user_id, {
-                    'verified': False, 'verified_at': time.time(),
-                    'channels': [int(c) for c in channels]
-                })
+            if member.status not in MEMBER_STATUSES:
+                await _save_force_sub_status(user_id, False, channels)
                 return False
+            membership_cache.set_member(user_id, channel_id)
         except UserNotParticipant:
-            await update_force_sub_status(user_id, {
-                'verified': False, 'verified_at': time.time(),
-                'channels': [int(c) for c in channels]
-            })
+            await _save_force_sub_status(user_id, False, channels)
             return False
         except Exception as e:
             logger.error(f"Error checking sub for channel {channel_id}: {e}")
             return False
-    await update_force_sub_status(user_id, {
-        'verified': True, 'verified_at': time.time(),
-        'channels': [int(c) for c in channels]
-    })
+    await _save_force_sub_status(user_id, True, channels)
     return True
 
 
 # ============ 封禁检查 ============
+_ban_replied = {}  # user_id -> 上次回复封禁提示的时间
+
+
 async def is_not_banned(filter, client, update):
     if not update.from_user:
         return True
     user_id = update.from_user.id
     if user_id in ADMINS:
         return True
-    banned = await check_banned(user_id)
-    if banned:
+    if banned_set.loaded:
+        if user_id not in banned_set:
+            return True
+        banned = {'reason': banned_set.get(user_id)}
+    else:
+        banned = await check_banned(user_id)
+        if not banned:
+            return True
+
+    # 封禁提示限频，避免被封禁用户刷消息拖垮发送速率
+    now = time.monotonic()
+    if now - _ban_replied.get(user_id, 0) < cfg.BAN_REPLY_INTERVAL:
+        return False
+    if len(_ban_replied) > 10000:
+        for uid in [u for u, t in _ban_replied.items() if now - t >= cfg.BAN_REPLY_INTERVAL]:
+            del _ban_replied[uid]
+    _ban_replied[user_id] = now
+    try:
+        await update.reply(
+            f"🚫 您已被封禁，无法使用本机器人。\n<b>原因：</b>{banned.get('reason') or '未说明原因'}",
+            quote=True
+        )
+    except Exception:
+        pass
+    return False
+
+
+# ============ 关键词多模式匹配 ============
+class KeywordMatcher:
+    """Aho-Corasick 自动机：一次线性扫描找出文本中出现的全部关键词"""
+
+    def __init__(self, min_length: int = 1):
+        self.min_length = min_length
+        self.active = set()
+        self._reset()
+
+    def _reset(self):
+        self.goto = [{}]      # 节点 -> {字符: 子节点}
+        self.fail = [0]
+        self.output = [None]  # 节点 -> 以该节点结尾的关键词
+        self.link = [0]       # 节点 -> 沿失效链最近的输出节点
+        self.dead = 0
+        self.dirty = False
+
+    def _insert(self, keyword: str):
+        node = 0
+        for ch in keyword:
+            nxt = self.goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(None)
+                self.link.append(0)
+            node = nxt
+        self.output[node] = keyword
+        self.dirty = True
+
+    def _build_links(self):
+        queue = []
+        for child in self.goto[0].values():
+            self.fail[child] = 0
+            self.link[child] = 0
+            queue.append(child)
+        for node in queue:
+            for ch, child in self.goto[node].items():
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                target = self.goto[f].get(ch, 0)
+                self.fail[child] = target if target != child else 0
+                fc = self.fail[child]
+                self.link[child] = fc if self.output[fc] is not None else self.link[fc]
+                queue.append(child)
+        self.dirty = False
+
+    def rebuild(self, keywords):
+        self._reset()
+        self.active = {k for k in keywords if len(k) >= self.min_length}
+        for keyword in self.active:
+            self._insert(keyword)
+        self._build_links()
+
+    # ---------- KeywordIndex 通知 ----------
+    def keyword_added(self, keyword: str):
+        if len(keyword) < self.min_length or keyword in self.active:
+            return
+        self.active.add(keyword)
+        self._insert(keyword)
+
+    def keyword_removed(self, keyword: str):
+        if keyword in self.active:
+            self.active.discard(keyword)
+            self.dead += 1
+            if self.dead > 1000 and self.dead > len(self.active):
+                self.rebuild(self.active)
+
+    def keywords_reloaded(self, keywords):
+        self.rebuild(keywords)
+
+    def find(self, text: str):
+        """按首次出现顺序返回文本中包含的关键词（去重）"""
+        if self.dirty:
+            self._build_links()
+        goto, fail, output, link, active = self.goto, self.fail, self.output, self.link, self.active
+        found = {}
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            hit = node if output[node] is not None else link[node]
+            while hit:
+                keyword = output[hit]
+                if keyword in active and keyword not in found:
+                    found[keyword] = None
+                hit = link[hit]
+        return list(found)
+
+
+keyword_matcher = KeywordMatcher(min_length=cfg.KEYWORD_MIN_MATCH_LENGTH)
+keyword_index.observers.append(keyword_matcher)
+
+
+# ============ 讨论组登记表 ============
+def get_bound_channel_ids():
+    channels = list(getattr(cfg, "BOUND_CHANNELS", []) or [])
+    if cfg.CHANNEL_ID:
+        channels.append(cfg.CHANNEL_ID)
+    return frozenset(channels)
+
+
+class DiscussionRegistry(BackgroundTask):
+    """绑定频道 → 关联讨论组 的登记表：定时解析 linked_chat，消息过滤只做集合成员判断"""
+
+    def __init__(self, refresh_interval: int = cfg.DISCUSSION_REFRESH_INTERVAL, max_checked: int = 10000):
+        super().__init__()
+        self.refresh_interval = refresh_interval
+        self.max_checked = max_checked
+        self.client = None
+        self.channels = None      # 最近一次解析的绑定频道集合
+        self.groups = {}          # channel_id -> discussion group_id
+        self.group_ids = frozenset()
+        self.checked = {}         # 已反查且不是讨论组的 chat_id -> 下次允许反查的时间
+        self.retry_task = None
+
+    async def start(self, client):
+        self.client = client
         try:
-            await update.reply(
-                f"🚫 您已被封禁，无法使用本机器人。\n<b>原因：</b>{banned.get('reason', '未说明原因')}",
-                quote=True
-            )
-        except Exception:
-            pass
+            await self.refresh(client)
+        except Exception as e:
+            logger.error(f"Discussion group refresh error: {e}")
+        super().start()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh(self.client)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Discussion group refresh error: {e}")
+
+    async def on_stop(self):
+        if self.retry_task is not None:
+            self.retry_task.cancel()
+            self.retry_task = None
+
+    def _set_groups(self, groups: dict):
+        self.groups = groups
+        self.group_ids = frozenset(groups.values())
+
+    def check_unknown(self, client, chat_id: int) -> bool:
+        """未登记的群：在后台反查其 linked_chat（消息过滤中不等待），返回是否安排了反查"""
+        channels = get_bound_channel_ids()
+        if not channels:
+            return False
+        now = time.monotonic()
+        if self.checked.get(chat_id, 0) > now:
+            return False
+        if len(self.checked) >= self.max_checked:
+            self.checked = {cid: until for cid, until in self.checked.items() if until > now}
+            if len(self.checked) >= self.max_checked:
+                return False
+        self.checked[chat_id] = now + self.refresh_interval
+        spawn(self._check_linked(client, chat_id, channels))
+        return True
+
+    async def _check_linked(self, client, chat_id: int, channels):
+        """是绑定频道的讨论组则登记，之后的消息即可通过过滤"""
+        try:
+            chat = await client.get_chat(chat_id)
+        except Exception as e:
+            logger.warning(f"Error checking linked channel of {chat_id}: {e}")
+            return
+        linked = getattr(chat, "linked_chat", None)
+        if not linked or linked.id not in channels:
+            return
+        self.checked.pop(chat_id, None)
+        self._set_groups({**self.groups, linked.id: chat_id})
+        logger.info(f"Discussion group {chat_id} of channel {linked.id} registered")
+
+    def needs_refresh(self):
+        return self.channels != get_bound_channel_ids()
+
+    async def _resolve(self, client, channel_id: int):
+        chat = await client.get_chat(channel_id)
+        linked = getattr(chat, "linked_chat", None)
+        return linked.id if linked else None
+
+    async def refresh(self, client):
+        channels = get_bound_channel_ids()
+        groups = {}
+        retry_after = 0
+        for channel_id in channels:
+            try:
+                group_id = await self._resolve(client, channel_id)
+            except FloodWait as e:
+                logger.warning(f"FloodWait resolving discussion group of {channel_id}: {e.value}s")
+                group_id = self.groups.get(channel_id)
+                retry_after = max(retry_after, e.value)
+            except Exception as e:
+                logger.error(f"Error resolving discussion group of {channel_id}: {e}")
+                group_id = self.groups.get(channel_id)
+            if group_id:
+                groups[channel_id] = group_id
+        self.channels = channels
+        self._set_groups(groups)
+        self.checked = {}
+        logger.info(f"Discussion groups: {groups}")
+        if retry_after and (self.retry_task is None or self.retry_task.done()):
+            self.retry_task = asyncio.create_task(self._retry(client, retry_after))
+
+    async def _retry(self, client, delay: float):
+        await asyncio.sleep(delay)
+        await self.refresh(client)
+
+
+discussion_registry = DiscussionRegistry()
+
+
+async def _in_discussion_group(_, client, message):
+    if message.chat is None:
         return False
-    return True
+    if message.chat.id in discussion_registry.group_ids:
+        return True
+    discussion_registry.check_unknown(client, message.chat.id)
+    return False
+
+discussion_group = filters.create(_in_discussion_group)
 
 
 # ============ 强制关注提示（可复用） ============
@@ -184,7 +477,8 @@ def generate_share_code(length=None):
 
 
 # ============ 消息获取 ============
-async def get_messages(client, message_ids):
+async def get_messages(client, message_ids, raise_errors: bool = False):
+    """分批拉取数据库频道消息；raise_errors 为 False 时出错的批次按空结果处理"""
     messages = []
     total_messages = 0
     while total_messages != len(message_ids):
@@ -201,6 +495,8 @@ async def get_messages(client, message_ids):
                 message_ids=temb_ids
             )
         except Exception as e:
+            if raise_errors:
+                raise
             logger.error(f"Error getting messages: {e}")
             msgs = []
         total_messages += len(temb_ids)
@@ -208,6 +504,354 @@ async def get_messages(client, message_ids):
     return messages
 
 
+# ============ 消息元数据缓存 ============
+MEDIA_KINDS = ('photo', 'video', 'document', 'audio', 'animation', 'voice', 'sticker', 'video_note')
+ALBUM_TYPES = {'photo': 'media', 'video': 'media', 'document': 'document', 'audio': 'audio'}
+
+
+def message_to_meta(msg):
+    """提取发送所需的最小信息：媒体类型、file_id、HTML 说明文字和按钮"""
+    kind = 'other'
+    file_id = None
+    file_name = ""
+    if msg.text and not msg.media:
+        kind = 'text'
+    else:
+        for k in MEDIA_KINDS:
+            media = getattr(msg, k, None)
+            if media:
+                kind = k
+                file_id = media.file_id
+                file_name = getattr(media, 'file_name', None) or ""
+                break
+
+    if kind == 'text':
+        caption = msg.text.html
+    else:
+        caption = msg.caption.html if msg.caption else ""
+
+    return {
+        'id': msg.id,
+        'kind': kind,
+        'file_id': file_id,
+        'file_name': file_name,
+        'caption': caption,
+        'album': ALBUM_TYPES.get(kind),
+        'reply_markup': msg.reply_markup
+    }
+
+
+_MISS = object()
+
+
+class MessageCache:
+    """数据库频道消息元数据的 LRU + TTL 缓存，同一批 id 的并发未命中只拉取一次"""
+
+    def __init__(self, max_size: int = None, ttl: int = None, negative_ttl: int = None,
+                 max_insert: int = None):
+        self.max_size = max_size or cfg.MESSAGE_CACHE_SIZE
+        self.ttl = ttl or cfg.MESSAGE_CACHE_TTL
+        self.negative_ttl = negative_ttl or cfg.MESSAGE_CACHE_NEGATIVE_TTL
+        self.max_insert = max_insert or max(1, self.max_size // 10)
+        self.entries = OrderedDict()  # (channel, msg_id) -> (expires_at, meta | None)
+        self.inflight = {}            # (channel, msg_id) -> Future
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _lookup(self, key, now):
+        item = self.entries.get(key)
+        if item is None:
+            return _MISS
+        expires_at, meta = item
+        if expires_at < now:
+            del self.entries[key]
+            return _MISS
+        self.entries.move_to_end(key)
+        return meta
+
+    def _store(self, key, meta, now):
+        self.entries[key] = (now + (self.ttl if meta is not None else self.negative_ttl), meta)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, channel_id: int, message_ids):
+        for mid in message_ids:
+            self.entries.pop((channel_id, mid), None)
+
+    async def get_many(self, client, message_ids, cache: bool = True):
+        """按原顺序返回存在的消息元数据，已删除的消息被跳过；
+        cache 为 False 时只读缓存、不写入（调用方自行保存结果，如发送计划）。
+        拉取失败时抛出异常，合并等待的调用方收到同一个异常"""
+        channel_id = client.db_channel.id
+        now = time.monotonic()
+        found = {}
+        missing = []
+        waiting = {}
+        for mid in message_ids:
+            key = (channel_id, mid)
+            meta = self._lookup(key, now)
+            if meta is not _MISS:
+                self.hits += 1
+                found[mid] = meta
+            elif key in self.inflight:
+                self.coalesced += 1
+                waiting[mid] = self.inflight[key]
+            elif mid not in found and mid not in missing:
+                self.misses += 1
+                missing.append(mid)
+
+        if missing:
+            future = asyncio.get_event_loop().create_future()
+            keys = [(channel_id, mid) for mid in missing]
+            for key in keys:
+                self.inflight[key] = future
+            try:
+                msgs = await get_messages(client, missing, raise_errors=True)
+                fetched = {m.id: message_to_meta(m) for m in msgs if m and not m.empty}
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                future.set_exception(e)
+                future.exception()  # 没有等待者时不触发 "exception was never retrieved"
+                raise
+            finally:
+                for key in keys:
+                    self.inflight.pop(key, None)
+            if cache:
+                now = time.monotonic()
+                for mid in missing[:self.max_insert]:
+                    self._store((channel_id, mid), fetched.get(mid), now)
+            future.set_result(fetched)
+            found.update(fetched)
+
+        for mid, future in waiting.items():
+            result = await future
+            found[mid] = result.get(mid)
+
+        return [found[mid] for mid in message_ids if found.get(mid)]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0
+        }
+
+
+message_cache = MessageCache()
+
+
+async def get_message_metas(client, message_ids, cache: bool = True):
+    return await message_cache.get_many(client, message_ids, cache=cache)
+
+
+# ============ 内联查询缓存 ============
+class InlineQueryCache:
+    """内联查询缓存：规范化后的查询词 → 排好序的分享码，按词项失效，较长查询在前缀查询的候选集里筛选"""
+
+    def __init__(self, max_size: int = None, narrow_limit: int = 5000):
+        self.max_size = max_size or cfg.INLINE_CACHE_SIZE
+        self.narrow_limit = narrow_limit  # 候选集不超过该数量时保留，供更长的查询筛选
+        self.entries = OrderedDict()      # query -> entry
+        self.hits = 0
+        self.misses = 0
+        self.narrowed = 0
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return ' '.join(unicodedata.normalize('NFKC', query).lower().split())
+
+    @staticmethod
+    def _valid(entry) -> bool:
+        version = search_index.version
+        if entry['version'] == version:
+            return True
+        if search_index.changed_since(entry['version'], entry['terms']):
+            return False
+        entry['version'] = version
+        return True
+
+    def _prefix_candidates(self, query: str):
+        # 前缀查询的命中集合一定包含当前查询的命中集合（词项只会变多或变长）；
+        # 分享码只做完整匹配，查询词命中分享码时前缀查询的结果里没有它，不能筛选
+        if search_index.has_exact(search_query_terms(query)):
+            return None
+        for end in range(len(query) - 1, 0, -1):
+            entry = self.entries.get(query[:end])
+            # 空结果不作为候选集：直接重新查询，代价很小
+            if entry and entry['scores'] and self._valid(entry):
+                self.narrowed += 1
+                return entry['scores']
+        return None
+
+    def lookup(self, query: str, depth: int):
+        """返回缓存项，保证 ranked 至少排好前 depth 个（或全部命中）"""
+        entry = self.entries.get(query)
+        if entry and self._valid(entry):
+            self.hits += 1
+            self.entries.move_to_end(query)
+        else:
+            self.misses += 1
+            version = search_index.version
+            scores = search_index.match(query, self._prefix_candidates(query))
+            ranked = search_index.rank(scores, max(depth, cfg.INLINE_PAGE_SIZE * 2))
+            now = time.time()
+            stable_since = now
+            if entry and entry['ranked'][:cfg.INLINE_PAGE_SIZE] == ranked[:cfg.INLINE_PAGE_SIZE]:
+                stable_since = entry['stable_since']
+            reusable = len(scores) <= self.narrow_limit and not isinstance(scores, PartialScores)
+            entry = {
+                'version': version,
+                'terms': search_dependency_terms(query),
+                'scores': scores if reusable else None,
+                'ranked': ranked,
+                'total': len(scores),
+                'stable_since': stable_since
+            }
+            self.entries[query] = entry
+            self.entries.move_to_end(query)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        if len(entry['ranked']) < min(depth, entry['total']):
+            scores = entry['scores'] if entry['scores'] is not None else search_index.match(query)
+            entry['ranked'] = search_index.rank(scores, max(depth, len(entry['ranked']) * 2))
+        return entry
+
+    @staticmethod
+    def cache_time(entry) -> int:
+        """首页结果稳定越久，让 Telegram 缓存越久（10 秒 ~ 5 分钟）"""
+        if not entry['total']:
+            return 5
+        return int(min(300, max(10, time.time() - entry['stable_since'])))
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'narrowed': self.narrowed,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0
+        }
+
+
+query_cache = InlineQueryCache()
+
+
+# ============ 分享发送计划 ============
+STALE_FILE_ERRORS = (FileReferenceExpired, FileReferenceInvalid, FileIdInvalid, MediaEmpty)
+
+
+def meta_to_plan_item(meta):
+    """元数据转为可持久化的计划项，按钮只保留 URL 按钮"""
+    buttons = []
+    markup = meta.get('reply_markup')
+    for row in getattr(markup, 'inline_keyboard', None) or []:
+        cells = [[b.text, b.url] for b in row if getattr(b, 'url', None)]
+        if cells:
+            buttons.append(cells)
+    return {
+        'id': meta['id'],
+        'kind': meta['kind'],
+        'file_id': meta['file_id'],
+        'file_name': meta['file_name'],
+        'caption': meta['caption'],
+        'album': meta.get('album'),
+        'buttons': buttons
+    }
+
+
+def plan_item_to_meta(item):
+    buttons = item.get('buttons') or []
+    markup = None
+    if buttons:
+        markup = InlineKeyboardMarkup(
+            [[InlineKeyboardButton(text, url=url) for text, url in row] for row in buttons]
+        )
+    return {
+        'id': item['id'],
+        'kind': item['kind'],
+        'file_id': item.get('file_id'),
+        'file_name': item.get('file_name', ""),
+        'caption': item.get('caption', ""),
+        'album': item.get('album'),
+        'reply_markup': markup
+    }
+
+
+async def build_delivery_plan(client, message_ids, metas=None):
+    """为分享生成发送计划；已有的元数据直接使用，其余从缓存/频道补齐，已删除的消息标记为 empty"""
+    by_id = {m['id']: m for m in (metas or [])}
+    missing = [mid for mid in message_ids if mid not in by_id]
+    if missing:
+        # 计划会持久化，结果不写入消息缓存
+        for meta in await get_message_metas(client, missing, cache=False):
+            by_id[meta['id']] = meta
+    return [
+        meta_to_plan_item(by_id[mid]) if mid in by_id else {'id': mid, 'kind': 'empty'}
+        for mid in message_ids
+    ]
+
+
+def build_caption(meta):
+    """按 CUSTOM_CAPTION / 推广语生成发送时的说明文字"""
+    if cfg.CUSTOM_CAPTION and meta['kind'] == 'document':
+        caption = cfg.CUSTOM_CAPTION.format(
+            previouscaption=meta['caption'],
+            filename=meta['file_name']
+        )
+    else:
+        caption = meta['caption']
+    if cfg.SHOW_PROMO and cfg.PROMO_TEXT:
+        caption += cfg.PROMO_TEXT
+    return caption
+
+
+async def send_cached_message(client, chat_id, meta, caption=None, reply_markup=None, protect=False):
+    """根据元数据直接发送，不需要再从数据库频道拉取原消息"""
+    kind = meta['kind']
+    if kind == 'text':
+        return await client.send_message(
+            chat_id=chat_id,
+            text=meta['caption'],
+            parse_mode=ParseMode.HTML,
+            reply_markup=reply_markup,
+            protect_content=protect
+        )
+    if kind in ('sticker', 'video_note'):
+        return await client.send_cached_media(
+            chat_id=chat_id,
+            file_id=meta['file_id'],
+            reply_markup=reply_markup,
+            protect_content=protect
+        )
+    if kind == 'other':
+        return await client.copy_message(
+            chat_id=chat_id,
+            from_chat_id=client.db_channel.id,
+            message_id=meta['id'],
+            caption=caption,
+            parse_mode=ParseMode.HTML,
+            reply_markup=reply_markup,
+            protect_content=protect
+        )
+    return await client.send_cached_media(
+        chat_id=chat_id,
+        file_id=meta['file_id'],
+        caption=caption if caption is not None else meta['caption'],
+        parse_mode=ParseMode.HTML,
+        reply_markup=reply_markup,
+        protect_content=protect
+    )
+
+
 async def get_message_id(client, message):
     if message.forward_origin and isinstance(message.forward_origin, MessageOriginChannel):
         if message.forward_origin.chat.id == client.db_channel.id:
@@ -315,6 +959,641 @@ class RateLimiter:
 rate_limiter = RateLimiter()
 
 
+# ============ 发送调度（令牌桶） ============
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.base_rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def wait_time(self, now: float, cost: float = 1) -> float:
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < cost:
+            wait = max(wait, (cost - self.tokens) / self.rate)
+        return wait
+
+    def consume(self, cost: float = 1):
+        self.tokens -= cost
+
+    async def acquire(self, cost: float = 1):
+        while True:
+            wait = self.wait_time(time.monotonic(), cost)
+            if wait <= 0:
+                self.consume(cost)
+                return
+            await asyncio.sleep(wait)
+
+    def penalize(self, now: float, seconds: float):
+        """FloodWait：暂停到期前不再放行，并把速率减半"""
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = 0
+        self.rate = max(self.base_rate / 16, self.rate / 2)
+
+    def reward(self):
+        """发送成功后逐步恢复速率"""
+        if self.rate < self.base_rate:
+            self.rate = min(self.base_rate, self.rate + self.base_rate / 20)
+
+
+class DeliveryScheduler:
+    """全局 + 每个聊天各一个令牌桶，预算允许时立即发送，FloodWait 时自适应降速"""
+
+    def __init__(self, global_rate: float = None, chat_rate: float = None,
+                 chat_burst: int = None, max_retries: int = 2):
+        self.global_rate = global_rate or cfg.DELIVERY_GLOBAL_RATE
+        self.chat_rate = chat_rate or cfg.DELIVERY_CHAT_RATE
+        self.chat_burst = chat_burst or cfg.DELIVERY_CHAT_BURST
+        self.max_retries = max_retries
+        self.global_bucket = TokenBucket(self.global_rate, self.global_rate)
+        self.chat_buckets = {}
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) > 10000:
+                self._prune()
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _prune(self):
+        now = time.monotonic()
+        idle = [
+            cid for cid, b in self.chat_buckets.items()
+            if now - b.updated > 60 and b.blocked_until < now and b.rate >= b.base_rate
+        ]
+        for cid in idle:
+            del self.chat_buckets[cid]
+
+    async def acquire(self, chat_id: int, cost: float = 1):
+        bucket = self._chat_bucket(chat_id)
+        while True:
+            now = time.monotonic()
+            wait = max(bucket.wait_time(now, cost), self.global_bucket.wait_time(now, cost))
+            if wait <= 0:
+                bucket.consume(cost)
+                self.global_bucket.consume(cost)
+                return
+            await asyncio.sleep(wait)
+
+    async def send(self, chat_id: int, func, *args, cost: float = 1, **kwargs):
+        """按预算执行一次发送调用，FloodWait 时降速重试，超过重试次数则抛出"""
+        attempt = 0
+        while True:
+            await self.acquire(chat_id, cost)
+            try:
+                result = await func(*args, **kwargs)
+            except FloodWait as e:
+                now = time.monotonic()
+                self._chat_bucket(chat_id).penalize(now, e.value)
+                self.global_bucket.rate = max(self.global_rate / 4, self.global_bucket.rate * 0.8)
+                logger.warning(f"FloodWait {e.value}s sending to {chat_id}, attempt {attempt + 1}")
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                continue
+            self._chat_bucket(chat_id).reward()
+            self.global_bucket.reward()
+            return result
+
+
+delivery_scheduler = DeliveryScheduler()
+
+
+# ============ 群回复队列 ============
+class GroupReplyQueue(BackgroundTask):
+    """群内回复的发送队列：每个群一个令牌桶加共享总预算，各群发送互不阻塞，FloodWait 只封锁对应群"""
+
+    def __init__(self, group_rate: float = None, group_burst: int = None,
+                 total_rate: float = None, max_pending: int = 10):
+        super().__init__()
+        self.group_rate = group_rate or cfg.KEYWORD_GROUP_RATE
+        self.group_burst = group_burst or cfg.KEYWORD_GROUP_BURST
+        self.total_bucket = TokenBucket(total_rate or cfg.KEYWORD_REPLY_RATE, total_rate or cfg.KEYWORD_REPLY_RATE)
+        self.max_pending = max_pending
+        self.buckets = {}
+        self.queues = defaultdict(deque)  # chat_id -> deque[(func, args, kwargs, on_sent)]
+        self.sending = {}                 # chat_id -> 在途发送任务
+        self.wakeup = None
+        self.dropped = 0
+
+    def _bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self.buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.group_rate, self.group_burst)
+            self.buckets[chat_id] = bucket
+        return bucket
+
+    def submit(self, chat_id: int, func, *args, on_sent=None, low_priority: bool = False, **kwargs):
+        """提交一条发送；返回是否入队"""
+        now = time.monotonic()
+        if low_priority and (self._bucket(chat_id).wait_time(now) > 0 or self.total_bucket.wait_time(now) > 0):
+            self.dropped += 1
+            return False
+        queue = self.queues[chat_id]
+        if len(queue) >= self.max_pending:
+            queue.popleft()
+            self.dropped += 1
+        queue.append((func, args, kwargs, on_sent))
+        if self.wakeup:
+            self.wakeup.set()
+        return True
+
+    def start(self):
+        if self.wakeup is None:
+            self.wakeup = asyncio.Event()
+        super().start()
+
+    async def _send(self, chat_id: int, item):
+        func, args, kwargs, on_sent = item
+        try:
+            result = await func(*args, **kwargs)
+        except FloodWait as e:
+            logger.warning(f"FloodWait {e.value}s replying in group {chat_id}, requeued")
+            self._bucket(chat_id).penalize(time.monotonic(), e.value)
+            self.queues[chat_id].appendleft(item)
+            return
+        except Exception as e:
+            logger.error(f"Error sending group reply in {chat_id}: {e}")
+            return
+        self._bucket(chat_id).reward()
+        if on_sent:
+            try:
+                on_sent(result)
+            except Exception as e:
+                logger.debug(f"Group reply callback failed: {e}")
+
+    async def _dispatch(self, chat_id: int, item):
+        try:
+            await self._send(chat_id, item)
+        finally:
+            self.sending.pop(chat_id, None)
+            self.wakeup.set()
+
+    async def _run(self):
+        while True:
+            self.wakeup.clear()
+            now = time.monotonic()
+            timeout = None
+            for chat_id in list(self.queues):
+                if chat_id in self.sending:
+                    continue
+                queue = self.queues[chat_id]
+                if not queue:
+                    del self.queues[chat_id]
+                    continue
+                wait = max(self._bucket(chat_id).wait_time(now), self.total_bucket.wait_time(now))
+                if wait > 0:
+                    timeout = wait if timeout is None else min(timeout, wait)
+                    continue
+                self._bucket(chat_id).consume()
+                self.total_bucket.consume()
+                self.sending[chat_id] = asyncio.create_task(self._dispatch(chat_id, queue.popleft()))
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def on_stop(self):
+        tasks = list(self.sending.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+group_reply_queue = GroupReplyQueue()
+
+
+# ============ 自动删除调度 ============
+class AutoDeleteScheduler(BackgroundTask):
+    """持久化的自动删除队列：单个定时循环按聊天批量删除到期消息，重启后继续执行"""
+
+    def __init__(self, poll_interval: int = 30, batch_size: int = 500):
+        super().__init__()
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.client = None
+        self.wakeup = None
+        self.next_due = None
+
+    def start(self, client):
+        self.client = client
+        if self.wakeup is None:
+            self.wakeup = asyncio.Event()
+        super().start()
+
+    async def schedule(self, chat_id: int, message_ids: list, delay: int):
+        ids = [mid for mid in message_ids if mid]
+        if not ids:
+            return
+        delete_at = time.time() + delay
+        await schedule_deletion(chat_id, ids, delete_at)
+        if self.wakeup and (self.next_due is None or delete_at < self.next_due):
+            self.wakeup.set()
+
+    async def _run(self):
+        while True:
+            self.wakeup.clear()
+            try:
+                await self._process_due()
+                self.next_due = await get_next_deletion_time()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Auto delete loop error: {e}")
+                self.next_due = None
+
+            timeout = self.poll_interval
+            if self.next_due is not None:
+                timeout = min(timeout, max(0.0, self.next_due - time.time()))
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _delete_chunk(self, chat_id: int, ids: list):
+        try:
+            await self.client.delete_messages(chat_id, ids)
+        except FloodWait as e:
+            await asyncio.sleep(e.value)
+            try:
+                await self.client.delete_messages(chat_id, ids)
+            except Exception as e2:
+                logger.warning(f"Error deleting messages in {chat_id} after flood wait: {e2}")
+        except Exception as e:
+            logger.warning(f"Error deleting messages in {chat_id}: {e}")
+
+    async def _process_due(self):
+        while True:
+            docs = await get_due_deletions(time.time(), limit=self.batch_size)
+            if not docs:
+                return
+            by_chat = defaultdict(list)
+            for doc in docs:
+                by_chat[doc['chat_id']].extend(doc.get('message_ids', []))
+            for chat_id, ids in by_chat.items():
+                for i in range(0, len(ids), 100):
+                    await self._delete_chunk(chat_id, ids[i:i + 100])
+            await remove_deletions([doc['_id'] for doc in docs])
+            if len(docs) < self.batch_size:
+                return
+
+
+auto_delete_scheduler = AutoDeleteScheduler()
+
+
+# ============ 广播任务 ============
+class DeliveryResultBuffer:
+    """广播发送结果缓冲：删除用户、累加 / 清零失败次数合并为一次 bulk_write"""
+
+    def __init__(self, flush_size: int = None):
+        self.flush_size = flush_size or cfg.BROADCAST_FLUSH_SIZE
+        self.removed = []
+        self.failed = []
+        self.recovered = []
+        self.lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self.removed) + len(self.failed) + len(self.recovered)
+
+    async def record(self, user_id: int, result: str):
+        if result == 'removed':
+            self.removed.append(user_id)
+        elif result == 'failed':
+            self.failed.append(user_id)
+        elif result == 'ok':
+            self.recovered.append(user_id)
+        else:
+            return
+        if len(self) >= self.flush_size:
+            await self.flush()
+
+    async def flush(self):
+        async with self.lock:
+            if not len(self):
+                return
+            removed, failed, recovered = self.removed, self.failed, self.recovered
+            self.removed, self.failed, self.recovered = [], [], []
+            try:
+                await apply_delivery_results(removed, failed, recovered, cfg.BROADCAST_MAX_FAILURES)
+            except Exception as e:
+                logger.error(f"Failed to flush delivery results: {e}")
+
+
+BROADCAST_COUNTERS = ('processed', 'successful', 'blocked', 'deleted', 'failed')
+# 与用户本身相关、重试也不会成功的错误，才累计到 fail_count；
+# FloodWait 耗尽重试、网络超时、服务端 5xx 等临时错误只计入本次广播的失败数
+PERMANENT_DELIVERY_ERRORS = (PeerIdInvalid, UserIdInvalid, UserIsBot)
+BROADCAST_ACTIVE = ('running', 'paused')
+
+
+class BroadcastManager:
+    """持久化广播任务：按用户 _id 键集分页，批内并发发送，支持暂停 / 继续 / 取消和断点恢复"""
+
+    def __init__(self):
+        self.client = None
+        self.jobs = {}   # job_id -> 运行中的任务文档（内存副本）
+        self.tasks = {}  # job_id -> asyncio.Task
+        self.bucket = TokenBucket(cfg.BROADCAST_RATE, cfg.BROADCAST_RATE)
+        self.results = DeliveryResultBuffer()
+        self.listeners = defaultdict(set)  # job_id -> {asyncio.Queue}
+        self.meters = {}        # job_id -> (开始时间, 开始时已处理数)，用于计算速率
+        self.last_publish = {}  # job_id -> 上次推送时间
+
+    async def create(self, client, text: str = "", source_message=None, buttons=None,
+                     progress_message=None, started_by: int = 0):
+        """创建并启动任务；source_message 存在时复制该消息，否则发送 text"""
+        self.client = client
+        job = {
+            '_id': secrets.token_hex(6),
+            'status': 'running',
+            'text': text,
+            'source_chat_id': source_message.chat.id if source_message else None,
+            'source_message_id': source_message.id if source_message else None,
+            'buttons': buttons or [],
+            'cursor': None,  # 批内「连续已完成」的最后一个用户；之后乱序完成的记录在 acked，恢复时跳过
+            'total': await get_user_count(active_only=True),
+            'progress_chat_id': progress_message.chat.id if progress_message else None,
+            'progress_message_id': progress_message.id if progress_message else None,
+            'started_by': started_by,
+            'created_at': time.time(),
+            'updated_at': time.time(),
+            'finished_at': None
+        }
+        for key in BROADCAST_COUNTERS:
+            job[key] = 0
+        await create_broadcast_job(job)
+        self._launch(job, source_message)
+        return job
+
+    def _launch(self, job: dict, source_message=None):
+        job_id = job['_id']
+        task = self.tasks.get(job_id)
+        if task and not task.done():
+            return
+        self.jobs[job_id] = job
+        self.tasks[job_id] = asyncio.create_task(self._run(job, source_message))
+
+    async def resume_all(self, client):
+        """启动时恢复重启前仍在运行的任务"""
+        self.client = client
+        for job in await get_broadcast_jobs(statuses=['running'], limit=100):
+            logger.info(f"Resuming broadcast {job['_id']} from cursor {job.get('cursor')}")
+            self._launch(job)
+
+    async def get(self, job_id: str):
+        return self.jobs.get(job_id) or await get_broadcast_job(job_id)
+
+    async def set_status(self, job_id: str, status: str):
+        """暂停 / 继续 / 取消；返回更新后的任务，任务不存在或已结束返回 None"""
+        job = await self.get(job_id)
+        if not job or job['status'] not in BROADCAST_ACTIVE:
+            return None
+        job['status'] = status
+        if status == 'cancelled' and job_id not in self.tasks:
+            job['finished_at'] = time.time()
+            self.jobs.pop(job_id, None)
+        await update_broadcast_job(job_id, {'status': status, 'finished_at': job.get('finished_at')})
+        self._publish(job, force=True)
+        if status == 'running':
+            self._launch(job)
+        elif job_id not in self.tasks:
+            await self._report(job)
+        return job
+
+    # ---------- 进度推送 ----------
+    def subscribe(self, job_id: str):
+        """订阅任务进度；队列只保留最新一份快照，慢消费者不会堆积"""
+        queue = asyncio.Queue(maxsize=1)
+        self.listeners[job_id].add(queue)
+        return queue
+
+    def unsubscribe(self, job_id: str, queue):
+        listeners = self.listeners.get(job_id)
+        if listeners is not None:
+            listeners.discard(queue)
+            if not listeners:
+                self.listeners.pop(job_id, None)
+
+    def snapshot(self, job: dict):
+        job_id = job['_id']
+        data = {key: job.get(key, 0) for key in BROADCAST_COUNTERS}
+        data.update({
+            'job_id': job_id,
+            'status': job['status'],
+            'total': job.get('total', 0),
+            'created_at': job.get('created_at'),
+            'finished_at': job.get('finished_at')
+        })
+        rate = 0.0
+        meter = self.meters.get(job_id)
+        if meter and job['status'] == 'running':
+            elapsed = time.monotonic() - meter[0]
+            if elapsed > 0:
+                rate = (job['processed'] - meter[1]) / elapsed
+        remaining = max(0, data['total'] - data['processed'])
+        data['rate'] = round(rate, 2)
+        data['eta'] = round(remaining / rate) if rate > 0 else None
+        return data
+
+    def _publish(self, job: dict, force: bool = False):
+        job_id = job['_id']
+        listeners = self.listeners.get(job_id)
+        if not listeners:
+            return
+        now = time.monotonic()
+        if not force and now - self.last_publish.get(job_id, 0) < 1:
+            return
+        self.last_publish[job_id] = now
+        data = self.snapshot(job)
+        for queue in listeners:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(data)
+
+    async def _load_source(self, job: dict):
+        if not job.get('source_message_id'):
+            return None
+        msg = await self.client.get_messages(job['source_chat_id'], job['source_message_id'])
+        if not msg or msg.empty:
+            raise ValueError("broadcast source message not found")
+        return msg
+
+    def _markup(self, job: dict):
+        rows = job.get('buttons') or []
+        if not rows:
+            return None
+        return InlineKeyboardMarkup(
+            [[InlineKeyboardButton(text, url=url) for text, url in row] for row in rows]
+        )
+
+    async def _send_one(self, job: dict, source, reply_markup, user_id: int):
+        await self.bucket.acquire()
+        try:
+            if source is not None:
+                await delivery_scheduler.send(user_id, source.copy, user_id, reply_markup=reply_markup)
+            else:
+                await delivery_scheduler.send(
+                    user_id, self.client.send_message, user_id, job['text'], reply_markup=reply_markup
+                )
+            job['successful'] += 1
+            result = 'ok'
+        except UserIsBlocked:
+            job['blocked'] += 1
+            result = 'removed'
+        except InputUserDeactivated:
+            job['deleted'] += 1
+            result = 'removed'
+        except PERMANENT_DELIVERY_ERRORS as e:
+            logger.warning(f"Broadcast to {user_id} rejected: {e}")
+            job['failed'] += 1
+            result = 'failed'
+        except Exception as e:
+            logger.error(f"Error broadcasting to {user_id}: {e}")
+            job['failed'] += 1
+            result = 'skipped'
+        job['processed'] += 1
+        await self.results.record(user_id, result)
+
+    def _checkpoint(self, job: dict):
+        updates = {key: job[key] for key in BROADCAST_COUNTERS}
+        updates['cursor'] = job['cursor']
+        updates['acked'] = job.get('acked') or []
+        updates['status'] = job['status']
+        updates['finished_at'] = job.get('finished_at')
+        return updates
+
+    async def _run(self, job: dict, source=None):
+        job_id = job['_id']
+        semaphore = asyncio.Semaphore(cfg.BROADCAST_CONCURRENCY)
+        last_report = time.monotonic()
+        skip = set(job.get('acked') or [])  # 上次中断前已完成、位于 cursor 之后的用户
+
+        async def run_batch(batch):
+            done = set()
+            position = 0
+
+            async def worker(user_id):
+                nonlocal position
+                if user_id not in skip:
+                    async with semaphore:
+                        await self._send_one(job, source, reply_markup, user_id)
+                done.add(user_id)
+                while position < len(batch) and batch[position] in done:
+                    position += 1
+                if position:
+                    job['cursor'] = batch[position - 1]
+                job['acked'] = [uid for uid in batch[position:] if uid in done]
+                self._publish(job)
+
+            await asyncio.gather(*(worker(uid) for uid in batch))
+
+        self.meters[job_id] = (time.monotonic(), job['processed'])
+
+        try:
+            if source is None:
+                source = await self._load_source(job)
+            reply_markup = self._markup(job)
+            await self._report(job)
+
+            while job['status'] == 'running':
+                batch = await get_user_id_batch(job['cursor'], cfg.BROADCAST_BATCH_SIZE, active_only=True)
+                if not batch:
+                    job['status'] = 'done'
+                    break
+                await run_batch(batch)
+                skip.clear()
+                await self.results.flush()
+                await update_broadcast_job(job_id, self._checkpoint(job))
+                if time.monotonic() - last_report >= cfg.BROADCAST_PROGRESS_INTERVAL:
+                    await self._report(job)
+                    last_report = time.monotonic()
+        except asyncio.CancelledError:
+            await self.results.flush()
+            await update_broadcast_job(job_id, self._checkpoint(job))
+            raise
+        except Exception as e:
+            logger.error(f"Broadcast {job_id} failed: {e}")
+            job['status'] = 'failed'
+
+        await self.results.flush()
+        if job['status'] in ('done', 'cancelled', 'failed'):
+            job['finished_at'] = time.time()
+        await update_broadcast_job(job_id, self._checkpoint(job))
+        if job['status'] == 'done':
+            await increment_stat('broadcasts')
+        self.tasks.pop(job_id, None)
+        if job['status'] != 'paused':
+            self.jobs.pop(job_id, None)
+        self._publish(job, force=True)
+        self.meters.pop(job_id, None)
+        self.last_publish.pop(job_id, None)
+        await self._report(job)
+
+    async def stop(self):
+        for task in list(self.tasks.values()):
+            task.cancel()
+        for task in list(self.tasks.values()):
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self.tasks.clear()
+
+    def format_progress(self, job: dict):
+        status = {
+            'running': '📢 广播进行中', 'paused': '⏸ 广播已暂停', 'cancelled': '✖️ 广播已取消',
+            'done': '📢 广播完成', 'failed': '❌ 广播失败'
+        }.get(job['status'], job['status'])
+        return (
+            f"<b><u>{status}</u>\n\n"
+            f"任务 ID：<code>{job['_id']}</code>\n"
+            f"总用户数：<code>{job['total']}</code>\n"
+            f"已处理：<code>{job['processed']}</code>\n"
+            f"发送成功：<code>{job['successful']}</code>\n"
+            f"已屏蔽机器人：<code>{job['blocked']}</code>\n"
+            f"已注销账户：<code>{job['deleted']}</code>\n"
+            f"发送失败：<code>{job['failed']}</code></b>"
+        )
+
+    def progress_buttons(self, job: dict):
+        job_id = job['_id']
+        if job['status'] == 'running':
+            row = [InlineKeyboardButton("⏸ 暂停", callback_data=f"bc_pause_{job_id}")]
+        elif job['status'] == 'paused':
+            row = [InlineKeyboardButton("▶️ 继续", callback_data=f"bc_resume_{job_id}")]
+        else:
+            return None
+        row.append(InlineKeyboardButton("✖️ 取消", callback_data=f"bc_cancel_{job_id}"))
+        return InlineKeyboardMarkup([row])
+
+    async def _report(self, job: dict):
+        if not job.get('progress_message_id') or not self.client:
+            return
+        try:
+            await self.client.edit_message_text(
+                chat_id=job['progress_chat_id'],
+                message_id=job['progress_message_id'],
+                text=self.format_progress(job),
+                reply_markup=self.progress_buttons(job)
+            )
+        except Exception as e:
+            logger.debug(f"Progress edit skipped for broadcast {job['_id']}: {e}")
+
+
+broadcast_manager = BroadcastManager()
+
+
 # ============ 自定义按钮解析 ============
 def parse_buttons(button_str: str):
     """解析按钮字符串 格式: 文字1|链接1,文字2|链接2"""
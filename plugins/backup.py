@@ -6,24 +6,37 @@ from pyrogram import Client, filters
 from pyrogram.types import Message
 from bot import Bot
 from config import ADMINS
-from database.database import full_userbase, get_all_stats, get_banned_users
+from database.database import iter_user_ids, get_all_stats, get_banned_users
 
 logger = logging.getLogger(__name__)
 
 
+async def write_backup(f, backup_data: dict, user_ids):
+    """逐个字段写出备份 JSON，用户列表边读边写，不在内存中构建完整列表；返回用户数"""
+    f.write('{')
+    for key, value in backup_data.items():
+        # 嵌套值整体缩进一级，与外层对象对齐
+        body = json.dumps(value, indent=2, default=str).replace('\n', '\n  ')
+        f.write(f'\n  {json.dumps(key)}: {body},')
+    f.write('\n  "users": [')
+    total_users = 0
+    async for user_id in user_ids:
+        f.write(("," if total_users else "") + "\n    " + json.dumps(user_id, default=str))
+        total_users += 1
+    f.write(f'\n  ],\n  "total_users": {total_users}\n}}\n')
+    return total_users
+
+
 @Bot.on_message(filters.command('backup') & filters.private & filters.user(ADMINS))
 async def backup_command(client: Client, message: Message):
     msg = await message.reply("📦 正在创建备份...", quote=True)
 
     try:
-        users = await full_userbase()
         stats = await get_all_stats()
         banned = await get_banned_users()
 
         backup_data = {
             "timestamp": datetime.utcnow().isoformat(),
-            "total_users": len(users),
-            "users": users,
             "stats": stats,
             "banned_users": [
                 {"id": b["_id"], "reason": b.get("reason", "")}
@@ -33,13 +46,13 @@ async def backup_command(client: Client, message: Message):
 
         filename = f"/tmp/backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
         with open(filename, 'w') as f:
-            json.dump(backup_data, f, indent=2, default=str)
+            total_users = await write_backup(f, backup_data, iter_user_ids())
 
         await message.reply_document(
             document=filename,
             caption=(
                 f"📦 <b>备份创建成功</b>\n\n"
-                f"👥 用户数：{len(users)}\n"
+                f"👥 用户数：{total_users}\n"
                 f"🚫 封禁数：{len(banned)}"
             ),
             quote=True
@@ -4,30 +4,36 @@ import random
 import re
 import string
 import time as _time
+from collections import OrderedDict
 from pyrogram import filters, Client
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
 from pyrogram.errors import FloodWait
 
 from bot import Bot
 import config as cfg
-from helper_func import generate_share_code, ALL_COMMANDS
+from helper_func import (
+    generate_share_code, ALL_COMMANDS, message_cache,
+    message_to_meta, build_delivery_plan, meta_to_plan_item, keyword_matcher,
+    discussion_group, group_reply_queue
+)
 from database.database import (
     create_share, get_share, increment_stat,
-    find_share_by_message_id, find_shares_by_keyword,
-    find_share_by_group_text, update_share
+    find_share_by_message_id, find_share_by_group_text, update_share,
+    update_plan_item, keyword_index
 )
 from plugins.share import user_share_sessions
 
 logger = logging.getLogger(__name__)
 channel_media_groups = {}
 
-# ============ 关联频道缓存 ============
-_linked_chat_cache = {}   # group_id -> linked_channel_id | None
-_linked_cache_ts = {}     # group_id -> timestamp
-_LINKED_CACHE_TTL = 600   # 缓存10分钟
-
 _NON_WORD_RE = re.compile(r"[\s\W_]+", re.UNICODE)
 
+# (chat_id, 关键词) -> {'expires', 'link', 'pointed'}
+_reply_cache = OrderedDict()
+# 回复排队期间的占位时长：期间同一关键词不重复排队；发送成功后才进入正式冷却，
+# 被丢弃或发送失败的回复在占位到期后可以重新触发
+_REPLY_PENDING_TTL = 30
+
 
 def _generate_keywords(group_text: str):
     """从文本中随机取4个不重复的单字符作为关键词"""
@@ -47,99 +53,70 @@ def _generate_keywords(group_text: str):
     return keywords
 
 
-def _get_bound_ids():
-    """每次调用实时读取绑定频道配置"""
-    channels = list(getattr(cfg, "BOUND_CHANNELS", []) or [])
-    if cfg.CHANNEL_ID:
-        channels.append(cfg.CHANNEL_ID)
-    return set(channels)
-
-
-async def _get_linked_channel_id(client, chat_id):
-    """获取群组关联的频道 ID，带缓存避免频繁 API 调用触发 FloodWait"""
-    now = _time.time()
-    if chat_id in _linked_chat_cache and now - _linked_cache_ts.get(chat_id, 0) < _LINKED_CACHE_TTL:
-        return _linked_chat_cache[chat_id]
-
-    try:
-        chat = await client.get_chat(chat_id)
-        linked = getattr(chat, "linked_chat", None)
-        linked_id = linked.id if linked else None
-        _linked_chat_cache[chat_id] = linked_id
-        _linked_cache_ts[chat_id] = now
-        return linked_id
-    except FloodWait as e:
-        logger.warning(f"FloodWait getting chat {chat_id}: waiting {e.value}s")
-        await asyncio.sleep(e.value)
-        try:
-            chat = await client.get_chat(chat_id)
-            linked = getattr(chat, "linked_chat", None)
-            linked_id = linked.id if linked else None
-            _linked_chat_cache[chat_id] = linked_id
-            _linked_cache_ts[chat_id] = now
-            return linked_id
-        except Exception as e2:
-            logger.error(f"Failed to get chat {chat_id} after FloodWait: {e2}")
-            return _linked_chat_cache.get(chat_id)
-    except Exception as e:
-        logger.error(f"Error getting chat {chat_id}: {e}")
-        return _linked_chat_cache.get(chat_id)
-
-
 # ============ 讨论组关键词回复 ============
 @Bot.on_message(
-    filters.group & filters.incoming & filters.text,
+    filters.group & filters.incoming & filters.text & discussion_group,
     group=-1
 )
 async def discussion_keyword_reply(client: Client, message: Message):
     """绑定频道的讨论组中发送关键词，回复关联的分享链接"""
-    keyword = (message.text or "").strip()
-    if not keyword:
+    text = (message.text or "").strip()
+    if not text:
         return
 
-    bound_ids = _get_bound_ids()
-    if not bound_ids:
+    # 先查内存索引，绝大多数普通聊天在这里直接返回，不触发任何 API / 数据库调用：
+    # 整条消息等于关键词时直接命中，否则用 AC 自动机找出句中包含的关键词
+    matched = [text] if text in keyword_index else keyword_matcher.find(text)
+    if not matched:
         return
-
-    # 使用缓存判断当前群是否是绑定频道的讨论组
-    linked_id = await _get_linked_channel_id(client, message.chat.id)
-    if not linked_id or linked_id not in bound_ids:
-        return
-
-    # 全局搜索关键词
-    shares = await find_shares_by_keyword(keyword, limit=6)
-    if not shares:
+    codes = []
+    for kw in matched:
+        for code in keyword_index.lookup(kw, limit=6):
+            if code not in codes:
+                codes.append(code)
+    codes = codes[:6]
+    keyword = "、".join(matched[:3])
+
+    # 冷却期内同一关键词不再重复回复，预算允许时用一条轻量提示指向上一次回复
+    now = _time.monotonic()
+    cache_key = (message.chat.id, keyword)
+    cached = _reply_cache.get(cache_key)
+    if cached and cached['expires'] > now:
+        if cached.get('link') and now - cached.get('pointed', 0) > 10:
+            cached['pointed'] = now
+            group_reply_queue.submit(
+                message.chat.id, message.reply_text, "👆 相关资源见上方回复",
+                quote=True, low_priority=True,
+                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("查看", url=cached['link'])]])
+            )
         return
 
     bot_username = client.username or ""
     button_text = getattr(cfg, "KEYWORD_BUTTON_TEXT", "🔗 获取资源")
 
     buttons = []
-    for i, s in enumerate(shares):
-        code = s['_id']
+    for i, code in enumerate(codes):
         link = f"https://t.me/{bot_username}?start={code}"
         buttons.append([InlineKeyboardButton(f"{button_text} {i + 1}", url=link)])
 
-    try:
-        await message.reply_text(
-            f"已获得\"{keyword}\"相关资源，共 {len(shares)} 条",
-            quote=True,
-            reply_markup=InlineKeyboardMarkup(buttons)
-        )
-        logger.info(f"Keyword reply: '{keyword}' -> {len(shares)} results in chat {message.chat.id}")
-    except FloodWait as e:
-        logger.warning(f"FloodWait replying in chat {message.chat.id}: {e.value}s")
-        await asyncio.sleep(e.value)
-        try:
-            await message.reply_text(
-                f"已获得\"{keyword}\"相关资源，共 {len(shares)} 条",
-                quote=True,
-                reply_markup=InlineKeyboardMarkup(buttons)
-            )
-        except Exception as e2:
-            logger.error(f"Failed to reply after FloodWait: {e2}")
-    except Exception as e:
-        logger.error(f"Error sending keyword reply in chat {message.chat.id}: {e}")
+    entry = {'expires': now + _REPLY_PENDING_TTL, 'link': None}
+    _reply_cache[cache_key] = entry
+    _reply_cache.move_to_end(cache_key)
+    while len(_reply_cache) > 5000:
+        _reply_cache.popitem(last=False)
+
+    def on_sent(reply):
+        entry['expires'] = _time.monotonic() + cfg.KEYWORD_REPLY_COOLDOWN
+        entry['link'] = getattr(reply, 'link', None)
+
+    group_reply_queue.submit(
+        message.chat.id, message.reply_text,
+        f"已获得\"{keyword}\"相关资源，共 {len(codes)} 条",
+        quote=True,
+        reply_markup=InlineKeyboardMarkup(buttons),
+        on_sent=on_sent
+    )
+    logger.info(f"Keyword reply: '{keyword}' -> {len(codes)} results in chat {message.chat.id}")
 
 
 # ============ 管理员私聊文件收集 ============
@@ -158,6 +135,7 @@ async def channel_post(client: Client, message: Message):
                 disable_notification=True
             )
             user_share_sessions[user_id]['messages'].append(post_message.id)
+            user_share_sessions[user_id]['metas'].append(message_to_meta(post_message))
             count = len(user_share_sessions[user_id]['messages'])
             await message.reply(f"✅ 第 {count} 个文件已添加到分享中。", quote=True)
         except FloodWait as e:
@@ -167,6 +145,7 @@ async def channel_post(client: Client, message: Message):
                 disable_notification=True
             )
             user_share_sessions[user_id]['messages'].append(post_message.id)
+            user_share_sessions[user_id]['metas'].append(message_to_meta(post_message))
         except Exception as e:
             logger.error(f"Error in share session: {e}")
             await message.reply("❌ 添加文件失败。", quote=True)
@@ -227,6 +206,13 @@ async def _finalize_channel_media_group(client: Client, group_id: str):
         updates = {}
         if merged_ids != existing_ids:
             updates["message_ids"] = merged_ids
+            existing_plan = existing_share.get("delivery_plan") or []
+            if len(existing_plan) == len(existing_ids):
+                plan_ids = set(existing_ids)
+                updates["delivery_plan"] = existing_plan + [
+                    meta_to_plan_item(message_to_meta(msg))
+                    for msg in messages if msg.id not in plan_ids
+                ]
         if not existing_share.get("keywords"):
             updates["keywords"] = _generate_keywords(group_text)
 
@@ -278,6 +264,9 @@ async def _finalize_channel_media_group(client: Client, group_id: str):
         return
 
     keywords = _generate_keywords(group_text)
+    delivery_plan = await build_delivery_plan(
+        client, message_ids, metas=[message_to_meta(msg) for msg in messages]
+    )
 
     await create_share(
         share_code=share_code,
@@ -286,7 +275,8 @@ async def _finalize_channel_media_group(client: Client, group_id: str):
         title=f"媒体组-{share_code}",
         protect_content=False,
         group_text=group_text,
-        keywords=keywords
+        keywords=keywords,
+        delivery_plan=delivery_plan
     )
     await increment_stat('links_generated')
 
@@ -377,6 +367,7 @@ async def new_post(client: Client, message: Message):
         group_text = message.text
 
     keywords = _generate_keywords(group_text)
+    delivery_plan = await build_delivery_plan(client, [message.id], metas=[message_to_meta(message)])
 
     await create_share(
         share_code=share_code,
@@ -385,7 +376,8 @@ async def new_post(client: Client, message: Message):
         title=f"文件-{share_code}",
         protect_content=False,
         group_text=group_text,
-        keywords=keywords
+        keywords=keywords,
+        delivery_plan=delivery_plan
     )
     await increment_stat('links_generated')
 
@@ -432,3 +424,19 @@ async def new_post(client: Client, message: Message):
             )
 
     logger.info(f"Single message share created: {share_code} for message {message.id}, keywords={keywords}")
+
+
+# ============ 频道消息编辑：使消息缓存和分享的发送计划失效 ============
+@Bot.on_edited_message(
+    filters.channel & filters.chat(cfg.CHANNEL_ID),
+    group=1
+)
+async def edited_post(client: Client, message: Message):
+    message_cache.invalidate(message.chat.id, [message.id])
+    try:
+        codes = await update_plan_item(meta_to_plan_item(message_to_meta(message)))
+    except Exception as e:
+        logger.error(f"Failed to update delivery plans for edited message {message.id}: {e}")
+        return
+    if codes:
+        logger.info(f"Delivery plan item {message.id} updated in {len(codes)} shares")
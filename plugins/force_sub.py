@@ -0,0 +1,27 @@
+import logging
+from pyrogram import filters
+from pyrogram.types import ChatMemberUpdated
+from bot import Bot
+from helper_func import membership_cache, get_force_sub_channels, MEMBER_STATUSES
+
+logger = logging.getLogger(__name__)
+
+
+async def _is_force_sub_chat(_, __, update: ChatMemberUpdated):
+    return bool(update.chat) and update.chat.id in get_force_sub_channels()
+
+force_sub_chat = filters.create(_is_force_sub_chat)
+
+
+# ============ 强制订阅频道成员变动 ============
+@Bot.on_chat_member_updated(force_sub_chat)
+async def force_sub_member_updated(client: Bot, update: ChatMemberUpdated):
+    member = update.new_chat_member or update.old_chat_member
+    if not member or not member.user:
+        return
+    user_id = member.user.id
+    channel_id = update.chat.id
+    if update.new_chat_member and update.new_chat_member.status in MEMBER_STATUSES:
+        membership_cache.set_member(user_id, channel_id)
+    else:
+        membership_cache.invalidate(user_id, channel_id)
@@ -1,16 +1,96 @@
+import time
 import logging
+from collections import OrderedDict
 from pyrogram import Client
 from pyrogram.types import (
     InlineQuery, InlineQueryResultArticle, InputTextMessageContent
 )
 
 from bot import Bot
-from helper_func import encode
-from database.database import search_shares
+import config as cfg
+from helper_func import encode, query_cache
+from database.database import search_shares, search_index, get_shares_by_codes
 
 logger = logging.getLogger(__name__)
 
 
+# ============ 渲染结果缓存 ============
+# code -> (updated_at, 过期时间, InlineQueryResultArticle)
+_rendered = OrderedDict()
+
+
+def _render(client: Client, share: dict) -> InlineQueryResultArticle:
+    code = share['_id']
+    title = share.get('title', '未命名')
+    files = len(share.get('message_ids', []))
+    views = share.get('access_count', 0)
+
+    link = f"https://t.me/{client.username}?start={code}"
+
+    return InlineQueryResultArticle(
+        id=code,
+        title=title,
+        description=f"📁 {files} 个文件 | 👁 {views} 次查看 | 分享码: {code}",
+        input_message_content=InputTextMessageContent(
+            f"📦 <b>{title}</b>\n\n"
+            f"📁 文件数：{files}\n"
+            f"📌 分享码：<code>{code}</code>\n\n"
+            f"👉 <a href='{link}'>点击获取文件</a>"
+        ),
+        thumb_url="https://img.icons8.com/color/48/000000/folder-invoices.png"
+    )
+
+
+async def _render_codes(client: Client, codes: list):
+    """热门分享复用已渲染的结果；分享有修改（updated_at 变化）或过期时重新取文档渲染"""
+    now = time.time()
+    rendered = {}
+    missing = []
+    for code in codes:
+        cached = _rendered.get(code)
+        if cached and cached[0] == search_index.updated_at(code) and cached[1] > now:
+            rendered[code] = cached[2]
+            _rendered.move_to_end(code)
+        else:
+            missing.append(code)
+    for share in await get_shares_by_codes(missing):
+        code = share['_id']
+        result = _render(client, share)
+        rendered[code] = result
+        _rendered[code] = (search_index.updated_at(code), now + cfg.INLINE_RENDER_TTL, result)
+        _rendered.move_to_end(code)
+    while len(_rendered) > cfg.INLINE_RENDER_CACHE_SIZE:
+        _rendered.popitem(last=False)
+    return [rendered[code] for code in codes if code in rendered]
+
+
+def _resolve_offset(ranked: list, offset: str) -> int:
+    """next_offset 为 "位置.最后一个分享码"：按分享码定位（键集分页），
+    排序在翻页间有变动时也不会重复或跳过；分享码已不在结果中时按位置继续"""
+    if not offset:
+        return 0
+    position, _, code = offset.partition('.')
+    position = int(position) if position.isdigit() else 0
+    if 0 < position <= len(ranked) and ranked[position - 1] == code:
+        return position
+    try:
+        return ranked.index(code) + 1
+    except ValueError:
+        return position
+
+
+def _no_results(search_text: str):
+    return [
+        InlineQueryResultArticle(
+            title="未找到结果",
+            description=f"没有匹配「{search_text}」的分享",
+            input_message_content=InputTextMessageContent(
+                f"未找到匹配的分享：{search_text}"
+            )
+        )
+    ]
+
+
 @Bot.on_inline_query()
 async def inline_search(client: Client, query: InlineQuery):
     search_text = query.query.strip()
@@ -24,45 +104,34 @@ async def inline_search(client: Client, query: InlineQuery):
         )
         return
 
-    # 搜索分享内容
-    results = await search_shares(search_text, limit=20)
-
-    if not results:
+    # 索引未加载时直接查库，不分页
+    if not search_index.loaded:
+        results = await search_shares(search_text, limit=cfg.INLINE_PAGE_SIZE)
         await query.answer(
-            results=[
-                InlineQueryResultArticle(
-                    title="未找到结果",
-                    description=f"没有匹配「{search_text}」的分享",
-                    input_message_content=InputTextMessageContent(
-                        f"未找到匹配的分享：{search_text}"
-                    )
-                )
-            ],
+            results=[_render(client, share) for share in results] or _no_results(search_text),
             cache_time=5
         )
         return
 
-    inline_results = []
-    for idx, share in enumerate(results):
-        code = share['_id']
-        title = share.get('title', '未命名')
-        files = len(share.get('message_ids', []))
-        views = share.get('access_count', 0)
-
-        link = f"https://t.me/{client.username}?start={code}"
-
-        inline_results.append(
-            InlineQueryResultArticle(
-                title=title,
-                description=f"📁 {files} 个文件 | 👁 {views} 次查看 | 分享码: {code}",
-                input_message_content=InputTextMessageContent(
-                    f"📦 <b>{title}</b>\n\n"
-                    f"📁 文件数：{files}\n"
-                    f"📌 分享码：<code>{code}</code>\n\n"
-                    f"👉 <a href='{link}'>点击获取文件</a>"
-                ),
-                thumb_url="https://img.icons8.com/color/48/000000/folder-invoices.png"
-            )
-        )
+    page_size = cfg.INLINE_PAGE_SIZE
+    normalized = query_cache.normalize(search_text)
+    entry = query_cache.lookup(normalized, page_size)
+    start = _resolve_offset(entry['ranked'], query.offset)
+    if start:
+        entry = query_cache.lookup(normalized, start + page_size)
+        start = _resolve_offset(entry['ranked'], query.offset)
+
+    if not entry['total']:
+        await query.answer(results=_no_results(search_text), cache_time=5)
+        return
+
+    codes = entry['ranked'][start:start + page_size]
+    inline_results = await _render_codes(client, codes)
+    end = start + len(codes)
+    next_offset = f"{end}.{codes[-1]}" if codes and end < entry['total'] else ""
 
-    await query.answer(results=inline_results, cache_time=10)
+    await query.answer(
+        results=inline_results,
+        cache_time=query_cache.cache_time(entry),
+        next_offset=next_offset
+    )
@@ -1,21 +1,34 @@
 import asyncio
+import hashlib
+import hmac
 import logging
+import re
+import time
+from collections import OrderedDict
 from pyrogram import Client, filters
-from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, InputMediaPhoto, InputMediaVideo
+from pyrogram.types import (
+    Message, InlineKeyboardMarkup, InlineKeyboardButton,
+    InputMediaPhoto, InputMediaVideo, InputMediaDocument, InputMediaAudio
+)
 from pyrogram.enums import ParseMode
-from pyrogram.errors import FloodWait
 
 from bot import Bot
 from config import (
-    ADMINS, PROTECT_CONTENT, CUSTOM_CAPTION,
+    ADMINS, TG_BOT_TOKEN, PROTECT_CONTENT, CUSTOM_CAPTION,
     DISABLE_CHANNEL_BUTTON, PROMO_TEXT, SHOW_PROMO,
     AUTO_DELETE_TIME, AUTO_DELETE_MSG
 )
-from helper_func import not_banned, generate_share_code, get_messages, get_exp_time, subscribed
+from helper_func import (
+    not_banned, generate_share_code, get_exp_time, subscribed,
+    delivery_scheduler, get_message_metas, build_caption, send_cached_message,
+    message_cache, build_delivery_plan, meta_to_plan_item, plan_item_to_meta,
+    STALE_FILE_ERRORS, auto_delete_scheduler
+)
 from database.database import (
-    create_share, get_share, increment_share_access,
+    create_share, get_share, record_share_access,
     get_user_shares, update_share, delete_share,
-    increment_stat, get_user_share_count
+    increment_stat, get_user_share_count, get_unique_viewers,
+    share_listeners, spawn
 )
 
 logger = logging.getLogger(__name__)
@@ -30,6 +43,7 @@ async def start_share(client: Client, message: Message):
     user_id = message.from_user.id
     user_share_sessions[user_id] = {
         'messages': [],
+        'metas': [],
         'protect': False,
         'title': ''
     }
@@ -81,6 +95,7 @@ async def my_shares(client: Client, message: Message):
         return await message.reply("📭 您还没有任何分享。\n\n使用 /share 创建第一个分享！", quote=True)
 
     text = f"📋 <b>我的分享</b>（第 {page} 页，共 {total} 个）\n\n"
+    uniques = await get_unique_viewers([share['_id'] for share in shares])
 
     buttons = []
     for share in shares:
@@ -91,7 +106,7 @@ async def my_shares(client: Client, message: Message):
         files = len(share.get('message_ids', []))
 
         text += f"{protect} <code>{code}</code> - {title}\n"
-        text += f"   📁 {files} 个文件 | 👁 {access} 次查看\n\n"
+        text += f"   📁 {files} 个文件 | 👁 {access} 次查看 | 👤 {uniques.get(code, 0)} 人\n\n"
 
         buttons.append([
             InlineKeyboardButton(f"📄 {code}", callback_data=f"share_detail_{code}"),
@@ -118,7 +133,7 @@ async def handle_share_code(client: Client, message: Message, code: str):
     if not share:
         return False
 
-    await increment_share_access(code)
+    record_share_access(code, message.from_user.id)
     await increment_stat('share_accessed')
 
     message_ids = share.get('message_ids', [])
@@ -132,23 +147,19 @@ async def handle_share_code(client: Client, message: Message, code: str):
     if not group_text:
         page_ids = message_ids[:10]
         try:
-            page_msgs = await get_messages(client, page_ids)
+            page_metas = await resolve_share_metas(client, share, page_ids)
         except Exception as e:
             logger.error(f"Error getting share messages: {e}")
             await message.reply("❌ 获取文件时出错，请稍后再试。", quote=True)
             return True
 
-        page_msgs = [m for m in page_msgs if m and not m.empty]
-        if not page_msgs:
+        if not page_metas:
             await message.reply("❌ 文件已不存在或已被删除。", quote=True)
             return True
 
-        for m in page_msgs:
-            if m.caption:
-                group_text = m.caption
-                break
-            elif m.text:
-                group_text = m.text
+        for meta in page_metas:
+            if meta['caption']:
+                group_text = meta['caption']
                 break
 
     header = f"📦 此分享包含 <b>{len(message_ids)}</b> 个文件"
@@ -156,6 +167,12 @@ async def handle_share_code(client: Client, message: Message, code: str):
         header += f"\n📝 媒体组文字：{group_text}"
     await message.reply(header, quote=True)
 
+    await deliver_first_page(client, message, share)
+    return True
+
+
+async def deliver_first_page(client: Client, message: Message, share: dict):
+    """发送第一页、翻页按钮和自动删除提示，返回已发送的消息"""
     snt_msgs, page, total_pages = await send_share_page(
         client, message.from_user.id, share, page=1, per_page=10
     )
@@ -163,7 +180,7 @@ async def handle_share_code(client: Client, message: Message, code: str):
     if total_pages > 1:
         nav_message = await message.reply(
             f"📄 第 {page}/{total_pages} 页",
-            reply_markup=build_share_page_buttons(code, page, total_pages),
+            reply_markup=build_share_page_buttons(share['_id'], page, total_pages),
             quote=True
         )
 
@@ -175,25 +192,65 @@ async def handle_share_code(client: Client, message: Message, code: str):
         delete_targets = snt_msgs[:]
         if nav_message:
             delete_targets.append(nav_message)
-        asyncio.get_event_loop().create_task(
-            _auto_delete(delete_targets, notification, AUTO_DELETE_TIME)
+        delete_targets.append(notification)
+        await auto_delete_scheduler.schedule(
+            message.chat.id, [m.id for m in delete_targets], AUTO_DELETE_TIME
         )
 
     await increment_stat('files_shared', len(snt_msgs))
-    return True
+    return snt_msgs
+
+
+# ============ 范围链接（/batch、/genlink） ============
+_RANGE_CACHE_SIZE = 256
+_range_shares = OrderedDict()  # key -> 内存中的临时分享
+_RANGE_KEY_RE = re.compile(r'^r(\d+)-(\d+)\.([0-9a-f]{12})$')
+_RANGE_KEY_SECRET = hashlib.sha256(b"range-share:" + TG_BOT_TOKEN.encode()).digest()
+
+
+def _sign_range(start: int, end: int) -> str:
+    return hmac.new(_RANGE_KEY_SECRET, f"r{start}-{end}".encode(), hashlib.sha256).hexdigest()[:12]
+
+
+def get_range_share(start: int, end: int, protect: bool = False):
+    """把范围链接解析为内存中的临时分享，复用分享的分页与翻页按钮；
+    已解析的元数据记录在其 delivery_plan 中，翻页时不再重复拉取。
+    key 带 HMAC 签名，翻页回调只接受本机器人发出的范围"""
+    key = f"r{start}-{end}.{_sign_range(start, end)}"
+    share = _range_shares.get(key)
+    if share is None:
+        step = 1 if start <= end else -1
+        share = {
+            '_id': key,
+            'message_ids': range(start, end + step, step),
+            'delivery_plan': [],
+            'ephemeral': True
+        }
+        _range_shares[key] = share
+        while len(_range_shares) > _RANGE_CACHE_SIZE:
+            _range_shares.popitem(last=False)
+    else:
+        _range_shares.move_to_end(key)
+    share['protect_content'] = protect
+    return share
+
+
+def get_range_share_by_key(key: str):
+    """翻页回调使用；缓存已淘汰（或重启后）时校验签名后从 key 重新解析，签名不符返回 None"""
+    share = _range_shares.get(key)
+    if share is not None:
+        return share
+    match = _RANGE_KEY_RE.match(key)
+    if not match:
+        return None
+    start, end = int(match.group(1)), int(match.group(2))
+    if not hmac.compare_digest(match.group(3), _sign_range(start, end)):
+        return None
+    return get_range_share(start, end)
 
 
-async def _auto_delete(messages, notification, delay):
-    await asyncio.sleep(delay)
-    for msg in messages:
-        try:
-            await msg.delete()
-        except Exception:
-            pass
-    try:
-        await notification.delete()
-    except Exception:
-        pass
+def is_range_key(code: str):
+    return code.startswith('r') and '-' in code
 
 
 def build_share_page_buttons(code: str, page: int, total_pages: int):
@@ -207,106 +264,321 @@ def build_share_page_buttons(code: str, page: int, total_pages: int):
     return InlineKeyboardMarkup([buttons])
 
 
-async def send_share_page(client: Client, chat_id: int, share: dict, page: int, per_page: int = 10):
-    message_ids = share.get('message_ids', [])
-    if not message_ids:
-        return [], 1, 0
-
-    total_pages = (len(message_ids) + per_page - 1) // per_page
-    if total_pages <= 0:
-        return [], 1, 0
+# ============ 发送计划 ============
+_plan_rebuilding = set()
 
-    page = max(1, min(page, total_pages))
-    start = (page - 1) * per_page
-    end = start + per_page
-    selected_ids = message_ids[start:end]
 
+async def _rebuild_delivery_plan(client: Client, share: dict):
+    """后台为旧分享（或计划不完整的分享）补建发送计划"""
+    code = share['_id']
+    if code in _plan_rebuilding:
+        return
+    _plan_rebuilding.add(code)
     try:
-        msgs = await get_messages(client, selected_ids)
+        plan = await build_delivery_plan(client, share.get('message_ids', []))
+        await update_share(code, {'delivery_plan': plan})
+        share['delivery_plan'] = plan
+        logger.info(f"Delivery plan rebuilt for share {code}: {len(plan)} items")
     except Exception as e:
-        logger.error(f"Error getting share messages: {e}")
-        return [], page, total_pages
+        logger.error(f"Error rebuilding delivery plan for {code}: {e}")
+    finally:
+        _plan_rebuilding.discard(code)
+
+
+async def resolve_share_metas(client: Client, share: dict, selected_ids: list):
+    """优先从分享的发送计划取元数据，计划缺失的部分回退到消息缓存并在后台补建计划"""
+    by_id = {item['id']: item for item in share.get('delivery_plan') or []}
+    missing = [mid for mid in selected_ids if mid not in by_id]
+    fetched = {}
+    if missing:
+        # 范围分享把结果保存在自己的内存计划里，不占用消息缓存
+        for meta in await get_message_metas(client, missing, cache=not share.get('ephemeral')):
+            fetched[meta['id']] = meta
+        if share.get('ephemeral'):
+            share['delivery_plan'].extend(
+                meta_to_plan_item(fetched[mid]) if mid in fetched else {'id': mid, 'kind': 'empty'}
+                for mid in missing
+            )
+        else:
+            spawn(_rebuild_delivery_plan(client, share))
+
+    metas = []
+    for mid in selected_ids:
+        item = by_id.get(mid)
+        if item is not None:
+            if item['kind'] != 'empty':
+                metas.append(plan_item_to_meta(item))
+        elif mid in fetched:
+            metas.append(fetched[mid])
+    return metas
+
+
+async def _refresh_plan_items(client: Client, share: dict, metas: list):
+    """file_id 失效时重新拉取这些消息，并把新的计划项写回分享"""
+    ids = [m['id'] for m in metas]
+    message_cache.invalidate(client.db_channel.id, ids)
+    fresh = await get_message_metas(client, ids)
+    plan = share.get('delivery_plan') or []
+    if plan:
+        fresh_items = {m['id']: meta_to_plan_item(m) for m in fresh}
+        plan = [fresh_items.get(item['id'], item) for item in plan]
+        share['delivery_plan'] = plan
+        if share.get('ephemeral'):
+            return fresh
+        try:
+            await update_share(share['_id'], {'delivery_plan': plan})
+        except Exception as e:
+            logger.error(f"Error saving refreshed delivery plan for {share['_id']}: {e}")
+    return fresh
 
-    msgs = [m for m in msgs if m and not m.empty]
-    if not msgs:
-        return [], page, total_pages
 
-    protect = share.get('protect_content', PROTECT_CONTENT)
-    snt_msgs = []
+async def _send_meta(client: Client, chat_id: int, share: dict, meta: dict, protect: bool):
+    for attempt in range(2):
+        try:
+            return await delivery_scheduler.send(
+                chat_id, send_cached_message,
+                client, chat_id, meta,
+                caption=build_caption(meta),
+                reply_markup=meta['reply_markup'] if DISABLE_CHANNEL_BUTTON else None,
+                protect=protect
+            )
+        except STALE_FILE_ERRORS:
+            if attempt:
+                raise
+            fresh = await _refresh_plan_items(client, share, [meta])
+            if not fresh:
+                raise
+            meta = fresh[0]
+
+
+# ============ 翻页预取 ============
+_PREFETCH_TTL = 120
+_prefetched = {}  # (code, page) -> (expires_at, share, metas)
+_prefetching = {}  # (code, page) -> 预取进行中分享是否被修改，被修改则丢弃结果
+
 
-    can_album = len(msgs) > 1 and all((m.photo or m.video) and not m.document for m in msgs)
-    if can_album:
-        media = []
-        for i, m in enumerate(msgs):
-            caption = None
-            if i == 0:
-                caption = m.caption.html if m.caption else ""
-                if SHOW_PROMO and PROMO_TEXT:
-                    caption = (caption or "") + PROMO_TEXT
-
-            if m.photo:
-                media.append(InputMediaPhoto(m.photo.file_id, caption=caption, parse_mode=ParseMode.HTML))
-            elif m.video:
-                media.append(InputMediaVideo(m.video.file_id, caption=caption, parse_mode=ParseMode.HTML))
+def _evict_prefetched(key, expires_at):
+    item = _prefetched.get(key)
+    if item and item[0] <= expires_at:
+        del _prefetched[key]
 
+
+async def _prefetch_share_page(client: Client, share: dict, page: int, per_page: int):
+    code = share['_id']
+    key = (code, page)
+    if key in _prefetched or key in _prefetching:
+        return
+    _prefetching[key] = False
+    message_ids = share.get('message_ids', [])
+    selected_ids = message_ids[(page - 1) * per_page:page * per_page]
+    try:
+        metas = await resolve_share_metas(client, share, selected_ids)
+    except Exception as e:
+        logger.warning(f"Prefetch failed for share {code} page {page}: {e}")
+        return
+    finally:
+        changed = _prefetching.pop(key, False)
+    if changed:
+        return
+    expires_at = time.monotonic() + _PREFETCH_TTL
+    _prefetched[key] = (expires_at, share, metas)
+    asyncio.get_event_loop().call_later(_PREFETCH_TTL, _evict_prefetched, key, expires_at)
+
+
+def get_prefetched_share(code: str, page: int):
+    """翻页回调优先使用预取的分享文档，未预取或已过期返回 None"""
+    item = _prefetched.get((code, page))
+    if item and item[0] > time.monotonic():
+        return item[1]
+    return None
+
+
+def drop_prefetched(code: str):
+    for key in [k for k in _prefetched if k[0] == code]:
+        del _prefetched[key]
+
+
+def _on_share_changed(code: str, updates=None):
+    # 发送计划由本模块原地更新到预取的分享文档上，无需丢弃
+    if updates is not None and set(updates) <= {'delivery_plan', 'updated_at'}:
+        return
+    for key in _prefetching:
+        if key[0] == code:
+            _prefetching[key] = True
+    drop_prefetched(code)
+
+
+share_listeners.append(_on_share_changed)
+
+
+# ============ 相册分组 ============
+_INPUT_MEDIA = {
+    'photo': InputMediaPhoto,
+    'video': InputMediaVideo,
+    'document': InputMediaDocument,
+    'audio': InputMediaAudio
+}
+
+
+def group_albums(metas: list, limit: int = 10):
+    """按顺序把同一相册类型（图片/视频、文档、音频）的连续消息合并为最多 limit 条的相册，其余单独发送"""
+    groups = []
+    current = []
+    for meta in metas:
+        album = meta.get('album')
+        if current and album and album == current[0].get('album') and len(current) < limit:
+            current.append(meta)
+            continue
+        if current:
+            groups.append(current)
+        current = [meta]
+    if current:
+        groups.append(current)
+    return groups
+
+
+def _build_album_media(group: list):
+    media = []
+    for i, m in enumerate(group):
+        if m['kind'] == 'document' and CUSTOM_CAPTION:
+            caption = CUSTOM_CAPTION.format(previouscaption=m['caption'], filename=m['file_name'])
+        else:
+            caption = m['caption']
+        if i == 0 and SHOW_PROMO and PROMO_TEXT:
+            caption = (caption or "") + PROMO_TEXT
+        media.append(_INPUT_MEDIA[m['kind']](m['file_id'], caption=caption, parse_mode=ParseMode.HTML))
+    return media
+
+
+async def _send_album(client: Client, chat_id: int, share: dict, group: list, protect: bool):
+    """发送一个相册；file_id 失效时刷新后重试一次，失败返回空列表由调用方逐条发送"""
+    for attempt in range(2):
+        media = _build_album_media(group)
         try:
-            snt_msgs = await client.send_media_group(
+            return await delivery_scheduler.send(
+                chat_id, client.send_media_group,
                 chat_id=chat_id,
                 media=media,
                 protect_content=protect
             )
+        except STALE_FILE_ERRORS:
+            if attempt:
+                logger.error("Error sending media group: file reference still stale after refresh")
+                return []
+            fresh = await _refresh_plan_items(client, share, group)
+            if len(fresh) != len(group):
+                return []
+            group = fresh
         except TypeError:
             try:
-                snt_msgs = await client.send_media_group(
+                return await delivery_scheduler.send(
+                    chat_id, client.send_media_group,
                     chat_id=chat_id,
                     media=media
                 )
             except Exception as e:
                 logger.error(f"Error sending media group (fallback): {e}")
-                snt_msgs = []
+                return []
         except Exception as e:
             logger.error(f"Error sending media group: {e}")
-            snt_msgs = []
-
-    if not snt_msgs:
-        for msg in msgs:
-            if bool(CUSTOM_CAPTION) and bool(msg.document):
-                caption = CUSTOM_CAPTION.format(
-                    previouscaption="" if not msg.caption else msg.caption.html,
-                    filename=msg.document.file_name
-                )
+            return []
+    return []
+
+
+# ============ 分块流式发送 ============
+FETCH_CHUNK_SIZE = 5
+
+
+async def _fetch_meta_chunks(client: Client, share: dict, selected_ids, queue: asyncio.Queue):
+    """生产者：逐块解析元数据放入有界队列，None 表示结束，异常对象表示失败"""
+    try:
+        for i in range(0, len(selected_ids), FETCH_CHUNK_SIZE):
+            chunk = list(selected_ids[i:i + FETCH_CHUNK_SIZE])
+            await queue.put(await resolve_share_metas(client, share, chunk))
+        await queue.put(None)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        await queue.put(e)
+
+
+async def iter_page_groups(client: Client, share: dict, selected_ids, metas=None):
+    """按发送顺序产出相册分组；拉取下一块与发送当前块并行，内存中最多保留两块元数据。
+    末尾未满的相册可能与下一块连成一组，等下一块到达后再产出。
+    首块拉取失败时抛出异常，之后的失败只记录日志并结束"""
+    if metas is not None:
+        for group in group_albums(metas):
+            yield group
+        return
+
+    queue = asyncio.Queue(maxsize=1)
+    producer = asyncio.create_task(_fetch_meta_chunks(client, share, selected_ids, queue))
+    pending = []
+    received = False
+    try:
+        while True:
+            chunk = await queue.get()
+            if chunk is None:
+                break
+            if isinstance(chunk, Exception):
+                if not received:
+                    raise chunk
+                logger.error(f"Error getting share messages for {share['_id']}: {chunk}")
+                break
+            received = True
+            pending.extend(chunk)
+            groups = group_albums(pending)
+            tail = groups[-1] if groups else []
+            if tail and tail[0].get('album') and len(tail) < 10:
+                groups.pop()
+                pending = tail
             else:
-                caption = "" if not msg.caption else msg.caption.html
+                pending = []
+            for group in groups:
+                yield group
+    finally:
+        producer.cancel()
 
-            if SHOW_PROMO and PROMO_TEXT:
-                caption += PROMO_TEXT
+    for group in group_albums(pending):
+        yield group
 
-            reply_markup = msg.reply_markup if DISABLE_CHANNEL_BUTTON else None
 
-            try:
-                snt_msg = await msg.copy(
-                    chat_id=chat_id,
-                    caption=caption,
-                    parse_mode=ParseMode.HTML,
-                    reply_markup=reply_markup,
-                    protect_content=protect
-                )
-                snt_msgs.append(snt_msg)
-                await asyncio.sleep(0.5)
-            except FloodWait as e:
-                await asyncio.sleep(e.value)
+async def send_share_page(client: Client, chat_id: int, share: dict, page: int, per_page: int = 10):
+    message_ids = share.get('message_ids', [])
+    if not message_ids:
+        return [], 1, 0
+
+    total_pages = (len(message_ids) + per_page - 1) // per_page
+    if total_pages <= 0:
+        return [], 1, 0
+
+    page = max(1, min(page, total_pages))
+    start = (page - 1) * per_page
+    end = start + per_page
+    selected_ids = message_ids[start:end]
+
+    prefetched = _prefetched.pop((share['_id'], page), None)
+    metas = prefetched[2] if prefetched and prefetched[0] > time.monotonic() else None
+
+    if page < total_pages:
+        spawn(_prefetch_share_page(client, share, page + 1, per_page))
+
+    protect = share.get('protect_content', PROTECT_CONTENT)
+    snt_msgs = []
+
+    try:
+        async for group in iter_page_groups(client, share, selected_ids, metas):
+            if len(group) > 1:
+                sent = await _send_album(client, chat_id, share, group, protect)
+                if sent:
+                    snt_msgs.extend(sent)
+                    continue
+            for meta in group:
                 try:
-                    snt_msg = await msg.copy(
-                        chat_id=chat_id,
-                        caption=caption,
-                        parse_mode=ParseMode.HTML,
-                        reply_markup=reply_markup,
-                        protect_content=protect
-                    )
-                    snt_msgs.append(snt_msg)
-                except Exception as e2:
-                    logger.error(f"Error copying after flood wait: {e2}")
-            except Exception as e:
-                logger.error(f"Error copying share message: {e}")
+                    snt_msgs.append(await _send_meta(client, chat_id, share, meta, protect))
+                except Exception as e:
+                    logger.error(f"Error copying share message: {e}")
+    except Exception as e:
+        logger.error(f"Error getting share messages: {e}")
 
     return snt_msgs, page, total_pages
@@ -3,13 +3,16 @@ from pyrogram import Client
 from pyrogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 
 from bot import Bot
-from config import ADMINS
-from helper_func import generate_share_code
+from config import ADMINS, AUTO_DELETE_TIME
+from helper_func import generate_share_code, build_delivery_plan, auto_delete_scheduler
 from database.database import (
     create_share, get_share, update_share, delete_share,
-    get_user_shares, increment_stat
+    get_user_shares, increment_stat, get_unique_viewers, get_share_analytics
+)
+from plugins.share import (
+    user_share_sessions, send_share_page, build_share_page_buttons,
+    get_prefetched_share, get_range_share_by_key, is_range_key
 )
-from plugins.share import user_share_sessions, send_share_page, build_share_page_buttons
 
 logger = logging.getLogger(__name__)
 
@@ -50,13 +53,21 @@ async def share_callback_handler(client: Client, query: CallbackQuery):
         while await get_share(share_code):
             share_code = generate_share_code()
 
+        try:
+            delivery_plan = await build_delivery_plan(client, session['messages'], metas=session.get('metas'))
+        except Exception as e:
+            # 计划留空，首次访问时后台补建
+            logger.warning(f"Error building delivery plan for {share_code}: {e}")
+            delivery_plan = []
+
         await create_share(
             share_code=share_code,
             owner_id=user_id,
             message_ids=session['messages'],
             title=session['title'] or f"分享-{share_code}",
             protect_content=session['protect'],
-            group_text=""
+            group_text="",
+            delivery_plan=delivery_plan
         )
 
         await increment_stat('links_generated')
@@ -95,7 +106,9 @@ async def share_callback_handler(client: Client, query: CallbackQuery):
         except Exception:
             page = 1
 
-        share = await get_share(code)
+        share = get_prefetched_share(code, page)
+        if not share:
+            share = get_range_share_by_key(code) if is_range_key(code) else await get_share(code)
         if not share:
             return await query.answer("❌ 分享不存在！", show_alert=True)
 
@@ -105,6 +118,12 @@ async def share_callback_handler(client: Client, query: CallbackQuery):
         if not snt_msgs:
             return await query.answer("❌ 无可发送的文件。", show_alert=True)
 
+        # 翻页按钮和提示在第一页时已加入自动删除，这里只需加入本页文件
+        if AUTO_DELETE_TIME > 0:
+            await auto_delete_scheduler.schedule(
+                query.from_user.id, [m.id for m in snt_msgs], AUTO_DELETE_TIME
+            )
+
         await query.message.edit_text(
             f"📄 第 {page}/{total_pages} 页",
             reply_markup=build_share_page_buttons(code, page, total_pages)
@@ -126,12 +145,16 @@ async def share_callback_handler(client: Client, query: CallbackQuery):
              InlineKeyboardButton("⬅️ 返回", callback_data="my_shares_1")]
         ])
 
+        analytics = await get_share_analytics(code, days=7)
+        trend = " ".join(str(d['unique']) for d in analytics['daily'])
         await query.message.edit_text(
             f"📄 <b>分享详情</b>\n\n"
             f"📌 分享码：<code>{code}</code>\n"
             f"📝 标题：{share.get('title', '未命名')}\n"
             f"📁 文件数：{len(share.get('message_ids', []))}\n"
             f"👁 查看次数：{share.get('access_count', 0)}\n"
+            f"👤 独立访客：约 {analytics['unique_viewers']} 人\n"
+            f"📈 近7天访客：<code>{trend}</code>\n"
             f"🔒 禁止转发：{'是' if share.get('protect_content') else '否'}\n"
             f"📅 创建时间：{share.get('created_at', '未知')}",
             reply_markup=btn
@@ -197,6 +220,7 @@ async def share_callback_handler(client: Client, query: CallbackQuery):
             return await query.message.edit_text("📭 没有找到任何分享。")
 
         text = f"📋 <b>我的分享</b>（第 {page} 页，共 {total} 个）\n\n"
+        uniques = await get_unique_viewers([share['_id'] for share in shares])
         buttons = []
         for share in shares:
             code = share['_id']
@@ -205,7 +229,7 @@ async def share_callback_handler(client: Client, query: CallbackQuery):
             protect = "🔒" if share.get('protect_content') else "🔓"
             files = len(share.get('message_ids', []))
             text += f"{protect} <code>{code}</code> - {title}\n"
-            text += f"   📁 {files} 个文件 | 👁 {access} 次查看\n\n"
+            text += f"   📁 {files} 个文件 | 👁 {access} 次查看 | 👤 {uniques.get(code, 0)} 人\n\n"
             buttons.append([
                 InlineKeyboardButton(f"📄 {code}", callback_data=f"share_detail_{code}"),
                 InlineKeyboardButton("🗑", callback_data=f"share_delete_{code}")
@@ -6,23 +6,21 @@ import time
 import re
 
 from pyrogram import Client, filters
-from pyrogram.enums import ParseMode
-from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
-from pyrogram.errors import FloodWait, UserIsBlocked, InputUserDeactivated
+from pyrogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 
 from bot import Bot
 import config as cfg
 from helper_func import (
-    subscribed, not_banned, decode, get_messages,
+    subscribed, not_banned, decode,
     get_shortlink, get_verify_status, update_verify_status,
     get_exp_time, rate_limiter, parse_buttons, ALL_COMMANDS,
-    send_force_sub_prompt
+    send_force_sub_prompt, broadcast_manager
 )
 from database.database import (
-    add_user, del_user, full_userbase, present_user,
-    get_share, increment_share_access, increment_stat
+    register_user, get_user_count,
+    get_share, increment_stat
 )
-from plugins.share import handle_share_code
+from plugins.share import handle_share_code, deliver_first_page, get_range_share
 
 logger = logging.getLogger(__name__)
 
@@ -42,91 +40,6 @@ def build_start_buttons():
     return InlineKeyboardMarkup(buttons)
 
 
-async def send_files_to_user(client, message, message_ids, protect=False):
-    """发送文件给用户，支持自动删除"""
-    try:
-        msgs = await get_messages(client, message_ids)
-    except Exception as e:
-        logger.error(f"Error getting messages: {e}")
-        await message.reply_text("❌ 出了点问题，请稍后再试！")
-        return []
-
-    # 过滤空消息
-    msgs = [m for m in msgs if m and not m.empty]
-    if not msgs:
-        await message.reply_text("❌ 文件已不存在或已被删除。")
-        return []
-
-    snt_msgs = []
-    for msg in msgs:
-        if bool(cfg.CUSTOM_CAPTION) and bool(msg.document):
-            caption = cfg.CUSTOM_CAPTION.format(
-                previouscaption="" if not msg.caption else msg.caption.html,
-                filename=msg.document.file_name
-            )
-        else:
-            caption = "" if not msg.caption else msg.caption.html
-
-        if cfg.SHOW_PROMO and cfg.PROMO_TEXT:
-            caption += cfg.PROMO_TEXT
-
-        if cfg.DISABLE_CHANNEL_BUTTON:
-            reply_markup = msg.reply_markup
-        else:
-            reply_markup = None
-
-        try:
-            snt_msg = await msg.copy(
-                chat_id=message.from_user.id,
-                caption=caption,
-                parse_mode=ParseMode.HTML,
-                reply_markup=reply_markup,
-                protect_content=protect
-            )
-            await asyncio.sleep(0.5)
-            snt_msgs.append(snt_msg)
-        except FloodWait as e:
-            await asyncio.sleep(e.value)
-            try:
-                snt_msg = await msg.copy(
-                    chat_id=message.from_user.id,
-                    caption=caption,
-                    parse_mode=ParseMode.HTML,
-                    reply_markup=reply_markup,
-                    protect_content=protect
-                )
-                snt_msgs.append(snt_msg)
-            except Exception as e2:
-                logger.error(f"Error copying message after flood wait: {e2}")
-        except Exception as e:
-            logger.error(f"Error copying message: {e}")
-
-    if cfg.AUTO_DELETE_TIME > 0 and snt_msgs:
-        time_str = get_exp_time(cfg.AUTO_DELETE_TIME)
-        notification = await message.reply(
-            cfg.AUTO_DELETE_MSG.format(time=time_str), quote=True
-        )
-        asyncio.get_event_loop().create_task(
-            auto_delete_messages(snt_msgs, notification, cfg.AUTO_DELETE_TIME)
-        )
-
-    return snt_msgs
-
-
-async def auto_delete_messages(messages, notification, delay):
-    """自动删除消息的后台任务"""
-    await asyncio.sleep(delay)
-    for msg in messages:
-        try:
-            await msg.delete()
-        except Exception:
-            pass
-    try:
-        await notification.delete()
-    except Exception:
-        pass
-
-
 async def handle_link_access(client, message, base64_string, protect=False):
     """处理 Base64 链接访问"""
     try:
@@ -141,25 +54,23 @@ async def handle_link_access(client, message, base64_string, protect=False):
             end = int(int(argument[2]) / abs(client.db_channel.id))
         except Exception:
             return
-        if start <= end:
-            ids = list(range(start, end + 1))
-        else:
-            ids = list(range(start, end - 1, -1))
     elif len(argument) == 2:
         try:
-            ids = [int(int(argument[1]) / abs(client.db_channel.id))]
+            start = end = int(int(argument[1]) / abs(client.db_channel.id))
         except Exception:
             return
     else:
         return
 
+    share = get_range_share(start, end, protect)
     temp_msg = await message.reply("⏳ 请稍候...")
-    snt_msgs = await send_files_to_user(client, message, ids, protect)
+    snt_msgs = await deliver_first_page(client, message, share)
     try:
         await temp_msg.delete()
     except Exception:
         pass
-    await increment_stat('files_shared', len(snt_msgs))
+    if not snt_msgs:
+        await message.reply_text("❌ 文件已不存在或已被删除。")
 
 
 # ============ /start 命令（已订阅用户） ============
@@ -168,11 +79,7 @@ async def start_command(client: Client, message: Message):
     user_id = message.from_user.id
 
     # 添加用户
-    if not await present_user(user_id):
-        try:
-            await add_user(user_id)
-        except Exception as e:
-            logger.error(f"Error adding user {user_id}: {e}")
+    register_user(user_id)
 
     # ========== 管理员直通 ==========
     if user_id in cfg.ADMINS:
@@ -304,8 +211,8 @@ REPLY_ERROR = """<code>请回复一条消息来使用此命令。</code>"""
 @Bot.on_message(filters.command('users') & filters.private & filters.user(cfg.ADMINS), group=2)
 async def get_users(client: Bot, message: Message):
     msg = await client.send_message(chat_id=message.chat.id, text=WAIT_MSG)
-    users = await full_userbase()
-    await msg.edit(f"👥 当前共有 {len(users)} 位用户使用本机器人")
+    total = await get_user_count()
+    await msg.edit(f"👥 当前共有 {total} 位用户使用本机器人")
 
 
 @Bot.on_message(filters.private & filters.command('broadcast') & filters.user(cfg.ADMINS), group=2)
@@ -316,54 +223,31 @@ async def send_text(client: Bot, message: Message):
         await msg.delete()
         return
 
-    broadcast_msg = message.reply_to_message
-    btn_markup = None
-
+    buttons = []
     if len(message.command) > 1:
-        btn_text = " ".join(message.command[1:])
-        btn_rows = parse_buttons(btn_text)
-        if btn_rows:
-            btn_markup = InlineKeyboardMarkup(btn_rows)
-
-    query = await full_userbase()
-    total = 0
-    successful = 0
-    blocked = 0
-    deleted = 0
-    unsuccessful = 0
-
-    pls_wait = await message.reply("<i>📢 正在广播消息...这可能需要一些时间</i>")
-
-    for chat_id in query:
-        try:
-            await broadcast_msg.copy(chat_id, reply_markup=btn_markup)
-            successful += 1
-        except FloodWait as e:
-            await asyncio.sleep(e.value)
-            try:
-                await broadcast_msg.copy(chat_id, reply_markup=btn_markup)
-                successful += 1
-            except Exception:
-                unsuccessful += 1
-        except UserIsBlocked:
-            await del_user(chat_id)
-            blocked += 1
-        except InputUserDeactivated:
-            await del_user(chat_id)
-            deleted += 1
-        except Exception as e:
-            logger.error(f"Error broadcasting to {chat_id}: {e}")
-            unsuccessful += 1
-        total += 1
-
-    await increment_stat('broadcasts')
-
-    status = f"""<b><u>📢 广播完成</u>
-
-总用户数：<code>{total}</code>
-发送成功：<code>{successful}</code>
-已屏蔽机器人：<code>{blocked}</code>
-已注销账户：<code>{deleted}</code>
-发送失败：<code>{unsuccessful}</code></b>"""
-
-    return await pls_wait.edit(status)
+        btn_rows = parse_buttons(" ".join(message.command[1:]))
+        buttons = [[[btn.text, btn.url] for btn in row] for row in btn_rows]
+
+    pls_wait = await message.reply("<i>📢 正在创建广播任务...</i>")
+    job = await broadcast_manager.create(
+        client,
+        source_message=message.reply_to_message,
+        buttons=buttons,
+        progress_message=pls_wait,
+        started_by=message.from_user.id
+    )
+    logger.info(f"Broadcast {job['_id']} started by {message.from_user.id}, {job['total']} users")
+
+
+@Bot.on_callback_query(filters.regex(r'^bc_(pause|resume|cancel)_') & filters.user(cfg.ADMINS), group=1)
+async def broadcast_control(client: Bot, query: CallbackQuery):
+    _, action, job_id = query.data.split('_', 2)
+    status = {'pause': 'paused', 'resume': 'running', 'cancel': 'cancelled'}[action]
+    job = await broadcast_manager.set_status(job_id, status)
+    if not job:
+        return await query.answer("任务不存在或已结束", show_alert=True)
+    await query.answer({'paused': "已暂停", 'running': "已继续", 'cancelled': "已取消"}[status])
+    try:
+        await query.message.edit_reply_markup(broadcast_manager.progress_buttons(job))
+    except Exception:
+        pass
@@ -7,8 +7,9 @@ from config import ADMINS, BOT_STATS_TEXT
 from datetime import datetime
 from helper_func import get_readable_time, not_banned, ALL_COMMANDS, subscribed
 from database.database import (
-    add_user, present_user, full_userbase, get_all_stats,
-    get_total_shares, get_banned_count, get_recent_users
+    register_user, get_user_count, get_all_stats,
+    get_total_shares, get_banned_count, get_recent_users,
+    get_stat_series, sum_stat_series
 )
 
 logger = logging.getLogger(__name__)
@@ -20,18 +21,22 @@ async def stats(bot: Bot, message: Message):
     delta = now - bot.uptime
     uptime = get_readable_time(delta.seconds)
 
-    users = await full_userbase()
+    total_users = await get_user_count()
     all_stats = await get_all_stats()
     total_shares = await get_total_shares()
     banned_count = await get_banned_count()
     recent_users = await get_recent_users(7)
+    hourly = await get_stat_series('hour', 24)
+    last_hour = hourly[-1]['counts']
+    last_day = sum_stat_series(hourly)
+    last_week = sum_stat_series(await get_stat_series('day', 7))
 
     text = f"""📊 <b>机器人统计</b>
 
 ⏱ <b>运行时间：</b>{uptime}
 
 👥 <b>用户统计：</b>
-   ├ 总用户数：<code>{len(users)}</code>
+   ├ 总用户数：<code>{total_users}</code>
    ├ 新增（7天）：<code>{recent_users}</code>
    └ 已封禁：<code>{banned_count}</code>
 
@@ -44,6 +49,12 @@ async def stats(bot: Bot, message: Message):
    ├ 分享被访问：<code>{all_stats.get('share_accessed', 0)}</code>
    ├ 验证通过：<code>{all_stats.get('tokens_verified', 0)}</code>
    └ 广播次数：<code>{all_stats.get('broadcasts', 0)}</code>
+
+📉 <b>近期趋势（本小时 / 24小时 / 7天）：</b>
+   ├ 分享被访问：<code>{last_hour.get('share_accessed', 0)} / {last_day.get('share_accessed', 0)} / {last_week.get('share_accessed', 0)}</code>
+   ├ 已分享文件：<code>{last_hour.get('files_shared', 0)} / {last_day.get('files_shared', 0)} / {last_week.get('files_shared', 0)}</code>
+   ├ 已生成链接：<code>{last_hour.get('links_generated', 0)} / {last_day.get('links_generated', 0)} / {last_week.get('links_generated', 0)}</code>
+   └ 验证通过：<code>{last_hour.get('tokens_verified', 0)} / {last_day.get('tokens_verified', 0)} / {last_week.get('tokens_verified', 0)}</code>
 """
     await message.reply(text, quote=True)
 
@@ -78,12 +89,4 @@ async def useless(client, message: Message):
     if not message.from_user:
         return
 
-    user_id = message.from_user.id
-
-    if not await present_user(user_id):
-        try:
-            await add_user(user_id)
-        except Exception as e:
-            logger.error(f"Error adding user {user_id}: {e}")
-
-    return
+    register_user(message.from_user.id)
@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+# 导入 database 模块时会创建 Mongo 客户端（不会立即连接），只需要一个格式正确的地址
+os.environ.setdefault("DATABASE_URL", "mongodb://localhost:27017")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class BulkCollection:
+    """只记录 bulk_write 操作的假集合，fail 为真时写入失败"""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.ops = []
+
+    async def bulk_write(self, ops, ordered=True):
+        if self.fail:
+            raise ConnectionError("write failed")
+        self.ops.extend(ops)
+
+
+@pytest.fixture
+def bulk_collection():
+    return BulkCollection
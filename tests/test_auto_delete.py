@@ -0,0 +1,96 @@
+import asyncio
+import time
+
+import database.database as db
+from helper_func import AutoDeleteScheduler
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, field, direction):
+        self.docs = sorted(self.docs, key=lambda doc: doc[field], reverse=direction < 0)
+        return self
+
+    def limit(self, n):
+        self.docs = self.docs[:n]
+        return self
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for doc in self.docs:
+            yield doc
+
+
+class FakeQueue:
+    def __init__(self):
+        self.docs = {}
+        self.next_id = 0
+
+    async def insert_one(self, doc):
+        self.next_id += 1
+        self.docs[self.next_id] = {'_id': self.next_id, **doc}
+
+    def find(self, query, projection=None):
+        bound = query.get('delete_at', {}).get('$lte', float('inf'))
+        return FakeCursor([doc for doc in self.docs.values() if doc['delete_at'] <= bound])
+
+    async def delete_many(self, query):
+        for doc_id in query['_id']['$in']:
+            self.docs.pop(doc_id, None)
+
+
+class FakeClient:
+    def __init__(self):
+        self.deleted = []
+
+    async def delete_messages(self, chat_id, ids):
+        self.deleted.append((chat_id, list(ids)))
+
+
+def test_due_jobs_are_batched_per_chat(monkeypatch):
+    queue = FakeQueue()
+    monkeypatch.setattr(db, 'delete_queue', queue)
+    scheduler = AutoDeleteScheduler()
+    scheduler.client = FakeClient()
+
+    async def scenario():
+        await scheduler.schedule(1, list(range(1, 81)), 0)
+        await scheduler.schedule(2, [500, 501], 0)
+        await scheduler.schedule(1, list(range(81, 151)), 0)
+        await scheduler.schedule(1, [999], 3600)
+        await scheduler._process_due()
+
+    asyncio.run(scenario())
+    assert scheduler.client.deleted == [
+        (1, list(range(1, 101))),
+        (1, list(range(101, 151))),
+        (2, [500, 501]),
+    ]
+    # 未到期的任务保留在队列里
+    assert [doc['message_ids'] for doc in queue.docs.values()] == [[999]]
+
+
+def test_restart_reloads_due_jobs(monkeypatch):
+    queue = FakeQueue()
+    monkeypatch.setattr(db, 'delete_queue', queue)
+    # 上一个进程写入、在停机期间到期的任务
+    queue.docs[1] = {'_id': 1, 'chat_id': 7, 'message_ids': [10, 11], 'delete_at': time.time() - 60}
+    queue.docs[2] = {'_id': 2, 'chat_id': 7, 'message_ids': [12], 'delete_at': time.time() + 0.05}
+    client = FakeClient()
+
+    async def scenario():
+        scheduler = AutoDeleteScheduler(poll_interval=30)
+        scheduler.start(client)
+        await asyncio.sleep(0.01)
+        assert client.deleted == [(7, [10, 11])]
+        # 下一次到期时间由队列决定，不必等满轮询间隔
+        await asyncio.sleep(0.1)
+        await scheduler.stop()
+
+    asyncio.run(scenario())
+    assert client.deleted == [(7, [10, 11]), (7, [12])]
+    assert not queue.docs
@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+
+from database.database import BackgroundTask, PeriodicFlusher
+
+
+class CountingFlusher(PeriodicFlusher):
+    def __init__(self, interval):
+        super().__init__(interval)
+        self.flushes = 0
+        self.fail_next = False
+
+    async def flush(self):
+        self.flushes += 1
+        if self.fail_next:
+            self.fail_next = False
+            raise RuntimeError("boom")
+
+
+def test_flusher_ticks_survives_errors_and_flushes_on_stop():
+    async def scenario():
+        flusher = CountingFlusher(0.01)
+        flusher.fail_next = True
+        flusher.start()
+        first_task = flusher.task
+        flusher.start()
+        assert flusher.task is first_task
+        await asyncio.sleep(0.05)
+        ticks = flusher.flushes
+        await flusher.stop()
+        return ticks, flusher
+
+    ticks, flusher = asyncio.run(scenario())
+    assert ticks >= 2
+    assert flusher.flushes == ticks + 1
+    assert flusher.task is None
+
+
+def test_base_classes_require_loop_and_flush():
+    with pytest.raises(TypeError):
+        BackgroundTask()
+    with pytest.raises(TypeError):
+        PeriodicFlusher(1)
@@ -0,0 +1,37 @@
+import asyncio
+import io
+import json
+from datetime import datetime
+
+from plugins.backup import write_backup
+
+
+async def ids(values):
+    for value in values:
+        yield value
+
+
+def run(backup_data, users):
+    f = io.StringIO()
+    total = asyncio.run(write_backup(f, backup_data, ids(users)))
+    return total, f.getvalue()
+
+
+def test_backup_round_trips_through_json():
+    backup_data = {
+        "timestamp": "2024-01-01T00:00:00",
+        "stats": {"links_generated": 3, "at": datetime(2024, 1, 1)},
+        "banned_users": [{"id": 7, "reason": "spam\n\"quoted\""}]
+    }
+    total, text = run(backup_data, [1, 2, 3])
+    data = json.loads(text)
+    assert total == 3
+    assert data["users"] == [1, 2, 3] and data["total_users"] == 3
+    assert data["banned_users"] == backup_data["banned_users"]
+    assert data["stats"] == {"links_generated": 3, "at": "2024-01-01 00:00:00"}
+
+
+def test_empty_backup_is_valid_json():
+    total, text = run({"stats": {}, "banned_users": []}, [])
+    assert total == 0
+    assert json.loads(text) == {"stats": {}, "banned_users": [], "users": [], "total_users": 0}
@@ -0,0 +1,96 @@
+import asyncio
+from types import SimpleNamespace
+
+import config as cfg
+import database.database as db
+import helper_func
+
+
+class FakeBanned:
+    def __init__(self):
+        self.docs = {}
+
+    async def update_one(self, query, update, upsert=False):
+        self.docs[query['_id']] = dict(update['$set'])
+
+    async def delete_one(self, query):
+        self.docs.pop(query['_id'], None)
+
+    def find(self, query=None, projection=None):
+        return self._iter()
+
+    async def _iter(self):
+        for user_id, doc in list(self.docs.items()):
+            yield {'_id': user_id, **doc}
+
+
+def shared_store(monkeypatch):
+    versions = {'banned_users': 0}
+
+    async def get_version(key):
+        return versions[key]
+
+    async def bump_version(key):
+        versions[key] += 1
+        return versions[key]
+
+    monkeypatch.setattr(db, 'banned_users', FakeBanned())
+    monkeypatch.setattr(db, 'get_version', get_version)
+    monkeypatch.setattr(db, 'bump_version', bump_version)
+    return versions
+
+
+def test_other_instance_reloads_after_version_bump(monkeypatch):
+    versions = shared_store(monkeypatch)
+
+    async def scenario():
+        local, remote = db.BannedUserSet(), db.BannedUserSet(sync_interval=0.01)
+        monkeypatch.setattr(db, 'banned_set', local)
+        await local.load()
+        await remote.load()
+        remote.start()
+
+        await db.ban_user(5, "spam")
+        # 本实例直接更新，版本号同步后不会触发自身重载
+        assert local.get(5) == "spam" and local.version == versions['banned_users'] == 1
+        await asyncio.sleep(0.05)
+        assert 5 in remote and remote.version == 1
+
+        await db.unban_user(5)
+        await asyncio.sleep(0.05)
+        await remote.stop()
+        return local, remote
+
+    local, remote = asyncio.run(scenario())
+    assert 5 not in local and 5 not in remote
+    assert remote.version == 2
+
+
+def test_ban_reply_is_throttled_per_user(monkeypatch):
+    banned = db.BannedUserSet()
+    banned.reasons = {7: "spam"}
+    banned.loaded = True
+    monkeypatch.setattr(helper_func, 'banned_set', banned)
+    monkeypatch.setattr(helper_func, '_ban_replied', {})
+    monkeypatch.setattr(cfg, 'BAN_REPLY_INTERVAL', 300)
+    replies = []
+
+    async def reply(text, quote=False):
+        replies.append(text)
+
+    def update(user_id):
+        return SimpleNamespace(from_user=SimpleNamespace(id=user_id), reply=reply)
+
+    async def scenario():
+        results = [await helper_func.is_not_banned(None, None, update(7)) for _ in range(3)]
+        assert results == [False, False, False]
+        assert len(replies) == 1
+        assert await helper_func.is_not_banned(None, None, update(8))
+
+        # 超过限频窗口后再次提示
+        helper_func._ban_replied[7] -= 300
+        assert not await helper_func.is_not_banned(None, None, update(7))
+
+    asyncio.run(scenario())
+    assert len(replies) == 2
+    assert "spam" in replies[0]
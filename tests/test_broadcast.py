@@ -0,0 +1,79 @@
+import asyncio
+
+import helper_func
+from helper_func import BroadcastManager, BROADCAST_COUNTERS
+
+
+class FakeResults:
+    async def record(self, user_id, result):
+        pass
+
+    async def flush(self):
+        pass
+
+
+def make_job(**extra):
+    job = {'_id': 'job', 'status': 'running', 'cursor': None, 'total': 0, 'text': 'hi'}
+    job.update({key: 0 for key in BROADCAST_COUNTERS})
+    job.update(extra)
+    return job
+
+
+def run_broadcast(monkeypatch, users, job, fail_at=None):
+    queries, checkpoints, sent = [], [], []
+
+    async def get_user_id_batch(after_id=None, limit=100, active_only=False):
+        queries.append(after_id)
+        return [uid for uid in users if after_id is None or uid > after_id][:limit]
+
+    async def update_broadcast_job(job_id, updates):
+        checkpoints.append(dict(updates))
+
+    async def noop(*args, **kwargs):
+        pass
+
+    monkeypatch.setattr(helper_func, 'get_user_id_batch', get_user_id_batch)
+    monkeypatch.setattr(helper_func, 'update_broadcast_job', update_broadcast_job)
+    monkeypatch.setattr(helper_func, 'increment_stat', noop)
+    monkeypatch.setattr(helper_func.cfg, 'BROADCAST_BATCH_SIZE', 3, raising=False)
+    monkeypatch.setattr(helper_func.cfg, 'BROADCAST_CONCURRENCY', 2, raising=False)
+
+    manager = BroadcastManager()
+    manager.results = FakeResults()
+    manager._report = noop
+
+    async def send_one(job, source, reply_markup, user_id):
+        if user_id == fail_at:
+            raise RuntimeError("crash")
+        sent.append(user_id)
+        job['processed'] += 1
+
+    manager._send_one = send_one
+    asyncio.run(manager._run(job))
+    return queries, checkpoints, sent
+
+
+def test_broadcast_pages_with_keyset_queries(monkeypatch):
+    job = make_job()
+    queries, checkpoints, sent = run_broadcast(monkeypatch, list(range(1, 8)), job)
+    assert queries == [None, 3, 6, 7]
+    assert sent == list(range(1, 8))
+    assert job['status'] == 'done'
+    assert checkpoints[-1]['cursor'] == 7
+    assert checkpoints[-1]['acked'] == []
+
+
+def test_broadcast_resume_skips_acknowledged_users(monkeypatch):
+    job = make_job(cursor=2, acked=[4])
+    queries, checkpoints, sent = run_broadcast(monkeypatch, list(range(1, 8)), job)
+    assert sent == [3, 5, 6, 7]
+    assert job['status'] == 'done'
+
+
+def test_broadcast_checkpoints_contiguous_prefix(monkeypatch):
+    job = make_job()
+    run_broadcast(monkeypatch, [1, 2, 3, 4], job, fail_at=2)
+    # 2 号失败导致任务中止：cursor 停在 1，已完成但不连续的 3 记入 acked
+    assert job['status'] == 'failed'
+    assert job['cursor'] == 1
+    assert job['acked'] == [3]
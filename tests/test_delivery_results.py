@@ -0,0 +1,96 @@
+import asyncio
+from types import SimpleNamespace
+
+from pymongo import UpdateMany, UpdateOne
+from pyrogram.errors import PeerIdInvalid, UserIsBlocked
+
+import helper_func
+import database.database as db
+from helper_func import BroadcastManager, DeliveryResultBuffer, BROADCAST_COUNTERS
+
+
+class FakeUsers:
+    def __init__(self):
+        self.ops = []
+
+    async def bulk_write(self, ops, ordered=True):
+        self.ops.extend(ops)
+        return SimpleNamespace(upserted_count=sum(isinstance(op, UpdateOne) for op in ops))
+
+
+def broadcast_results(monkeypatch, error):
+    async def send(chat_id, func, *args, **kwargs):
+        if error is not None:
+            raise error
+
+    async def acquire():
+        pass
+
+    recorded = []
+
+    class Results:
+        async def record(self, user_id, result):
+            recorded.append(result)
+
+    monkeypatch.setattr(helper_func.delivery_scheduler, 'send', send)
+    manager = BroadcastManager()
+    manager.bucket.acquire = acquire
+    manager.results = Results()
+    manager.client = SimpleNamespace(send_message=None)
+    job = {'text': 'hi'}
+    job.update({key: 0 for key in BROADCAST_COUNTERS})
+    asyncio.run(manager._send_one(job, None, None, 1))
+    return recorded[0], job
+
+
+def test_only_permanent_errors_count_as_failed(monkeypatch):
+    assert broadcast_results(monkeypatch, None)[0] == 'ok'
+    assert broadcast_results(monkeypatch, UserIsBlocked())[0] == 'removed'
+    assert broadcast_results(monkeypatch, PeerIdInvalid())[0] == 'failed'
+    result, job = broadcast_results(monkeypatch, TimeoutError())
+    assert result == 'skipped'
+    assert job['failed'] == 1
+
+
+def test_skipped_results_are_not_written(monkeypatch):
+    calls = []
+
+    async def apply(removed, failed, recovered, max_failures):
+        calls.append((removed, failed, recovered))
+
+    monkeypatch.setattr(helper_func, 'apply_delivery_results', apply)
+    buffer = DeliveryResultBuffer(flush_size=100)
+
+    async def scenario():
+        for user_id, result in ((1, 'ok'), (2, 'skipped'), (3, 'failed'), (4, 'removed')):
+            await buffer.record(user_id, result)
+        await buffer.flush()
+
+    asyncio.run(scenario())
+    assert calls == [([4], [3], [1])]
+
+
+def test_returning_user_resets_failures(monkeypatch):
+    users = FakeUsers()
+    monkeypatch.setattr(db, 'user_data', users)
+    index = db.UserIndex()
+    index.loaded = True
+    monkeypatch.setattr(db.user_state, 'set', lambda *args: None)
+
+    async def bump_version(key):
+        return 1
+
+    monkeypatch.setattr(db, 'bump_version', bump_version)
+
+    async def scenario():
+        assert index.register(5) is True
+        assert index.register(5) is False
+        await index.flush()
+
+    asyncio.run(scenario())
+    upsert, reset = users.ops
+    assert isinstance(upsert, UpdateOne)
+    assert upsert._doc['$setOnInsert']['inactive'] is False
+    assert isinstance(reset, UpdateMany)
+    assert reset._filter == {'_id': {'$in': [5]}, 'fail_count': {'$gt': 0}}
+    assert reset._doc == {'$set': {'fail_count': 0, 'inactive': False}}
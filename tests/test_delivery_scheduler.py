@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+from pyrogram.errors import FloodWait
+
+from helper_func import TokenBucket, DeliveryScheduler
+
+
+def make_bucket(rate=2.0, capacity=4, now=100.0):
+    bucket = TokenBucket(rate, capacity)
+    bucket.updated = now
+    return bucket
+
+
+def test_bucket_allows_burst_then_waits_for_refill():
+    bucket = make_bucket()
+    for _ in range(4):
+        assert bucket.wait_time(100.0) == 0
+        bucket.consume()
+    assert bucket.wait_time(100.0) == pytest.approx(0.5)
+    assert bucket.wait_time(100.5) == 0
+
+
+def test_bucket_refill_is_capped_at_capacity():
+    bucket = make_bucket()
+    bucket.wait_time(1000.0)
+    assert bucket.tokens == 4
+
+
+def test_penalize_blocks_and_halves_rate_then_reward_recovers():
+    bucket = make_bucket(rate=16.0, capacity=16)
+    bucket.penalize(100.0, 10)
+    assert bucket.wait_time(105.0) == pytest.approx(5.0)
+    assert bucket.rate == 8.0
+    for _ in range(20):
+        bucket.reward()
+    assert bucket.rate == 16.0
+
+
+def test_penalize_rate_floor():
+    bucket = make_bucket(rate=16.0, capacity=16)
+    for _ in range(10):
+        bucket.penalize(100.0, 1)
+    assert bucket.rate == 1.0
+
+
+def test_scheduler_retries_flood_wait_then_raises():
+    scheduler = DeliveryScheduler(global_rate=1000, chat_rate=1000, chat_burst=10, max_retries=1)
+    calls = []
+
+    async def send():
+        calls.append(1)
+        raise FloodWait(value=0)
+
+    with pytest.raises(FloodWait):
+        asyncio.run(scheduler.send(1, send))
+    assert len(calls) == 2
+    assert scheduler._chat_bucket(1).rate < 1000
+
+
+def test_scheduler_returns_result():
+    scheduler = DeliveryScheduler(global_rate=1000, chat_rate=1000, chat_burst=10)
+
+    async def send(value):
+        return value * 2
+
+    assert asyncio.run(scheduler.send(1, send, 21)) == 42
@@ -0,0 +1,79 @@
+import asyncio
+from types import SimpleNamespace
+
+import helper_func
+from helper_func import DiscussionRegistry
+
+
+class Client:
+    def __init__(self, linked):
+        self.linked = linked  # chat_id -> linked channel id
+        self.calls = []
+
+    async def get_chat(self, chat_id):
+        self.calls.append(chat_id)
+        linked = self.linked.get(chat_id)
+        return SimpleNamespace(id=chat_id, linked_chat=SimpleNamespace(id=linked) if linked else None)
+
+
+def test_unknown_group_linked_to_bound_channel_is_registered(monkeypatch):
+    monkeypatch.setattr(helper_func, 'get_bound_channel_ids', lambda: frozenset({-100}))
+    registry = DiscussionRegistry(refresh_interval=60)
+    client = Client({-200: -100})
+    monkeypatch.setattr(helper_func, 'discussion_registry', registry)
+    message = SimpleNamespace(chat=SimpleNamespace(id=-200))
+
+    async def scenario():
+        # 过滤器不等待反查：第一条消息放过，反查在后台完成后后续消息命中
+        assert await helper_func._in_discussion_group(None, client, message) is False
+        assert client.calls == []
+        await asyncio.sleep(0)
+        assert client.calls == [-200]
+        return await helper_func._in_discussion_group(None, client, message)
+
+    assert asyncio.run(scenario()) is True
+    assert registry.group_ids == {-200}
+    assert registry.groups == {-100: -200}
+
+
+def test_unrelated_group_is_checked_once_per_interval(monkeypatch):
+    monkeypatch.setattr(helper_func, 'get_bound_channel_ids', lambda: frozenset({-100}))
+    registry = DiscussionRegistry(refresh_interval=60)
+    client = Client({-300: -999})
+
+    async def scenario():
+        assert registry.check_unknown(client, -300) is True
+        await asyncio.sleep(0)
+        for _ in range(2):
+            assert registry.check_unknown(client, -300) is False
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert client.calls == [-300]
+    assert not registry.group_ids
+
+
+def test_refresh_picks_up_changed_linked_group(monkeypatch):
+    monkeypatch.setattr(helper_func, 'get_bound_channel_ids', lambda: frozenset({-100}))
+    registry = DiscussionRegistry()
+    client = Client({-100: -200})
+    asyncio.run(registry.refresh(client))
+    assert registry.group_ids == {-200}
+
+    client.linked[-100] = -201
+    asyncio.run(registry.refresh(client))
+    assert registry.group_ids == {-201}
+
+
+def test_start_resolves_groups_before_first_interval(monkeypatch):
+    monkeypatch.setattr(helper_func, 'get_bound_channel_ids', lambda: frozenset({-100}))
+    registry = DiscussionRegistry(refresh_interval=3600)
+    client = Client({-100: -200})
+
+    async def scenario():
+        await registry.start(client)
+        assert registry.group_ids == {-200}
+        await registry.stop()
+
+    asyncio.run(scenario())
+    assert client.calls == [-100]
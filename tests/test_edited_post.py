@@ -0,0 +1,56 @@
+import asyncio
+from types import SimpleNamespace
+
+import database.database as db
+from plugins import channel_post
+from plugins import share as share_plugin
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for doc in self.docs:
+            yield doc
+
+
+class FakeShares:
+    def __init__(self, shares):
+        self.shares = shares
+        self.updates = []
+
+    def find(self, query, projection=None):
+        message_id = query['message_ids']
+        return FakeCursor([{'_id': code} for code, ids in self.shares.items() if message_id in ids])
+
+    async def update_many(self, query, update, array_filters=None):
+        self.updates.append((query, update, array_filters))
+
+
+def test_edit_replaces_plan_item_in_every_referencing_share(monkeypatch):
+    shares = FakeShares({'s1': [5, 6], 's2': [6], 's3': [7]})
+    monkeypatch.setattr(db, 'shares_collection', shares)
+    share_plugin._prefetched[('s1', 2)] = (float('inf'), {'_id': 's1'}, [])
+
+    message = SimpleNamespace(
+        id=6, chat=SimpleNamespace(id=-100), media=None, caption=None, reply_markup=None,
+        text=SimpleNamespace(html='<b>new caption</b>')
+    )
+    asyncio.run(channel_post.edited_post(None, message))
+
+    (query, update, array_filters), = shares.updates
+    assert query == {'_id': {'$in': ['s1', 's2']}}
+    assert update['$set']['delivery_plan.$[item]']['caption'] == '<b>new caption</b>'
+    assert array_filters == [{'item.id': 6}]
+    assert share_plugin.get_prefetched_share('s1', 2) is None
+
+
+def test_edit_of_unshared_message_writes_nothing(monkeypatch):
+    shares = FakeShares({'s3': [7]})
+    monkeypatch.setattr(db, 'shares_collection', shares)
+    assert asyncio.run(db.update_plan_item({'id': 1, 'kind': 'text'})) == []
+    assert shares.updates == []
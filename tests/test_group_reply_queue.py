@@ -0,0 +1,93 @@
+import asyncio
+from types import SimpleNamespace
+
+import config as cfg
+from helper_func import GroupReplyQueue
+from plugins import channel_post
+
+
+def test_slow_group_does_not_block_other_groups():
+    queue = GroupReplyQueue(group_rate=100, group_burst=10, total_rate=100)
+    sent = []
+    release = None
+
+    async def slow():
+        await release.wait()
+        sent.append('slow')
+
+    async def fast():
+        sent.append('fast')
+
+    async def scenario():
+        nonlocal release
+        release = asyncio.Event()
+        queue.start()
+        queue.submit(1, slow)
+        queue.submit(2, fast)
+        for _ in range(20):
+            await asyncio.sleep(0)
+        assert sent == ['fast']
+        release.set()
+        for _ in range(20):
+            await asyncio.sleep(0)
+        await queue.stop()
+
+    asyncio.run(scenario())
+    assert sent == ['fast', 'slow']
+
+
+def test_same_group_sends_one_at_a_time():
+    queue = GroupReplyQueue(group_rate=100, group_burst=10, total_rate=100)
+    active = []
+    peak = 0
+
+    async def send():
+        nonlocal peak
+        active.append(1)
+        peak = max(peak, len(active))
+        await asyncio.sleep(0)
+        active.pop()
+
+    async def scenario():
+        queue.start()
+        for _ in range(3):
+            queue.submit(1, send)
+        for _ in range(50):
+            await asyncio.sleep(0)
+        await queue.stop()
+
+    asyncio.run(scenario())
+    assert peak == 1
+
+
+def test_keyword_cooldown_starts_only_after_reply_is_sent(monkeypatch):
+    submitted = []
+
+    def submit(chat_id, func, *args, on_sent=None, low_priority=False, **kwargs):
+        submitted.append((on_sent, low_priority))
+        return True
+
+    monkeypatch.setattr(channel_post.group_reply_queue, 'submit', submit)
+    monkeypatch.setattr(channel_post.keyword_index, 'lookup', lambda keyword, limit=6: ['abc'])
+    monkeypatch.setattr(type(channel_post.keyword_index), '__contains__', lambda self, keyword: True)
+    channel_post._reply_cache.clear()
+
+    message = SimpleNamespace(text='movie', chat=SimpleNamespace(id=-1), reply_text=None)
+    client = SimpleNamespace(username='bot')
+    now = [1000.0]
+    monkeypatch.setattr(channel_post._time, 'monotonic', lambda: now[0])
+
+    asyncio.run(channel_post.discussion_keyword_reply(client, message))
+    entry = channel_post._reply_cache[(-1, 'movie')]
+    assert entry['expires'] == 1000 + channel_post._REPLY_PENDING_TTL
+
+    # 回复没有发出：占位到期后可以再次触发
+    now[0] += channel_post._REPLY_PENDING_TTL + 1
+    asyncio.run(channel_post.discussion_keyword_reply(client, message))
+    assert len(submitted) == 2
+
+    on_sent = submitted[-1][0]
+    on_sent(SimpleNamespace(link='https://t.me/c/1/2'))
+    entry = channel_post._reply_cache[(-1, 'movie')]
+    assert entry['expires'] == now[0] + cfg.KEYWORD_REPLY_COOLDOWN
+    assert entry['link'] == 'https://t.me/c/1/2'
@@ -0,0 +1,83 @@
+import helper_func
+import database.database as db
+from helper_func import InlineQueryCache
+from plugins.inline import _resolve_offset
+
+
+def make_cache(monkeypatch, shares):
+    index = db.ShareSearchIndex()
+    for share in shares:
+        index.set(share)
+    index.loaded = True
+    monkeypatch.setattr(helper_func, 'search_index', index)
+    return InlineQueryCache(max_size=100), index
+
+
+SHARES = [
+    {'_id': 'a1', 'title': 'python tutorial', 'created_at': 1},
+    {'_id': 'a2', 'title': 'python cookbook', 'created_at': 2},
+    {'_id': 'a3', 'title': 'rust book', 'created_at': 3},
+]
+
+
+def test_resolve_offset_follows_code_when_order_shifts():
+    assert _resolve_offset(['a', 'b', 'c'], '') == 0
+    assert _resolve_offset(['a', 'b', 'c'], '2.b') == 2
+    # 翻页之间有新结果插到前面：按分享码定位，不重复也不跳过
+    assert _resolve_offset(['x', 'a', 'b', 'c'], '2.b') == 3
+    # 分享码已不在结果中：按位置继续
+    assert _resolve_offset(['a', 'c'], '1.z') == 1
+    assert _resolve_offset(['a'], 'bad.z') == 0
+
+
+def test_longer_query_narrows_cached_prefix(monkeypatch):
+    cache, index = make_cache(monkeypatch, SHARES)
+    cache.lookup('py', 20)
+    entry = cache.lookup('python c', 20)
+    assert cache.narrowed == 1
+    assert entry['ranked'] == index.search('python c', 20) == ['a2']
+
+
+def test_unrelated_change_keeps_cached_entry(monkeypatch):
+    cache, index = make_cache(monkeypatch, SHARES)
+    first = cache.lookup('python', 20)
+    index.set({'_id': 'a4', 'title': 'golang notes', 'created_at': 4})
+
+    assert cache.lookup('python', 20) is first
+    assert cache.hits == 1
+
+    index.set({'_id': 'a5', 'title': 'python tricks', 'created_at': 5})
+    entry = cache.lookup('python', 20)
+    assert entry is not first
+    assert 'a5' in entry['ranked']
+
+
+def test_removed_share_invalidates_matching_entries(monkeypatch):
+    cache, index = make_cache(monkeypatch, SHARES)
+    cache.lookup('rust', 20)
+    index.remove('a3')
+    assert cache.lookup('rust', 20)['total'] == 0
+
+
+def test_stats_expose_counters(monkeypatch):
+    cache, _ = make_cache(monkeypatch, SHARES)
+    cache.lookup('py', 20)
+    cache.lookup('py', 20)
+    cache.lookup('pyt', 20)
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['narrowed']) == (1, 2, 1)
+
+
+def test_typing_share_code_char_by_char_finds_it(monkeypatch):
+    cache, index = make_cache(monkeypatch, SHARES + [{'_id': 'Ab12Cd34', 'title': 'my movie', 'created_at': 4}])
+    query = 'ab12cd34'
+    for end in range(1, len(query) + 1):
+        entry = cache.lookup(query[:end], 20)
+    assert entry['ranked'] == index.search(query, 20) == ['Ab12Cd34']
+
+
+def test_long_term_entry_invalidated_by_new_word(monkeypatch):
+    cache, index = make_cache(monkeypatch, SHARES)
+    assert cache.lookup('collecti', 20)['total'] == 0
+    index.set({'_id': 'a4', 'title': 'python collection', 'created_at': 4})
+    assert cache.lookup('collecti', 20)['ranked'] == ['a4']
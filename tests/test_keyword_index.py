@@ -0,0 +1,69 @@
+import asyncio
+
+import database.database as db
+
+
+class Shares:
+    def __init__(self, doc):
+        self.doc = doc
+
+    async def update_one(self, query, update):
+        self.doc.update(update['$set'])
+
+    async def find_one(self, query, projection=None):
+        return dict(self.doc)
+
+
+def test_update_share_keeps_real_created_at(monkeypatch):
+    index = db.KeywordIndex()
+    index.set('old', ['movie'], created_at=500)
+    monkeypatch.setattr(db, 'keyword_index', index)
+    monkeypatch.setattr(db, 'search_index', db.ShareSearchIndex())
+    monkeypatch.setattr(db, 'shares_collection', Shares({'_id': 'abc', 'created_at': 100}))
+
+    asyncio.run(db.update_share('abc', {'keywords': ['movie']}))
+    assert index.shares['abc'][0] == 100
+    assert index.lookup('movie') == ['old', 'abc']
+
+
+class Recorder:
+    def __init__(self):
+        self.added = []
+        self.reloaded = []
+
+    def keyword_added(self, keyword):
+        self.added.append(keyword)
+
+    def keyword_removed(self, keyword):
+        pass
+
+    def keywords_reloaded(self, keywords):
+        self.reloaded.append(sorted(keywords))
+
+
+class BrokenShares:
+    def find(self, *args, **kwargs):
+        return self
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        raise ConnectionError("mongo down")
+
+
+def test_observers_stay_in_sync_when_load_fails(monkeypatch):
+    monkeypatch.setattr(db, 'shares_collection', BrokenShares())
+    index = db.KeywordIndex()
+    observer = Recorder()
+    index.observers.append(observer)
+
+    try:
+        asyncio.run(index.load())
+    except ConnectionError:
+        pass
+    assert not index.loaded
+    assert observer.reloaded == [[]]
+
+    index.set('abc', ['movie', 'music'])
+    assert observer.added == ['movie', 'music']
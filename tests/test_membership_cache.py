@@ -0,0 +1,76 @@
+import asyncio
+from types import SimpleNamespace
+
+from pyrogram.enums import ChatMemberStatus
+
+import config as cfg
+import helper_func
+from helper_func import MembershipCache
+from plugins import force_sub
+
+CHANNEL = -1001
+
+
+class FakeClient:
+    def __init__(self, status=ChatMemberStatus.MEMBER):
+        self.status = status
+        self.lookups = 0
+
+    async def get_chat_member(self, chat_id, user_id):
+        self.lookups += 1
+        return SimpleNamespace(status=self.status)
+
+
+def setup(monkeypatch):
+    cache = MembershipCache(ttl=60)
+    monkeypatch.setattr(helper_func, 'membership_cache', cache)
+    monkeypatch.setattr(force_sub, 'membership_cache', cache)
+    monkeypatch.setattr(cfg, 'FORCE_SUB_CHANNELS', [CHANNEL], raising=False)
+
+    async def save_status(user_id, verified, channels):
+        pass
+
+    monkeypatch.setattr(helper_func, '_save_force_sub_status', save_status)
+    return cache
+
+
+def check(client, user_id=5):
+    update = SimpleNamespace(from_user=SimpleNamespace(id=user_id))
+    return asyncio.run(helper_func.is_subscribed(None, client, update))
+
+
+def test_member_is_cached_until_ttl_expires(monkeypatch):
+    cache = setup(monkeypatch)
+    client = FakeClient()
+
+    assert check(client) and check(client)
+    assert client.lookups == 1
+
+    # TTL 过期后重新查询
+    cache.entries[(5, CHANNEL)] -= 61
+    assert check(client)
+    assert client.lookups == 2
+
+
+def test_non_member_is_not_cached(monkeypatch):
+    cache = setup(monkeypatch)
+    client = FakeClient(status=ChatMemberStatus.LEFT)
+
+    assert not check(client) and not check(client)
+    assert client.lookups == 2
+    assert not cache.entries
+
+
+def test_chat_member_update_invalidates_cache(monkeypatch):
+    cache = setup(monkeypatch)
+    client = FakeClient()
+    assert check(client)
+
+    left = SimpleNamespace(status=ChatMemberStatus.LEFT, user=SimpleNamespace(id=5))
+    update = SimpleNamespace(chat=SimpleNamespace(id=CHANNEL), new_chat_member=left, old_chat_member=None)
+    asyncio.run(force_sub.force_sub_member_updated(None, update))
+    assert not cache.is_member(5, CHANNEL)
+
+    client.status = ChatMemberStatus.LEFT
+    assert not check(client)
+    assert client.lookups == 2
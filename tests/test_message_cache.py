@@ -0,0 +1,86 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import helper_func
+from helper_func import MessageCache
+
+
+class FakeMessage:
+    def __init__(self, mid):
+        self.id = mid
+        self.empty = False
+        self.text = None
+        self.media = None
+        self.caption = None
+        self.reply_markup = None
+
+
+def make_client():
+    return SimpleNamespace(db_channel=SimpleNamespace(id=-100))
+
+
+def patch_fetch(monkeypatch, existing, calls, fail=False, delay=0):
+    async def fake_get_messages(client, ids, raise_errors=False):
+        calls.append(list(ids))
+        await asyncio.sleep(delay)
+        if fail:
+            raise RuntimeError("telegram down")
+        return [FakeMessage(mid) for mid in ids if mid in existing]
+
+    monkeypatch.setattr(helper_func, "get_messages", fake_get_messages)
+    monkeypatch.setattr(helper_func, "message_to_meta", lambda m: {'id': m.id})
+
+
+def test_hits_and_short_negative_ttl(monkeypatch):
+    calls = []
+    patch_fetch(monkeypatch, {1, 2}, calls)
+    cache = MessageCache(max_size=100, ttl=3600, negative_ttl=5)
+    client = make_client()
+
+    result = asyncio.run(cache.get_many(client, [1, 2, 3]))
+    assert [m['id'] for m in result] == [1, 2]
+    assert asyncio.run(cache.get_many(client, [1, 2, 3])) == result
+    assert len(calls) == 1
+
+    positive_expiry = cache.entries[(-100, 1)][0]
+    negative_expiry = cache.entries[(-100, 3)][0]
+    assert positive_expiry - negative_expiry == pytest.approx(3595, abs=1)
+
+
+def test_fetch_error_reaches_coalesced_waiters(monkeypatch):
+    calls = []
+    patch_fetch(monkeypatch, {1}, calls, fail=True, delay=0.01)
+    cache = MessageCache(max_size=100)
+    client = make_client()
+
+    async def scenario():
+        return await asyncio.gather(
+            cache.get_many(client, [1]), cache.get_many(client, [1]), return_exceptions=True
+        )
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert len(calls) == 1
+    assert not cache.entries and not cache.inflight
+
+
+def test_single_request_insert_is_capped(monkeypatch):
+    calls = []
+    patch_fetch(monkeypatch, set(range(100)), calls)
+    cache = MessageCache(max_size=50, max_insert=5)
+    client = make_client()
+    asyncio.run(cache.get_many(client, [1]))
+    result = asyncio.run(cache.get_many(client, list(range(2, 100))))
+    assert len(result) == 98
+    assert len(cache.entries) == 6
+    assert (-100, 1) in cache.entries
+
+
+def test_cache_false_does_not_store(monkeypatch):
+    calls = []
+    patch_fetch(monkeypatch, {1}, calls)
+    cache = MessageCache(max_size=50)
+    asyncio.run(cache.get_many(make_client(), [1], cache=False))
+    assert not cache.entries
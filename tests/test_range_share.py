@@ -0,0 +1,29 @@
+from plugins import share as share_plugin
+
+
+def test_range_key_is_signed_and_survives_eviction():
+    share = share_plugin.get_range_share(100, 120)
+    key = share['_id']
+    assert share_plugin.is_range_key(key)
+    share_plugin._range_shares.clear()
+    rebuilt = share_plugin.get_range_share_by_key(key)
+    assert rebuilt is not None
+    assert list(rebuilt['message_ids']) == list(range(100, 121))
+
+
+def test_forged_or_unsigned_range_keys_are_rejected():
+    share_plugin._range_shares.clear()
+    key = share_plugin.get_range_share(1, 5)['_id']
+    share_plugin._range_shares.clear()
+    forged = key.replace('r1-5', 'r1-99999')
+    assert share_plugin.get_range_share_by_key(forged) is None
+    assert share_plugin.get_range_share_by_key('r1-99999') is None
+    assert share_plugin.get_range_share_by_key('r1-5.000000000000') is None
+
+
+def test_page_callback_data_fits_telegram_limit():
+    key = share_plugin.get_range_share(9999999999, 9999999000)['_id']
+    markup = share_plugin.build_share_page_buttons(key, 2, 100)
+    for button in markup.inline_keyboard[0]:
+        assert len(button.callback_data.encode()) <= 64
+        assert button.callback_data.split('_', 3)[2] == key
@@ -0,0 +1,77 @@
+import database.database as db
+
+
+def make_index(shares):
+    index = db.ShareSearchIndex()
+    for share in shares:
+        index.set(share)
+    return index
+
+
+def codes(index, scores):
+    return {index.codes[doc_id] for doc_id in scores}
+
+
+def test_share_code_matches_only_as_whole_term():
+    index = make_index([
+        {'_id': 'theX9k2Q', 'title': 'unrelated', 'created_at': 1},
+        {'_id': 'Ab12Cd34', 'title': 'the matrix', 'created_at': 2},
+    ])
+    assert index.search('the') == ['Ab12Cd34']
+    assert index.search('thex9k2q') == ['theX9k2Q']
+    assert index.search('thex9') == []
+
+
+def test_short_prefix_copies_only_top_candidates(monkeypatch):
+    monkeypatch.setattr(db, 'SEARCH_SHORT_CANDIDATES', 3)
+    shares = [{'_id': f'c{i}', 'title': f'apple {i}', 'access_count': i, 'created_at': i} for i in range(10)]
+    index = make_index(shares)
+
+    assert [index.codes[value >> 3] for value in index.short['a']] == ['c9', 'c8', 'c7']
+    scores = index.match('a')
+    assert isinstance(scores, db.PartialScores)
+    assert codes(index, scores) == {'c9', 'c8', 'c7'}
+
+    full = index.match('apple')
+    assert not isinstance(full, db.PartialScores)
+    assert len(full) == 10
+
+    # 截断后删掉候选，结果仍标记为不完整
+    index.remove('c9')
+    assert isinstance(index.match('a'), db.PartialScores)
+
+
+def test_short_term_filters_beyond_truncated_list(monkeypatch):
+    monkeypatch.setattr(db, 'SEARCH_SHORT_CANDIDATES', 2)
+    shares = [{'_id': f'c{i}', 'title': f'apple {"x" if i < 5 else "y"}', 'created_at': i} for i in range(10)]
+    index = make_index(shares)
+
+    # 'x' 的短倒排表只保留了 c3、c4，但与长词项组合时按分享自己的词项过滤
+    assert codes(index, index.match('apple x')) == {'c0', 'c1', 'c2', 'c3', 'c4'}
+
+
+def test_long_term_expands_to_full_words():
+    index = make_index([
+        {'_id': 'a1', 'title': 'interstellar', 'created_at': 1},
+        {'_id': 'a2', 'title': 'internet', 'created_at': 2},
+        {'_id': 'a3', 'title': 'interview', 'created_at': 3},
+    ])
+    assert 'interste' not in index.postings
+    assert index.search('interste') == ['a1']
+    assert set(index.search('interne')) == {'a2'}
+    assert set(index.search('inter')) == {'a1', 'a2', 'a3'}
+
+
+def test_removed_id_is_reused():
+    index = make_index([
+        {'_id': 'a1', 'title': 'python tutorial', 'created_at': 1},
+        {'_id': 'a2', 'title': 'python cookbook', 'created_at': 2},
+    ])
+    doc_id = index.ids['a1']
+    index.remove('a1')
+    assert index.search('tutorial') == []
+    index.set({'_id': 'b1', 'title': 'rust book', 'created_at': 3})
+    assert index.ids['b1'] == doc_id
+    assert index.search('python') == ['a2']
+    assert index.search('rust') == ['b1']
+    assert index.updated_at('a1') is None
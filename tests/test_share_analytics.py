@@ -0,0 +1,41 @@
+import asyncio
+
+import database.database as db
+
+
+def setup(monkeypatch, bulk_collection, shares_fail=False, stats_fail=False):
+    shares, stats = bulk_collection(shares_fail), bulk_collection(stats_fail)
+    monkeypatch.setattr(db, 'shares_collection', shares)
+    monkeypatch.setattr(db, 'share_stats', stats)
+    return shares, stats
+
+
+def test_failed_stats_write_is_requeued_without_recounting_access(monkeypatch, bulk_collection):
+    shares, stats = setup(monkeypatch, bulk_collection, stats_fail=True)
+    analytics = db.ShareAnalytics()
+    analytics.record('abc', 1)
+    analytics.record('abc', 2)
+
+    asyncio.run(analytics.flush())
+    assert len(shares.ops) == 1
+    assert not analytics.access
+    assert analytics.pending_views('abc') == 2
+
+    analytics.record('abc', 3)
+    stats.fail = False
+    asyncio.run(analytics.flush())
+    assert shares.ops[-1]._doc == {'$inc': {'access_count': 1}}
+    totals = [op for op in stats.ops if op._filter == {'_id': 'abc'}]
+    assert totals[0]._doc['$inc'] == {'views': 3}
+    assert not analytics.pending
+
+
+def test_requeue_is_capped(monkeypatch, bulk_collection):
+    setup(monkeypatch, bulk_collection, shares_fail=True, stats_fail=True)
+    analytics = db.ShareAnalytics(max_pending=2)
+    for code in ('a', 'b', 'c'):
+        analytics.record(code, 1)
+
+    asyncio.run(analytics.flush())
+    assert len(analytics.pending) == 2
+    assert len(analytics.access) == 2
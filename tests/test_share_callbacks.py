@@ -0,0 +1,45 @@
+import asyncio
+from types import SimpleNamespace
+
+from plugins import share_callbacks
+
+
+class FakeScheduler:
+    def __init__(self):
+        self.scheduled = []
+
+    async def schedule(self, chat_id, message_ids, delay):
+        self.scheduled.append((chat_id, message_ids, delay))
+
+
+def make_query(data):
+    async def noop(*args, **kwargs):
+        pass
+
+    return SimpleNamespace(
+        data=data,
+        from_user=SimpleNamespace(id=42),
+        message=SimpleNamespace(edit_text=noop),
+        answer=noop
+    )
+
+
+def test_later_pages_are_scheduled_for_auto_delete(monkeypatch):
+    async def get_share(code):
+        return {'_id': code, 'message_ids': list(range(25))}
+
+    async def send_share_page(client, chat_id, share, page, per_page):
+        return [SimpleNamespace(id=100 + i) for i in range(3)], page, 3
+
+    scheduler = FakeScheduler()
+    monkeypatch.setattr(share_callbacks, 'AUTO_DELETE_TIME', 600)
+    monkeypatch.setattr(share_callbacks, 'auto_delete_scheduler', scheduler)
+    monkeypatch.setattr(share_callbacks, 'get_share', get_share)
+    monkeypatch.setattr(share_callbacks, 'send_share_page', send_share_page)
+
+    asyncio.run(share_callbacks.share_callback_handler(None, make_query('share_page_abc_2')))
+    assert scheduler.scheduled == [(42, [100, 101, 102], 600)]
+
+    monkeypatch.setattr(share_callbacks, 'AUTO_DELETE_TIME', 0)
+    asyncio.run(share_callbacks.share_callback_handler(None, make_query('share_page_abc_3')))
+    assert len(scheduler.scheduled) == 1
@@ -0,0 +1,75 @@
+import asyncio
+
+import database.database as db
+from plugins import share as share_plugin
+
+
+class FakeCollection:
+    def __init__(self):
+        self.calls = []
+
+    async def update_one(self, *args, **kwargs):
+        self.calls.append(('update_one', args))
+
+    async def delete_one(self, *args, **kwargs):
+        self.calls.append(('delete_one', args))
+
+    async def delete_many(self, *args, **kwargs):
+        self.calls.append(('delete_many', args))
+
+    async def find_one(self, query, projection=None):
+        return {'_id': query['_id'], 'title': 'new title'}
+
+
+def prefetch(code, page=2):
+    share_plugin._prefetched[(code, page)] = (float('inf'), {'_id': code}, [])
+
+
+def test_update_and_delete_drop_prefetched_pages(monkeypatch):
+    monkeypatch.setattr(db, 'shares_collection', FakeCollection())
+    monkeypatch.setattr(db, 'share_stats', FakeCollection())
+
+    prefetch('abc')
+    asyncio.run(db.update_share('abc', {'protect_content': True}))
+    assert share_plugin.get_prefetched_share('abc', 2) is None
+
+    prefetch('abc')
+    asyncio.run(db.delete_share('abc'))
+    assert share_plugin.get_prefetched_share('abc', 2) is None
+
+
+def test_plan_only_update_keeps_prefetch(monkeypatch):
+    monkeypatch.setattr(db, 'shares_collection', FakeCollection())
+    prefetch('plan')
+    asyncio.run(db.update_share('plan', {'delivery_plan': []}))
+    assert share_plugin.get_prefetched_share('plan', 2) == {'_id': 'plan'}
+    share_plugin.drop_prefetched('plan')
+
+
+def test_change_during_prefetch_discards_result(monkeypatch):
+    async def slow_resolve(client, share, ids):
+        share_plugin._on_share_changed(share['_id'], {'title': 'x'})
+        return [{'id': 1}]
+
+    monkeypatch.setattr(share_plugin, 'resolve_share_metas', slow_resolve)
+    share = {'_id': 'race', 'message_ids': list(range(20))}
+    asyncio.run(share_plugin._prefetch_share_page(None, share, 2, 10))
+    assert share_plugin.get_prefetched_share('race', 2) is None
+    assert not share_plugin._prefetching
+
+
+def test_spawn_keeps_reference_until_done():
+    async def scenario():
+        event = asyncio.Event()
+
+        async def job():
+            await event.wait()
+
+        task = db.spawn(job())
+        assert task in db._spawned
+        event.set()
+        await task
+        await asyncio.sleep(0)
+        return task not in db._spawned
+
+    assert asyncio.run(scenario())
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from plugins import share as share_plugin
+
+
+def meta(mid, album='media'):
+    return {'id': mid, 'album': album}
+
+
+def patch_resolve(monkeypatch, metas, fail_from=None, log=None):
+    by_id = {m['id']: m for m in metas}
+
+    async def resolve(client, share, ids):
+        if log is not None:
+            log.append(('fetch', ids[0]))
+        if fail_from is not None and ids[0] >= fail_from:
+            raise RuntimeError("fetch failed")
+        await asyncio.sleep(0)
+        return [by_id[i] for i in ids if i in by_id]
+
+    monkeypatch.setattr(share_plugin, 'resolve_share_metas', resolve)
+
+
+async def collect(ids, metas=None, log=None):
+    groups = []
+    async for group in share_plugin.iter_page_groups(None, {'_id': 's'}, ids, metas):
+        if log is not None:
+            log.append(('send', group[0]['id']))
+        groups.append([m['id'] for m in group])
+    return groups
+
+
+def test_album_spanning_chunks_is_sent_once(monkeypatch):
+    metas = [meta(i) for i in range(7)] + [meta(7, None), meta(8, 'document'), meta(9, 'document')]
+    patch_resolve(monkeypatch, metas)
+    groups = asyncio.run(collect(list(range(10))))
+    assert groups == [[0, 1, 2, 3, 4, 5, 6], [7], [8, 9]]
+
+
+def test_groups_match_non_streaming_grouping(monkeypatch):
+    metas = [meta(i, ('media', 'document', None)[i % 3]) for i in range(10)]
+    patch_resolve(monkeypatch, metas)
+    expected = [[m['id'] for m in g] for g in share_plugin.group_albums(metas)]
+    assert asyncio.run(collect(list(range(10)))) == expected
+
+
+def test_first_chunk_is_sent_before_later_chunks_finish(monkeypatch):
+    metas = [meta(i, None) for i in range(10)]
+    log = []
+    patch_resolve(monkeypatch, metas, log=log)
+    asyncio.run(collect(list(range(10)), log=log))
+    assert log.index(('send', 0)) < log.index(('fetch', 5)) + 2
+    assert log.index(('send', 0)) < len(log) - 5
+
+
+def test_first_chunk_failure_raises(monkeypatch):
+    patch_resolve(monkeypatch, [], fail_from=0)
+    with pytest.raises(RuntimeError):
+        asyncio.run(collect(list(range(10))))
+
+
+def test_later_chunk_failure_keeps_sent_groups(monkeypatch):
+    patch_resolve(monkeypatch, [meta(i, None) for i in range(10)], fail_from=5)
+    assert asyncio.run(collect(list(range(10)))) == [[0], [1], [2], [3], [4]]
+
+
+def test_prefetched_metas_skip_fetch(monkeypatch):
+    patch_resolve(monkeypatch, [], fail_from=0)
+    assert asyncio.run(collect([1, 2], metas=[meta(1), meta(2)])) == [[1, 2]]
@@ -0,0 +1,35 @@
+import asyncio
+
+import database.database as db
+
+
+def test_bucket_failure_does_not_requeue_totals(monkeypatch, bulk_collection):
+    totals, buckets = bulk_collection(), bulk_collection(fail=True)
+    monkeypatch.setattr(db, 'bot_stats', totals)
+    monkeypatch.setattr(db, 'stats_buckets', buckets)
+    aggregator = db.StatsAggregator()
+    aggregator.add('shares', 2)
+
+    asyncio.run(aggregator.flush())
+    assert len(totals.ops) == 1
+    assert not aggregator.pending
+    assert len(aggregator.buckets) == len(db.STAT_PERIODS)
+
+    buckets.fail = False
+    asyncio.run(aggregator.flush())
+    assert len(totals.ops) == 1
+    assert len(buckets.ops) == len(db.STAT_PERIODS)
+    assert all(op._doc['$inc'] == {'counts.shares': 2} for op in buckets.ops)
+
+
+def test_totals_failure_keeps_bucket_writes(monkeypatch, bulk_collection):
+    totals, buckets = bulk_collection(fail=True), bulk_collection()
+    monkeypatch.setattr(db, 'bot_stats', totals)
+    monkeypatch.setattr(db, 'stats_buckets', buckets)
+    aggregator = db.StatsAggregator()
+    aggregator.add('shares')
+
+    asyncio.run(aggregator.flush())
+    assert aggregator.pending == {'shares': 1}
+    assert not aggregator.buckets
+    assert len(buckets.ops) == len(db.STAT_PERIODS)
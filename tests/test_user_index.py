@@ -0,0 +1,64 @@
+import asyncio
+from types import SimpleNamespace
+
+import database.database as db
+
+
+def make_index(monkeypatch, stored, versions):
+    async def iter_user_ids(after_id=None, batch_size=1000, active_only=False):
+        for user_id in sorted(stored):
+            yield user_id
+
+    async def get_version(key):
+        return versions[key]
+
+    async def bump_version(key):
+        versions[key] += 1
+        return versions[key]
+
+    class Users:
+        async def bulk_write(self, ops, ordered=True):
+            stored.update(op._filter['_id'] for op in ops)
+            return SimpleNamespace(upserted_count=len(ops))
+
+    monkeypatch.setattr(db, 'iter_user_ids', iter_user_ids)
+    monkeypatch.setattr(db, 'get_version', get_version)
+    monkeypatch.setattr(db, 'bump_version', bump_version)
+    monkeypatch.setattr(db, 'user_data', Users())
+    monkeypatch.setattr(db.user_state, 'set', lambda *args: None)
+    return db.UserIndex(sync_interval=0)
+
+
+def test_own_registrations_do_not_trigger_reload(monkeypatch):
+    stored, versions = {1, 2}, {'users': 3}
+    index = make_index(monkeypatch, stored, versions)
+
+    async def scenario():
+        await index.load()
+        index.register(5)
+        await index.flush()
+        loads = []
+        index.load = lambda: loads.append(1)
+        await index.sync()
+        return loads
+
+    assert asyncio.run(scenario()) == []
+    assert index.version == 4
+    assert 5 in index
+
+
+def test_other_instance_changes_are_reloaded(monkeypatch):
+    stored, versions = {1, 2}, {'users': 0}
+    index = make_index(monkeypatch, stored, versions)
+
+    async def scenario():
+        await index.load()
+        stored.add(9)
+        stored.discard(1)
+        versions['users'] += 1
+        await index.tick()
+
+    asyncio.run(scenario())
+    assert 9 in index
+    assert 1 not in index
+    assert index.version == 1
@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+
+import database.database as db
+
+
+class FlakyUsers:
+    def __init__(self):
+        self.calls = 0
+
+    async def find_one(self, query, projection=None):
+        self.calls += 1
+        await asyncio.sleep(0)
+        if self.calls == 1:
+            raise ConnectionError("mongo down")
+        return {'_id': query['_id'], 'verify_status': {}}
+
+
+def test_coalesced_waiters_see_lookup_error(monkeypatch):
+    users = FlakyUsers()
+    monkeypatch.setattr(db, 'user_data', users)
+    cache = db.UserStateCache()
+
+    async def scenario():
+        results = await asyncio.gather(cache.get(1), cache.get(1), return_exceptions=True)
+        assert all(isinstance(r, ConnectionError) for r in results)
+        assert 1 not in cache.entries
+        return await cache.get(1)
+
+    doc = asyncio.run(scenario())
+    assert doc['_id'] == 1
+    assert users.calls == 2
+
+
+def test_lookup_error_without_waiters_propagates(monkeypatch):
+    monkeypatch.setattr(db, 'user_data', FlakyUsers())
+    cache = db.UserStateCache()
+    with pytest.raises(ConnectionError):
+        asyncio.run(cache.get(2))
+    assert not cache.inflight
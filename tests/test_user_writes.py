@@ -0,0 +1,77 @@
+import asyncio
+
+import database.database as db
+
+
+class NoopIndex:
+    async def flush(self):
+        pass
+
+
+class FakeUsers:
+    def __init__(self, fail=0):
+        self.fail = fail
+        self.writes = []
+        self.release = asyncio.Event()
+        self.during = None
+
+    async def bulk_write(self, ops, ordered=True):
+        await self.release.wait()
+        if self.during:
+            self.during()
+        if self.fail:
+            self.fail -= 1
+            raise ConnectionError("mongo down")
+        self.writes.append(ops)
+
+
+def test_backlog_spawns_single_flush(monkeypatch):
+    monkeypatch.setattr(db, 'user_index', NoopIndex())
+
+    async def scenario():
+        users = FakeUsers()
+        monkeypatch.setattr(db, 'user_data', users)
+        buffer = db.UserWriteBuffer(interval=60, batch_size=2)
+        for user_id in range(20):
+            buffer.set(user_id, {'n': user_id})
+            await asyncio.sleep(0)
+        assert buffer.flushing
+        users.release.set()
+        for _ in range(5):
+            await asyncio.sleep(0)
+        return buffer, users
+
+    buffer, users = asyncio.run(scenario())
+    assert len(users.writes) == 1
+    assert not buffer.flushing
+
+
+def test_failed_flush_requeues_and_keeps_lag(monkeypatch):
+    monkeypatch.setattr(db, 'user_index', NoopIndex())
+
+    async def scenario():
+        users = FakeUsers(fail=1)
+        users.release.set()
+        monkeypatch.setattr(db, 'user_data', users)
+        buffer = db.UserWriteBuffer(interval=60, batch_size=100)
+        buffer.set(1, {'a': 1, 'b': 1})
+        buffer.oldest -= 5
+        oldest = buffer.oldest
+
+        # 重新入队时，落库期间的新修改优先
+        users.during = lambda: buffer.set(1, {'b': 2})
+        await buffer.flush()
+        assert buffer.pending == {1: {'a': 1, 'b': 2}}
+        assert buffer.oldest == oldest
+        assert buffer.stats()['lag_seconds'] >= 5 and buffer.stats()['flushed'] == 0
+
+        users.during = None
+        await buffer.flush()
+        return buffer, users
+
+    buffer, users = asyncio.run(scenario())
+    (op,), = users.writes
+    assert op._doc == {'$set': {'a': 1, 'b': 2}}
+    stats = buffer.stats()
+    assert (stats['pending'], stats['lag_seconds'], stats['flushed']) == (0, 0, 1)
+    assert stats['last_flush_lag_seconds'] >= 5
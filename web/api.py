@@ -12,13 +12,16 @@ from pyrogram.errors import FloodWait
 
 from web.auth import auth_manager
 from database.database import (
-    get_user_count, full_userbase, get_all_stats, get_total_shares,
+    get_user_count, get_user_ids_page, get_all_stats, get_total_shares,
     get_banned_count, get_banned_users, ban_user, unban_user,
     get_user_shares, get_share, update_share, delete_share,
-    get_recent_users, ping_db, del_user, search_shares,
-    get_all_config, set_config, delete_config
+    get_recent_users, ping_db, del_user, search_shares_page, get_stat_series, get_share_analytics,
+    get_all_config, set_config, delete_config, get_broadcast_jobs, user_state, user_writes,
+    user_index
+)
+from helper_func import (
+    get_messages, message_cache, broadcast_manager, BROADCAST_ACTIVE, discussion_registry, query_cache
 )
-from helper_func import get_messages
 import config as cfg
 
 logger = logging.getLogger(__name__)
@@ -151,6 +154,8 @@ async def api_dashboard(request):
         all_stats = await get_all_stats()
         recent_7d = await get_recent_users(7)
         recent_1d = await get_recent_users(1)
+        hourly = await get_stat_series('hour', 24)
+        daily = await get_stat_series('day', 7)
         db_ok = await ping_db()
 
         uptime = 0
@@ -177,6 +182,10 @@ async def api_dashboard(request):
                 'tokens_verified': all_stats.get('tokens_verified', 0),
                 'broadcasts': all_stats.get('broadcasts', 0)
             },
+            'trends': {
+                'hourly': hourly,
+                'daily': daily
+            },
             'system': {
                 'uptime': uptime,
                 'database': 'connected' if db_ok else 'disconnected',
@@ -194,13 +203,10 @@ async def api_users(request):
     try:
         page = int(request.query.get('page', 1))
         per_page = int(request.query.get('per_page', 20))
-        users = await full_userbase()
-        total = len(users)
-        start = (page - 1) * per_page
-        end = start + per_page
-        paginated = users[start:end]
+        total = await get_user_count()
+        users = await get_user_ids_page(page, per_page)
         return web.json_response({
-            'users': paginated,
+            'users': users,
             'total': total,
             'page': page,
             'per_page': per_page,
@@ -258,8 +264,7 @@ async def api_shares(request):
         search = request.query.get('search', '')
 
         if search:
-            shares_list = await search_shares(search, limit=50)
-            total = len(shares_list)
+            shares_list, total = await search_shares_page(search, page, per_page)
         else:
             from database.database import shares_collection
             total = await get_total_shares()
@@ -307,6 +312,7 @@ async def api_share_detail(request):
 
         bot_username = _get_bot_username()
         link = f"https://t.me/{bot_username}?start={code}" if bot_username else code
+        analytics = await get_share_analytics(code, days=14)
 
         return web.json_response({
             'code': share['_id'],
@@ -315,6 +321,8 @@ async def api_share_detail(request):
             'message_ids': share.get('message_ids', []),
             'files_count': len(share.get('message_ids', [])),
             'access_count': share.get('access_count', 0),
+            'unique_viewers': analytics['unique_viewers'],
+            'daily_views': analytics['daily'],
             'protect_content': share.get('protect_content', False),
             'link': link,
             'group_text': share.get('group_text', ''),
@@ -479,30 +487,84 @@ async def api_broadcast(request):
         if not BOT_INSTANCE:
             return web.json_response({'error': 'Bot not initialized'}, status=500)
 
-        users = await full_userbase()
-        successful = 0
-        failed = 0
+        job = await broadcast_manager.create(BOT_INSTANCE, text=message_text, started_by=0)
+        return web.json_response({'success': True, **broadcast_manager.snapshot(job)})
+    except Exception as e:
+        return web.json_response({'error': str(e)}, status=500)
 
-        for user_id in users:
-            try:
-                await BOT_INSTANCE.send_message(chat_id=user_id, text=message_text)
-                successful += 1
-            except Exception:
-                failed += 1
 
-        from database.database import increment_stat
-        await increment_stat('broadcasts')
+@require_auth
+async def api_broadcast_jobs(request):
+    try:
+        jobs = await get_broadcast_jobs(limit=20)
+        jobs = [broadcast_manager.jobs.get(job['_id'], job) for job in jobs]
+        return web.json_response({'jobs': [broadcast_manager.snapshot(job) for job in jobs]})
+    except Exception as e:
+        return web.json_response({'error': str(e)}, status=500)
 
-        return web.json_response({
-            'success': True,
-            'total': len(users),
-            'successful': successful,
-            'failed': failed
-        })
+
+@require_auth
+async def api_broadcast_job(request):
+    try:
+        job = await broadcast_manager.get(request.match_info['job_id'])
+        if not job:
+            return web.json_response({'error': 'Job not found'}, status=404)
+        return web.json_response(broadcast_manager.snapshot(job))
+    except Exception as e:
+        return web.json_response({'error': str(e)}, status=500)
+
+
+@require_auth
+async def api_broadcast_control(request):
+    try:
+        action = request.match_info['action']
+        status = {'pause': 'paused', 'resume': 'running', 'cancel': 'cancelled'}.get(action)
+        if not status:
+            return web.json_response({'error': 'Unknown action'}, status=400)
+        if status == 'running' and not BOT_INSTANCE:
+            return web.json_response({'error': 'Bot not initialized'}, status=500)
+        job = await broadcast_manager.set_status(request.match_info['job_id'], status)
+        if not job:
+            return web.json_response({'error': 'Job not found or already finished'}, status=404)
+        return web.json_response({'success': True, **broadcast_manager.snapshot(job)})
     except Exception as e:
         return web.json_response({'error': str(e)}, status=500)
 
 
+@require_auth
+async def api_broadcast_events(request):
+    """SSE 推送任务进度，任务结束后关闭连接"""
+    job_id = request.match_info['job_id']
+    job = await broadcast_manager.get(job_id)
+    if not job:
+        return web.json_response({'error': 'Job not found'}, status=404)
+
+    response = web.StreamResponse(headers={
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    await response.prepare(request)
+    queue = broadcast_manager.subscribe(job_id)
+    try:
+        data = broadcast_manager.snapshot(job)
+        while True:
+            await response.write(f"data: {json.dumps(data)}\n\n".encode())
+            if data['status'] not in BROADCAST_ACTIVE:
+                break
+            while True:
+                try:
+                    data = await asyncio.wait_for(queue.get(), timeout=15)
+                    break
+                except asyncio.TimeoutError:
+                    await response.write(b": ping\n\n")
+    except (ConnectionResetError, asyncio.CancelledError):
+        pass
+    finally:
+        broadcast_manager.unsubscribe(job_id, queue)
+    return response
+
+
 # ============ 设置 ============
 @require_auth
 async def api_settings(request):
@@ -703,6 +765,13 @@ async def _apply_runtime_config():
         except Exception:
             cfg.BOUND_CHANNELS = []
 
+    # 绑定频道变化时重新解析讨论组
+    if BOT_INSTANCE and discussion_registry.needs_refresh():
+        try:
+            await discussion_registry.refresh(BOT_INSTANCE)
+        except Exception as e:
+            logger.warning(f"Failed to refresh discussion groups: {e}")
+
     try:
         if 'force_sub_channels' in db_config and BOT_INSTANCE:
             inv = {}
@@ -739,6 +808,11 @@ async def api_system_health(request):
         'memory_mb': round(memory.rss / 1024 / 1024, 2),
         'cpu_percent': process.cpu_percent(),
         'threads': process.num_threads(),
+        'message_cache': message_cache.stats(),
+        'user_cache': user_state.stats(),
+        'user_writes': user_writes.stats(),
+        'user_index': user_index.stats(),
+        'inline_cache': query_cache.stats(),
         'timestamp': time.time()
     })
 
@@ -802,6 +876,10 @@ def setup_api_routes(app):
     app.router.add_delete('/api/shares/{code}', api_share_delete)
     app.router.add_post('/api/shares/{code}/forward', api_share_forward)
     app.router.add_post('/api/broadcast', api_broadcast)
+    app.router.add_get('/api/broadcast/jobs', api_broadcast_jobs)
+    app.router.add_get('/api/broadcast/{job_id}', api_broadcast_job)
+    app.router.add_get('/api/broadcast/{job_id}/events', api_broadcast_events)
+    app.router.add_post('/api/broadcast/{job_id}/{action}', api_broadcast_control)
     app.router.add_get('/api/settings', api_settings)
     app.router.add_put('/api/settings', api_settings_update)
     app.router.add_post('/api/settings/reset', api_settings_reset)
@@ -162,6 +162,7 @@ async function loadDashboard(c) {
             ${statCard('fa-tower-broadcast', 'blue', formatNum(d.activity.broadcasts), '群发次数')}
             ${statCard('fa-clock', 'purple', formatUptime(d.system.uptime), '运行时长')}
         </div>
+        ${trendCard(d.trends)}
         <div class="card">
             <div class="card-header">
                 <div class="card-title"><i class="fas fa-circle-info"></i> 系统信息</div>
@@ -176,6 +177,26 @@ async function loadDashboard(c) {
         </div>`;
 }
 
+function trendCard(trends) {
+    if (!trends) return '';
+    const metrics = [['share_accessed', '分享被访问'], ['files_shared', '发送文件'], ['links_generated', '生成链接'], ['tokens_verified', '验证通过']];
+    const sum = (series, key) => series.reduce((n, b) => n + (b.counts[key] || 0), 0);
+    const bars = (series, key) => {
+        const max = Math.max(1, ...series.map(b => b.counts[key] || 0));
+        return `<div style="display:flex;align-items:flex-end;gap:2px;height:28px">${series.map(b => {
+            const v = b.counts[key] || 0;
+            return `<div title="${new Date(b.start * 1000).toLocaleString()}：${v}" style="flex:1;min-width:3px;background:var(--accent);opacity:${v ? 0.85 : 0.2};height:${Math.max(2, Math.round(v * 28 / max))}px"></div>`;
+        }).join('')}</div>`;
+    };
+    const rows = metrics.map(([key, label]) => {
+        const last = trends.hourly[trends.hourly.length - 1];
+        return `<tr><td>${label}</td><td>${formatNum(last ? last.counts[key] || 0 : 0)}</td><td>${formatNum(sum(trends.hourly, key))}</td>
+            <td>${formatNum(sum(trends.daily, key))}</td><td style="width:35%">${bars(trends.hourly, key)}</td></tr>`;
+    }).join('');
+    return `<div class="card"><div class="card-header"><div class="card-title"><i class="fas fa-chart-line"></i> 近期趋势</div></div>
+        <table class="data-table"><thead><tr><th>指标</th><th>本小时</th><th>24小时</th><th>7天</th><th>每小时（24h）</th></tr></thead><tbody>${rows}</tbody></table></div>`;
+}
+
 function statCard(icon, color, value, label, badge) {
     return `<div class="stat-card">
         <div class="stat-header"><div class="stat-icon ${color}"><i class="fas ${icon}"></i></div>${badge ? `<span class="stat-badge up">${badge}</span>` : ''}</div>
@@ -387,6 +408,10 @@ async function viewShareInfo(code) {
     const date = d.created_at ? new Date(d.created_at * 1000).toLocaleString() : 'N/A';
     const link = d.link ? `<a href="${esc(d.link)}" target="_blank" style="word-break:break-all">${esc(d.link)}</a>` : 'N/A';
     const kw = (d.keywords && d.keywords.length) ? d.keywords.join(', ') : 'None';
+    const daily = d.daily_views || [];
+    const maxDaily = Math.max(1, ...daily.map(x => x.views));
+    const trend = daily.length ? `<div style="display:flex;align-items:flex-end;gap:3px;height:40px">${daily.map(x =>
+        `<div title="${x.day}：${x.views} 次 / ${x.unique} 人" style="flex:1;background:var(--accent);opacity:${x.views ? 0.85 : 0.2};height:${Math.max(2, Math.round(x.views * 40 / maxDaily))}px"></div>`).join('')}</div>` : 'N/A';
 
     openModal('Share Details', `
         <div class="setting-item"><div class="setting-info"><div class="setting-name">Code</div></div>
@@ -403,6 +428,10 @@ async function viewShareInfo(code) {
             <div class="setting-value">${d.files_count}</div></div>
         <div class="setting-item"><div class="setting-info"><div class="setting-name">Views</div></div>
             <div class="setting-value">${formatNum(d.access_count)}</div></div>
+        <div class="setting-item"><div class="setting-info"><div class="setting-name">Unique Viewers</div></div>
+            <div class="setting-value">~${formatNum(d.unique_viewers || 0)}</div></div>
+        <div class="setting-item"><div class="setting-info"><div class="setting-name">Last ${daily.length} Days</div></div>
+            <div class="setting-value" style="flex:1;max-width:60%">${trend}</div></div>
         <div class="setting-item"><div class="setting-info"><div class="setting-name">Protected</div></div>
             <div class="setting-value">${d.protect_content ? 'Yes' : 'No'}</div></div>
         <div class="setting-item"><div class="setting-info"><div class="setting-name">Owner</div></div>
@@ -428,13 +457,17 @@ async function confirmDeleteShare(code) {
 }
 
 /* ---- BROADCAST ---- */
-function loadBroadcast(c) {
+let broadcastStream = null;
+async function loadBroadcast(c) {
     c.innerHTML = `<div class="card"><div class="card-header"><div class="card-title"><i class="fas fa-tower-broadcast"></i> Send Broadcast</div></div>
         <div class="broadcast-form">
             <div class="form-group"><label class="form-label">Message (HTML supported)</label><textarea class="form-textarea" id="broadcast-msg" rows="6" placeholder="Enter broadcast message..."></textarea></div>
             <button class="btn btn-accent" onclick="sendBroadcast()" id="broadcast-btn"><i class="fas fa-paper-plane"></i> Send Broadcast</button>
             <div id="broadcast-result" style="margin-top:20px"></div>
         </div></div>`;
+    const d = await api('/api/broadcast/jobs');
+    const active = d && d.jobs ? d.jobs.find(j => j.status === 'running' || j.status === 'paused') : null;
+    if (active) watchBroadcastJob(active);
 }
 async function sendBroadcast() {
     const msg = document.getElementById('broadcast-msg').value.trim();
@@ -444,15 +477,73 @@ async function sendBroadcast() {
     const r = await api('/api/broadcast', { method: 'POST', body: JSON.stringify({ message: msg }) });
     btn.disabled = false; btn.innerHTML = '<i class="fas fa-paper-plane"></i> Send Broadcast';
     if (r && r.success) {
-        document.getElementById('broadcast-result').innerHTML = `<div class="card" style="margin:0"><div style="padding:20px">
-            <h3 style="color:var(--success);margin-bottom:12px"><i class="fas fa-check-circle"></i> 群发完成</h3>
-            <div class="setting-item"><div class="setting-info"><div class="setting-name">总计</div></div><div class="setting-value">${r.total}</div></div>
-            <div class="setting-item"><div class="setting-info"><div class="setting-name">成功</div></div><div class="setting-value" style="color:var(--success)">${r.successful}</div></div>
-            <div class="setting-item"><div class="setting-info"><div class="setting-name">失败</div></div><div class="setting-value" style="color:var(--danger)">${r.failed}</div></div>
-        </div></div>`;
-        toast(`已发送给 ${r.successful} 位用户`, 'success');
+        watchBroadcastJob(r);
+        toast(`群发任务已创建：${r.job_id}`, 'success');
     } else toast('群发失败', 'error');
 }
+function formatEta(sec) {
+    if (sec === null || sec === undefined) return '--';
+    const h = Math.floor(sec / 3600), m = Math.floor(sec % 3600 / 60), s = sec % 60;
+    return h ? `${h}时${m}分` : m ? `${m}分${s}秒` : `${s}秒`;
+}
+function renderBroadcastJob(j) {
+    const el = document.getElementById('broadcast-result');
+    if (!el) return false;
+    const statusText = { running: '进行中', paused: '已暂停', cancelled: '已取消', done: '已完成', failed: '失败' }[j.status] || j.status;
+    const row = (name, value, color) => `<div class="setting-item"><div class="setting-info"><div class="setting-name">${name}</div></div><div class="setting-value"${color ? ` style="color:var(--${color})"` : ''}>${value ?? 0}</div></div>`;
+    const pct = j.total ? Math.min(100, Math.round(j.processed * 100 / j.total)) : 0;
+    let controls = '';
+    if (j.status === 'running') controls += `<button class="btn btn-ghost btn-sm" onclick="controlBroadcastJob('${j.job_id}', 'pause')"><i class="fas fa-pause"></i> 暂停</button> `;
+    if (j.status === 'paused') controls += `<button class="btn btn-success btn-sm" onclick="controlBroadcastJob('${j.job_id}', 'resume')"><i class="fas fa-play"></i> 继续</button> `;
+    if (j.status === 'running' || j.status === 'paused') controls += `<button class="btn btn-danger btn-sm" onclick="controlBroadcastJob('${j.job_id}', 'cancel')"><i class="fas fa-xmark"></i> 取消</button>`;
+    el.innerHTML = `<div class="card" style="margin:0"><div style="padding:20px">
+        <h3 style="margin-bottom:12px"><i class="fas fa-tower-broadcast"></i> 群发任务 <span class="code-text">${j.job_id}</span> · ${statusText}</h3>
+        ${row('进度', `${formatNum(j.processed)} / ${formatNum(j.total)}（${pct}%）`)}
+        ${row('速率', j.status === 'running' ? `${j.rate} 条/秒` : '--')}
+        ${row('预计剩余', j.status === 'running' ? formatEta(j.eta) : '--')}
+        ${row('成功', j.successful, 'success')}
+        ${row('已屏蔽 / 已注销', `${j.blocked ?? 0} / ${j.deleted ?? 0}`)}
+        ${row('失败', j.failed, 'danger')}
+        ${controls ? `<div style="margin-top:12px">${controls}</div>` : ''}
+    </div></div>`;
+    return true;
+}
+async function watchBroadcastJob(job) {
+    if (broadcastStream) broadcastStream.abort();
+    renderBroadcastJob(job);
+    const ctrl = new AbortController();
+    broadcastStream = ctrl;
+    try {
+        const res = await fetch(`/api/broadcast/${job.job_id}/events`, {
+            headers: { 'Authorization': 'Bearer ' + authToken }, signal: ctrl.signal
+        });
+        if (!res.ok || !res.body) return;
+        const reader = res.body.getReader();
+        const decoder = new TextDecoder();
+        let buf = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buf += decoder.decode(value, { stream: true });
+            let idx;
+            while ((idx = buf.indexOf('\n\n')) >= 0) {
+                const chunk = buf.slice(0, idx); buf = buf.slice(idx + 2);
+                const line = chunk.split('\n').find(l => l.startsWith('data: '));
+                if (line && !renderBroadcastJob(JSON.parse(line.slice(6)))) { ctrl.abort(); return; }
+            }
+        }
+    } catch (e) {
+        if (e.name !== 'AbortError') console.error('SSE:', e);
+    } finally {
+        if (broadcastStream === ctrl) broadcastStream = null;
+    }
+}
+async function controlBroadcastJob(id, action) {
+    const r = await api(`/api/broadcast/${id}/${action}`, { method: 'POST' });
+    if (!r || !r.success) { toast('操作失败', 'error'); return; }
+    if (r.status === 'running' && !broadcastStream) watchBroadcastJob(r);
+    else renderBroadcastJob(r);
+}
 
 /* ---- BANNED ---- */
 async function loadBanned(c) {